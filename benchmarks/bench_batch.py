@@ -0,0 +1,93 @@
+"""
+Benchmark for the musicu.fcg micro-batching dispatcher.
+
+    uv run python benchmarks/bench_batch.py [--calls 30] [--delay-ms 40]
+
+A local stand-in for musicu.fcg answers every ``req_N`` after a fixed server
+delay. ``--calls`` concurrent sub-requests (a mix of vkey, track info and singer
+album lookups, as parallel MCP tool calls would produce) are sent once with
+batching disabled (``max_batch=1``) and once through the default window.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import http_transport  # noqa: E402
+import qqmusic_batch  # noqa: E402
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 128  # Every unbatched call may connect at once.
+
+
+SUB_REQUESTS = [
+    ("vkey.GetVkeyServer", "CgiGetVkey", {"songmid": ["003OUlho2HcRHC"], "filename": ["M500x.mp3"]}),
+    ("music.trackInfo.UniformRuleCtrl", "CgiGetTrackInfo", {"ids": [97773], "types": [0]}),
+    ("music.homepage.HomepageSrv", "GetHomepageTabDetail", {"singerMid": "0025NhlN2yWrP4", "tabId": "album"}),
+]
+
+
+def _handler(delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            reply = {"code": 0}
+            for key, value in body.items():
+                if key.startswith("req_"):
+                    reply[key] = {"code": 0, "data": {"method": value["method"]}}
+            payload = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def run(url: str, calls: int, max_batch: int) -> tuple:
+    http_transport._TRANSPORT = None
+    batcher = qqmusic_batch.MusicuBatcher(url=url, max_batch=max_batch)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        batcher.call(*SUB_REQUESTS[i % len(SUB_REQUESTS)]) for i in range(calls)
+    ))
+    elapsed = time.perf_counter() - started
+    assert all(r["data"]["method"] == SUB_REQUESTS[i % len(SUB_REQUESTS)][1] for i, r in enumerate(results))
+    await http_transport.get_transport().aclose()
+    return elapsed, batcher.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=30)
+    parser.add_argument("--delay-ms", type=float, default=40.0)
+    args = parser.parse_args()
+
+    server = _Server(("127.0.0.1", 0), _handler(args.delay_ms / 1e3))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/cgi-bin/musicu.fcg"
+
+    for label, max_batch in (("one request per call", 1), ("micro-batched", 20)):
+        elapsed, stats = asyncio.run(run(url, args.calls, max_batch))
+        print(f"{label:22s}: {elapsed * 1e3:8.1f} ms total, {stats['batches']:3d} round trips, "
+              f"avg batch {stats['avg_batch_size']:.1f}, batch p50 {stats['p50_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
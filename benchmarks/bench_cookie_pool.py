@@ -0,0 +1,128 @@
+"""
+Throughput of a per-account-throttled upstream with 1, 2 and 4 pooled accounts.
+
+    uv run python benchmarks/bench_cookie_pool.py [--capacity 20] [--workers 32] [--seconds 6]
+
+A local stand-in for musicu.fcg accepts ``--capacity`` requests per sliding
+second *per uin* (read from the Cookie header) and answers everything above that
+with code 500001, the way QQ Music limits each logged-in account. ``--workers``
+loops lease an account from a :class:`CookiePool` for every call and send it
+through :class:`MusicuBatcher` (``max_batch=1``) with that account's cookies.
+Each account gets its own limiter bucket just under ``--capacity``, so
+successful calls per second should grow about linearly with the pool size.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import cookie_pool  # noqa: E402
+import http_transport  # noqa: E402
+import qqmusic_batch  # noqa: E402
+import rate_limit  # noqa: E402
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 128  # Every worker may connect at once.
+
+
+def _handler(capacity: int):
+    lock = threading.Lock()
+    recent = collections.defaultdict(collections.deque)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            uin = cookie_pool.parse_cookie(self.headers.get("Cookie", "")).get("uin", "")
+            now = time.monotonic()
+            with lock:
+                window = recent[uin]
+                while window and now - window[0] > 1.0:
+                    window.popleft()
+                allowed = len(window) < capacity
+                window.append(now)
+            time.sleep(0.01)
+            if allowed:
+                reply = {"code": 0, **{key: {"code": 0, "data": {}} for key in body if key.startswith("req_")}}
+            else:
+                reply = {"code": qqmusic_batch.THROTTLED}
+            payload = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def run(url: str, accounts: int, workers: int, seconds: float, capacity: int) -> dict:
+    http_transport._TRANSPORT = None
+    rate = capacity * 0.9
+    rate_limit._LIMITER = rate_limit.RateLimiter(rate=rate, max_rate=rate, burst=1, domains=("127.0.0.1",))
+    pool = cookie_pool.CookiePool([f"uin={10000 + index}; qm_keyst=key{index}" for index in range(accounts)], cooldown=1.0)
+    batcher = qqmusic_batch.MusicuBatcher(url=url, max_batch=1)
+    outcome = collections.Counter()
+    deadline = time.monotonic() + seconds
+
+    async def worker() -> None:
+        while time.monotonic() < deadline:
+            with pool.lease() as account:
+                try:
+                    await batcher.call("vkey.GetVkeyServer", "CgiGetVkey", {"songmid": ["x"]}, cookies=account.cookies)
+                    outcome["ok"] += 1
+                except qqmusic_batch.MusicuError:
+                    outcome["throttled"] += 1
+                    pool.observe(account.cookies, qqmusic_batch.THROTTLED)
+                except httpx.TimeoutException:
+                    outcome["timed out"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    await http_transport.get_transport().aclose()
+    return {"outcome": outcome, "pool": pool.stats()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capacity", type=int, default=20, help="requests per second the server accepts per account")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=6.0)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server = _Server(("127.0.0.1", 0), _handler(args.capacity))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/cgi-bin/musicu.fcg"
+    print(f"server capacity {args.capacity} req/s per account, {args.workers} workers, {args.seconds:.0f} s")
+
+    baseline = None
+    for accounts in (1, 2, 4):
+        result = asyncio.run(run(url, accounts, args.workers, args.seconds, args.capacity))
+        counts = result["outcome"]
+        ok_rate = counts["ok"] / args.seconds
+        baseline = baseline or ok_rate
+        leases = [account["leases"] for account in result["pool"]["accounts"]]
+        print(f"{accounts} account(s): {ok_rate:6.1f} ok/s ({ok_rate / baseline:4.2f}x)  "
+              f"{counts['throttled']:4d} throttled  {counts['timed out']:3d} timed out  leases {leases}")
+
+
+if __name__ == "__main__":
+    main()
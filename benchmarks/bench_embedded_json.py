@@ -0,0 +1,225 @@
+"""
+Streaming extraction of HTML-embedded JSON vs download + regex + replace.
+
+    uv run python benchmarks/bench_embedded_json.py [--mbps 40] [--rounds 20] [--regenerate]
+
+Saved pages in ``fixtures/pages`` mirror the QQ Music pages the client scrapes:
+the ``y.qq.com/n/ryqq`` playlist/category/radio pages (``window.__INITIAL_DATA__``
+with ``undefined`` values near the end of the body), the ``i.y.qq.com`` album and
+toplist share pages (``firstPageData`` in the head, followed by large inline
+bundles) and ``playsong.html`` (``__ssrFirstPageData__``). Descriptions contain
+the word "undefined" in the playlist page, which the old ``.replace`` turned into
+invalid JSON. ``--regenerate`` rewrites the fixtures from a fixed seed.
+
+Each page is served from a local server at ``--mbps``; both paths are timed end
+to end, then parsed once more from memory to compare pure CPU cost.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import embedded_json  # noqa: E402
+import http_transport  # noqa: E402
+
+PAGES = Path(__file__).resolve().parent / "fixtures" / "pages"
+CHUNK = 16 * 1024
+
+# Page name -> (marker, regex the client used before, whether it also replaced ``undefined``).
+OLD_PATTERNS = {
+    "playlist": (embedded_json.INITIAL_DATA, "window.__INITIAL_DATA__ =(.*?)</script>", True),
+    "category": (embedded_json.INITIAL_DATA, "window.__INITIAL_DATA__ =(.*?)</script>", True),
+    "radio": (embedded_json.INITIAL_DATA, "window.__INITIAL_DATA__ =(.*?)</script>", True),
+    "album": (embedded_json.FIRST_PAGE_DATA, "firstPageData\\s=(.*?)\n", False),
+    "toplist": (embedded_json.FIRST_PAGE_DATA, "firstPageData\\s=(.*?)\n", False),
+    "playsong": (embedded_json.SSR_FIRST_PAGE_DATA, "__ssrFirstPageData__\\s=(.*?)</script>", False),
+}
+
+
+def _song(rng: random.Random, number: int) -> dict:
+    return {
+        "songid": 100000 + number, "songmid": f"{number:014d}", "songname": f"歌曲{number}",
+        "singer": [{"id": rng.randint(1, 10**6), "mid": f"00{number:012d}", "name": f"歌手{rng.randint(1, 900)}"}],
+        "albumname": f"专辑{number // 8}", "albummid": f"A{number:013d}", "interval": rng.randint(120, 360),
+        "pay": {"payplay": 1, "paydownload": 1}, "size128": rng.randint(10**6, 8 * 10**6),
+        "size320": rng.randint(10**6, 2 * 10**7), "vid": "", "strMediaMid": f"{number:014d}",
+    }
+
+
+def _js(value) -> str:
+    """JSON text with ``undefined`` where the page's serializer emitted it for missing fields."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).replace('"__undefined__"', "undefined")
+
+
+def _bundle(rng: random.Random, size: int) -> str:
+    words = ["function", "return", "var", "this", "null", "undefined", "window", "document", "if", "else"]
+    out = []
+    while sum(map(len, out)) < size:
+        out.append(f"{rng.choice(words)}(a{rng.randint(0, 999)}){{{rng.choice(words)} b={rng.randint(0, 10**6)};}}")
+    return "".join(out)
+
+
+def generate() -> None:
+    rng = random.Random(11)
+    PAGES.mkdir(parents=True, exist_ok=True)
+    head = "<!DOCTYPE html><html><head><meta charset=utf-8><title>QQ音乐</title><style>{}</style></head><body>"
+    description = "歌单简介：未来 undefined 的旋律，\"undefined\" 也是一首歌。"
+    plain = "分类简介：华语流行。"
+
+    def ryqq(state: dict) -> str:
+        return (head.format("." * 3000) + '<div id="app">' + "<div class=item></div>" * 800 + "</div>"
+                + "<script>window.__INITIAL_DATA__ =" + _js(state) + "</script>"
+                + "".join(f'<script src="//y.qq.com/ryqq/js/chunk{i}.js"></script>' for i in range(12))
+                + "</body></html>")
+
+    def share(marker: str, state: dict, tail: int, end: str = "\n") -> str:
+        return (head.format("." * 2000) + f"<script>{marker} = " + _js(state) + end + "</script>"
+                + "<script>" + _bundle(rng, tail) + "</script></body></html>")
+
+    songs = [_song(rng, number) for number in range(300)]
+    pages = {
+        "playlist": ryqq({"detail": {"title": "歌单", "desc": description, "picurl": "http://y.gtimg.cn/p.jpg",
+                                     "ad": "__undefined__"},
+                          "songList": songs, "userInfo": "__undefined__"}),
+        "category": ryqq({"tags": [{"id": i, "name": f"标签{i}", "items": [{"id": j, "name": f"分类{j}", "desc": plain}
+                                                                           for j in range(20)]} for i in range(30)],
+                          "playlist": [{"dissid": 7000000000 + i, "dissname": f"歌单{i}", "listennum": rng.randint(1, 10**7),
+                                        "creator": {"name": f"用户{i}", "qq": "__undefined__"}} for i in range(400)]}),
+        "radio": ryqq({"radioList": [{"id": i, "title": f"电台{i}", "desc": plain, "pic": "__undefined__"}
+                                     for i in range(200)]}),
+        "album": share("firstPageData", {"albumData": {"name": "专辑", "desc": description, "list": songs[:40]}}, 150000),
+        "toplist": share("firstPageData", {"toplistData": {"title": "巅峰榜", "song": songs[:100]}}, 150000),
+        "playsong": share("window.__ssrFirstPageData__", {"songList": [{**songs[0], "url": "http://isure.stream.qqmusic.qq.com/C400.m4a"}],
+                                                           "metaData": {"title": "歌曲", "desc": description}}, 120000, end=""),
+    }
+    for name, html in pages.items():
+        (PAGES / f"{name}.html").write_text(html, encoding="utf-8")
+        print(f"wrote {name}.html ({len(html.encode()) / 1e3:.0f} KB)")
+
+
+def _old(body: bytes, pattern: str, replace: bool):
+    text = body.decode("utf-8")
+    blob = re.findall(pattern, text)[0]
+    try:
+        return json.loads(blob.replace("undefined", '"undefined"') if replace else blob)
+    except json.JSONDecodeError:
+        return _BROKEN
+
+
+_BROKEN = object()
+
+
+def _same(old, new) -> bool:
+    """``new`` equals ``old`` once the old path's ``"undefined"`` strings are read as ``None``."""
+    if isinstance(old, dict):
+        return isinstance(new, dict) and old.keys() == new.keys() and all(_same(old[k], new[k]) for k in old)
+    if isinstance(old, list):
+        return isinstance(new, list) and len(old) == len(new) and all(map(_same, old, new))
+    return new is None if old == "undefined" else old == new
+
+
+def _handler(pages: dict, bytes_per_second: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            payload = pages[self.path.strip("/")]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            view = memoryview(payload)
+            try:
+                for offset in range(0, len(payload), CHUNK):
+                    self.wfile.write(view[offset:offset + CHUNK])
+                    self.wfile.flush()
+                    if bytes_per_second:
+                        time.sleep(CHUNK / bytes_per_second)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The streaming client stopped reading after the literal.
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def _timed(base: str, rounds: int, pages: dict) -> dict:
+    http_transport._TRANSPORT = None
+    transport = http_transport.get_transport()
+    results = {}
+    for name, (marker, pattern, replace) in OLD_PATTERNS.items():
+        old_times, new_times = [], []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            response = await transport.request("GET", f"{base}/{name}")
+            old = _old(response.content, pattern, replace)
+            old_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            new = await embedded_json.fetch_embedded_json(f"{base}/{name}", marker)
+            new_times.append(time.perf_counter() - started)
+        results[name] = (statistics.median(old_times), statistics.median(new_times), old, new)
+    await transport.aclose()
+    return results
+
+
+async def _extract_rounds(body: bytes, marker: str, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await embedded_json.extract(_chunks(body), marker)
+    return (time.perf_counter() - started) / rounds
+
+
+async def _chunks(body: bytes):
+    for offset in range(0, len(body), CHUNK):
+        yield body[offset:offset + CHUNK]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mbps", type=float, default=40.0, help="simulated link speed, 0 for unthrottled")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--regenerate", action="store_true", help="rewrite fixtures/pages from a fixed seed")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.regenerate or not PAGES.exists():
+        generate()
+
+    pages = {name: (PAGES / f"{name}.html").read_bytes() for name in OLD_PATTERNS}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(pages, args.mbps * 1e6 / 8))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    timed = asyncio.run(_timed(base, args.rounds, pages))
+
+    print(f"link {args.mbps or 'unthrottled'} Mbit/s, median of {args.rounds} fetches")
+    print(f"{'page':9s} {'size':>7s} {'read to':>8s} {'regex ms':>9s} {'stream ms':>9s} "
+          f"{'cpu regex':>9s} {'cpu strm':>9s}  old result")
+    for name, (marker, pattern, replace) in OLD_PATTERNS.items():
+        body = pages[name]
+        old_ms, new_ms, old, new = timed[name]
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            _old(body, pattern, replace)
+        cpu_old = (time.perf_counter() - started) / args.rounds
+        cpu_new = asyncio.run(_extract_rounds(body, marker, args.rounds))
+        stop = body.index(b"</script>", body.index(marker.encode())) / len(body)
+        verdict = "invalid JSON" if old is _BROKEN else ("same" if _same(old, new) else "DIFFERENT")
+        print(f"{name:9s} {len(body) / 1e3:6.0f}K {stop:8.0%} {old_ms * 1e3:9.1f} {new_ms * 1e3:9.1f} "
+              f"{cpu_old * 1e3:9.2f} {cpu_new * 1e3:9.2f}  {verdict}")
+
+
+if __name__ == "__main__":
+    main()
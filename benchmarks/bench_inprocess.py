@@ -0,0 +1,152 @@
+"""
+mcp_pipe in-process hosting vs a stdio child process per server.
+
+    uv run python benchmarks/bench_inprocess.py [--calls 2000] [--window 16]
+
+A local WebSocket endpoint stands in for the xiaozhi MCP endpoint and speaks
+JSON-RPC as the MCP client. The same FastMCP server (one ``echo`` tool) is
+hosted both ways through ``mcp_pipe.connect_to_server``, from a temporary
+``mcp_config.json``:
+
+- ``stdio``: ``{"type": "stdio", "command": python, "args": [server.py]}``
+- ``inprocess``: ``{"type": "inprocess", "module": "bench_echo_server:manifest"}``
+
+For each it reports the time from connecting to the ``initialize`` answer (which
+includes starting the child), ``tools/call`` round trips one at a time, and
+calls per second with ``--window`` calls in flight.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import mcp_pipe  # noqa: E402
+
+ECHO_SERVER = """
+import logging
+
+from fastmcp.server.server import FastMCP
+
+logging.getLogger("mcp").setLevel(logging.WARNING)
+
+manifest = FastMCP(name="bench_echo_server")
+
+
+@manifest.tool
+def echo(text: str) -> str:
+    return text
+
+
+if __name__ == "__main__":
+    manifest.run(show_banner=False)
+"""
+
+
+class _Client:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.next_id = 0
+
+    async def send(self, method, params=None, notify=False):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        if not notify:
+            message["id"] = self.next_id
+            self.next_id += 1
+        await self.websocket.send(json.dumps(message))
+        return message.get("id")
+
+    async def reply(self):
+        answer = json.loads(await self.websocket.recv())
+        if "error" in answer or answer.get("result", {}).get("isError"):
+            raise RuntimeError(f"MCP error: {answer}")
+        return answer
+
+
+async def _calls(client, count: int, window: int) -> dict:
+    params = {"name": "echo", "arguments": {"text": "x" * 200}}
+    sent = {}
+    latencies = []
+    issued = 0
+    started = time.perf_counter()
+    while len(latencies) < count:
+        while issued < count and issued - len(latencies) < window:
+            sent[await client.send("tools/call", params)] = time.perf_counter()
+            issued += 1
+        answer = await client.reply()
+        latencies.append(time.perf_counter() - sent.pop(answer["id"]))
+    return {"rate": count / (time.perf_counter() - started), "latencies": sorted(latencies)}
+
+
+async def run(target: str, calls: int, window: int) -> dict:
+    result = {}
+    done = asyncio.Event()
+
+    async def endpoint(websocket):
+        client = _Client(websocket)
+        await client.send("initialize", {
+            "protocolVersion": "2025-06-18",
+            "capabilities": {},
+            "clientInfo": {"name": "bench", "version": "0"},
+        })
+        await client.reply()
+        result["initialize"] = time.perf_counter() - connected
+        await client.send("notifications/initialized", notify=True)
+        result["sequential"] = await _calls(client, min(calls, 500), 1)
+        result["pipelined"] = await _calls(client, calls, window)
+        done.set()
+
+    async with websockets.serve(endpoint, "127.0.0.1", 0) as server:
+        uri = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        connected = time.perf_counter()
+        pipe = asyncio.create_task(mcp_pipe.connect_to_server(uri, target))
+        await done.wait()
+        pipe.cancel()
+        await asyncio.gather(pipe, return_exceptions=True)
+    await mcp_pipe.release_lifespans()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--window", type=int, default=16)
+    args = parser.parse_args()
+    logging.getLogger("MCP_PIPE").setLevel(logging.CRITICAL)
+    logging.getLogger("websockets").setLevel(logging.CRITICAL)
+    logging.getLogger("mcp").setLevel(logging.WARNING)  # One INFO line per request otherwise
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = Path(directory) / "bench_echo_server.py"
+        server.write_text(ECHO_SERVER)
+        config = Path(directory) / "mcp_config.json"
+        config.write_text(json.dumps({"mcpServers": {
+            "stdio": {"type": "stdio", "command": sys.executable, "args": [str(server)]},
+            "inprocess": {"type": "inprocess", "module": "bench_echo_server:manifest"},
+        }}))
+        os.environ["MCP_CONFIG"] = str(config)
+        sys.path.insert(0, directory)
+        for target in ("stdio", "inprocess"):
+            result = asyncio.run(run(target, args.calls, args.window))
+            latencies = result["sequential"]["latencies"]
+            print(f"{target:9s}: initialize {result['initialize'] * 1e3:7.1f} ms  "
+                  f"call p50 {statistics.median(latencies) * 1e3:5.2f} ms "
+                  f"p95 {latencies[int(len(latencies) * 0.95)] * 1e3:5.2f} ms  "
+                  f"{args.window} in flight: {result['pipelined']['rate']:6.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
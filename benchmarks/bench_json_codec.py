@@ -0,0 +1,110 @@
+"""
+The project JSON codec (orjson when installed) vs the standard library.
+
+    uv run python benchmarks/bench_json_codec.py [--rounds 200]
+
+Payloads:
+
+- ``requests``: the recorded ``musicu.fcg`` request bodies of
+  ``fixtures/sign_corpus.json``, in the formats the client writes them (most with
+  ``json.dumps`` defaults, some compact). They are signed byte for byte, so each
+  is decoded and re-encoded with its own options and must come back identical.
+- ``pages``: the data embedded in ``fixtures/pages`` (run
+  ``bench_embedded_json.py`` once to create them), i.e. playlist, album, toplist
+  and playsong payloads of 40-300 songs, as the client decodes them.
+
+Every payload is decoded from bytes (as ``loads(response.content)`` does) and
+encoded again: request bodies with their own options, page data compactly (as
+the metadata store does). Only compact output can use orjson. Times are totals
+per round over all payloads of a group.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import embedded_json  # noqa: E402
+import json_codec  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+FORMATS = [
+    {"ensure_ascii": ensure_ascii, "separators": separators}
+    for ensure_ascii in (True, False)
+    for separators in (None, (",", ":"))
+]
+MARKERS = {
+    "playlist": embedded_json.INITIAL_DATA,
+    "category": embedded_json.INITIAL_DATA,
+    "radio": embedded_json.INITIAL_DATA,
+    "album": embedded_json.FIRST_PAGE_DATA,
+    "toplist": embedded_json.FIRST_PAGE_DATA,
+    "playsong": embedded_json.SSR_FIRST_PAGE_DATA,
+}
+
+
+async def _single(body: bytes):
+    yield body
+
+
+def _payloads() -> dict:
+    corpus = json.loads((FIXTURES / "sign_corpus.json").read_text(encoding="utf-8"))
+    # The corpus also has a few non-JSON edge-case strings; only the request bodies count.
+    groups = {"requests": [entry["payload"].encode("utf-8") for entry in corpus if entry["payload"].startswith("{")]}
+    pages = []
+    for name, marker in MARKERS.items():
+        path = FIXTURES / "pages" / f"{name}.html"
+        if path.exists():
+            value = asyncio.run(embedded_json.extract(_single(path.read_bytes()), marker))
+            pages.append(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    if pages:
+        groups["pages"] = pages
+    return groups
+
+
+def _options(body: bytes) -> dict:
+    """The ``json.dumps`` options ``body`` was written with."""
+    value = json.loads(body)
+    return next(options for options in FORMATS if json.dumps(value, **options).encode("utf-8") == body)
+
+
+def _time(fn, items, rounds: int) -> float:
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"codec backend: {json_codec.backend()}")
+    for group, raw in _payloads().items():
+        items = [(json.loads(body), _options(body)) for body in raw]
+        mismatches = sum(json_codec.dumps(value, **options).encode("utf-8") != body for (value, options), body in zip(items, raw))
+        compact = sum(options["separators"] is not None for _, options in items)
+        size = sum(map(len, raw))
+        decode = (_time(json.loads, raw, args.rounds), _time(json_codec.loads, raw, args.rounds))
+        encode = (
+            _time(lambda item: json.dumps(item[0], **item[1]), items, args.rounds),
+            _time(lambda item: json_codec.dumps(item[0], **item[1]), items, args.rounds),
+        )
+        print(f"{group:8s} {len(raw):3d} payloads ({compact} compact), {size / 1e3:4.0f} KB, "
+              f"{mismatches} re-encoding mismatches")
+        for label, (old, new) in (("decode", decode), ("encode", encode)):
+            print(f"  {label}: json {old * 1e3:7.3f} ms  codec {new * 1e3:7.3f} ms  ({old / new:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
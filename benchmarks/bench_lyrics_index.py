@@ -0,0 +1,117 @@
+"""
+Size, build time and query latency of the local lyrics index.
+
+    uv run python benchmarks/bench_lyrics_index.py [--songs 100000] [--queries 500]
+
+Songs are synthetic LRC documents (about 30 timed lines of CJK text drawn from a
+skewed character distribution, so common bigrams get long posting lists like in
+real lyrics). Queries are 8-12 character fragments of indexed songs (hits) and
+random text (misses, which must fall back to the remote search). A fragment
+usually matches fewer songs than a page holds, so its hits go ahead of the remote
+results rather than replacing them; "answered locally" counts full pages only.
+"""
+
+import argparse
+import itertools
+import random
+import gc
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import lyrics_index  # noqa: E402
+
+ALPHABET = [chr(0x4E00 + i) for i in range(3000)]
+CUM_WEIGHTS = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(ALPHABET))))
+
+
+def _line(rng: random.Random) -> str:
+    return "".join(rng.choices(ALPHABET, cum_weights=CUM_WEIGHTS, k=rng.randint(7, 14)))
+
+
+def _song(rng: random.Random, number: int) -> tuple:
+    lines = [_line(rng) for _ in range(30)]
+    lrc = "[ti:歌曲{0}]\n[ar:歌手{1}]\n".format(number, number % 997) + "\n".join(
+        f"[{i // 6:02d}:{i * 10 % 60:02d}.00]{line}" for i, line in enumerate(lines)
+    )
+    return f"{number:014d}", lrc, lines
+
+
+def _search_meta(songmid: str) -> dict:
+    return {"songid": int(songmid) + 1, "interval": 200, "albummid": f"A{songmid}"}
+
+
+def _new_index(songs: int) -> lyrics_index.LyricsIndex:
+    index = lyrics_index.LyricsIndex(max_songs=songs + 1000)
+    index.enabled = True
+    index._loaded = True
+    return index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the traced memory pass")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    songs = [_song(rng, number) for number in range(args.songs)]
+    if args.memory:
+        # Separate traced build: tracemalloc slows allocation down too much to time it.
+        index = _new_index(args.songs)
+        tracemalloc.start()
+        index.load((songmid, lrc) for songmid, lrc, _ in songs)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del index
+        print(f"memory: {retained / 1e6:.1f} MB retained after compaction, {peak / 1e6:.1f} MB peak while building")
+
+    index = _new_index(args.songs)
+    started = time.perf_counter()
+    index.load((songmid, lrc) for songmid, lrc, _ in songs)
+    build = time.perf_counter() - started
+    for songmid, _, _ in songs:
+        # What a remote search fills in; without it nothing is answered locally.
+        index.add_meta(songmid, _search_meta(songmid))
+    stats = index.stats()
+    print(f"songs {stats['songs']}  grams {stats['segment_grams']}  postings {stats['segment_postings']}")
+    print(f"build {build:.1f} s ({build / args.songs * 1e6:.0f} us/song)  "
+          f"segment arrays {stats['segment_bytes'] / 1e6:.1f} MB")
+
+    started = time.perf_counter()
+    extra = [_song(rng, args.songs + number) for number in range(1000)]
+    for songmid, lrc, _ in extra:
+        index.add(songmid, lrc, _search_meta(songmid))
+    print(f"incremental: 1000 more songs in {(time.perf_counter() - started) * 1e3:.0f} ms "
+          f"(delta {index.stats()['delta_songs']} songs)")
+
+    for label, make_query in (
+        ("hit", lambda: rng.choice(rng.choice(songs)[2])[:rng.randint(8, 12)]),
+        ("miss", lambda: _line(rng)[:10]),
+    ):
+        latencies = []
+        answered = partial = 0
+        for _ in range(args.queries):
+            query = make_query()
+            started = time.perf_counter()
+            hits = len(index.search(query, 5))
+            latencies.append(time.perf_counter() - started)
+            # search_music_by_lyrics skips the remote search only with a full page of hits.
+            answered += hits >= 5
+            partial += 0 < hits < 5
+        latencies.sort()
+        print(f"{label:4s} queries: p50 {statistics.median(latencies) * 1e3:7.2f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1e3:7.2f} ms  answered locally {answered}/{args.queries}  "
+              f"local hits ahead of remote {partial}/{args.queries}")
+
+
+if __name__ == "__main__":
+    main()
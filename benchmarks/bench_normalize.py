@@ -0,0 +1,134 @@
+"""
+Normalising search results: per-song pydantic models + recursive https walk vs one bulk pass.
+
+    uv run python benchmarks/bench_normalize.py [--sizes 1000,10000] [--rounds 10]
+
+Raw songs mix the two shapes ``_song_list`` accepts: search hits (``songname``,
+``singer`` list, flat album fields) and playlist/toplist tracks (``name``,
+``mid``, ``id`` and a nested ``album``). The old path is the code
+``qqmusic_mcp`` used before: a ``SongMetadata`` model and ``.dict()`` per song,
+then ``_replace_http_with_https`` over the whole list. Both are timed on the
+same input, checked for equal output, and measured for peak traced memory.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from pydantic import BaseModel
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import qqmusic_mcp  # noqa: E402
+
+
+class OldSongMetadata(BaseModel):
+    songname: str
+    singer: str
+    albumname: str
+    duration: str
+    songmid: str
+    songid: int
+    albummid: str
+
+
+def _replace_http_with_https(data):
+    if isinstance(data, dict):
+        return {k: _replace_http_with_https(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_replace_http_with_https(item) for item in data]
+    if isinstance(data, str):
+        return data.replace("http://", "https://")
+    return data
+
+
+def _old_song_metadata(song):
+    singers = song.get("singer") or []
+    singer_name = singers if isinstance(singers, str) else ""
+    if singers and isinstance(singers, list):
+        first = singers[0]
+        singer_name = first.get("name", "") if isinstance(first, dict) else ""
+    album = song.get("album") if isinstance(song.get("album"), dict) else {}
+    return OldSongMetadata(
+        songname=(song.get("songname") or song.get("name") or "").replace('"', ""),
+        singer=singer_name.replace('"', ""),
+        albumname=song.get("albumname") or album.get("name", ""),
+        duration=f"{song.get('interval', 0) // 60}:{song.get('interval', 0) % 60:02d}",
+        songmid=song.get("songmid") or song.get("mid", ""),
+        songid=song.get("songid") or song.get("id", 0),
+        albummid=song.get("albummid") or album.get("mid", ""),
+    ).dict()
+
+
+def old(songs):
+    return _replace_http_with_https([_old_song_metadata(song) for song in songs])
+
+
+def new(songs):
+    return qqmusic_mcp._song_list(songs)
+
+
+def _songs(count: int) -> list:
+    rng = random.Random(22)
+    songs = []
+    for number in range(count):
+        singer = [{"id": rng.randint(1, 10**6), "mid": f"00{number:012d}", "name": f"歌手{rng.randint(1, 900)}"}]
+        if number % 2:
+            songs.append({
+                "songid": 100000 + number, "songmid": f"{number:014d}", "songname": f"歌曲{number}", "singer": singer,
+                "albumname": f"专辑{number // 8}", "albummid": f"A{number:013d}", "interval": rng.randint(120, 360),
+                "pay": {"payplay": 1}, "size128": rng.randint(10**6, 8 * 10**6), "vid": "",
+            })
+        else:
+            songs.append({
+                "id": 100000 + number, "mid": f"{number:014d}", "name": f"歌曲{number}", "singer": singer,
+                "album": {"id": number // 8, "mid": f"A{number:013d}", "name": f"专辑{number // 8}"},
+                "interval": rng.randint(120, 360), "file": {"size_128mp3": rng.randint(10**6, 8 * 10**6)},
+            })
+    return songs
+
+
+def _time(fn, songs, rounds: int) -> float:
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(songs)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def _peak(fn, songs) -> int:
+    tracemalloc.start()
+    result = fn(songs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        songs = _songs(size)
+        assert old(songs) == new(songs), "outputs differ"
+        old_time, new_time = _time(old, songs, args.rounds), _time(new, songs, args.rounds)
+        old_peak, new_peak = _peak(old, songs), _peak(new, songs)
+        print(f"{size:6d} songs: old {old_time * 1e3:7.2f} ms  new {new_time * 1e3:7.2f} ms  "
+              f"({old_time / new_time:4.1f}x)  peak old {old_peak / 1e6:5.1f} MB  new {new_peak / 1e6:5.1f} MB")
+
+    # The old path rejected tracks whose numeric ID is null.
+    fixed = new([{"mid": "0039MnYb0qxYhV", "name": "晴天", "id": None, "interval": None}])[0]
+    print(f"null id/interval -> songid {fixed['songid']}, duration {fixed['duration']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+mcp_pipe relay throughput and latency: asyncio subprocess streams vs thread-per-readline.
+
+    uv run python benchmarks/bench_pipe.py [--servers 1,4] [--requests 2000] [--timeout 30]
+
+A local WebSocket endpoint stands in for the xiaozhi MCP endpoint; every pipe
+connects to it and starts a local echo MCP server (a child that answers each
+JSON-RPC line with its params). For each pipe the endpoint measures:
+
+- ``ping-pong``: one small request at a time, round-trip p50/p95
+- ``pipelined``: ``--requests`` 1 KB requests with up to 64 in flight, then the
+  same with 64 KB payloads, in messages and MB per second
+
+The old relay (``subprocess.Popen`` in text mode, ``asyncio.to_thread(readline)``
+per line and blocking ``stdin.write``/``flush``) is reproduced below and run the
+same way as ``mcp_pipe.connect_to_server``. The worst event-loop lag seen during
+each run is reported as well. The old relay writes to the child on the event
+loop thread: once the child blocks on a full stdout pipe (which only the loop
+can drain), the whole loop deadlocks. A watchdog kills the child after
+``--timeout`` seconds and the run is reported as stalled. It also keeps two
+executor threads blocked per child (the default executor has
+``min(32, cpus + 4)``).
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import mcp_pipe  # noqa: E402
+
+ECHO_SERVER = """
+import json, sys
+for line in sys.stdin.buffer:
+    request = json.loads(line)
+    reply = {"jsonrpc": "2.0", "id": request["id"], "result": request.get("params")}
+    sys.stdout.write(json.dumps(reply) + "\\n")
+    sys.stdout.flush()
+"""
+
+
+async def _legacy_connect(uri, script, watchdog):
+    """The relay mcp_pipe used before: Popen in text mode and a thread hop per line.
+
+    Its blocking ``stdin.write`` can deadlock the event loop, so a watchdog thread
+    kills the child after ``watchdog`` seconds to get the loop back.
+    """
+    async with websockets.connect(uri) as websocket:
+        process = subprocess.Popen(
+            [sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, encoding="utf-8", text=True,
+        )
+        timer = threading.Timer(watchdog, process.kill)
+        timer.daemon = True
+        timer.start()
+
+        async def ws_to_process():
+            try:
+                while True:
+                    message = await websocket.recv()
+                    if isinstance(message, bytes):
+                        message = message.decode("utf-8")
+                    process.stdin.write(message + "\n")
+                    process.stdin.flush()
+            finally:
+                if not process.stdin.closed:
+                    process.stdin.close()
+
+        async def process_to_ws():
+            while True:
+                data = await asyncio.to_thread(process.stdout.readline)
+                if not data:
+                    break
+                await websocket.send(data)
+
+        async def stderr_to_terminal():
+            while True:
+                data = await asyncio.to_thread(process.stderr.readline)
+                if not data:
+                    break
+                sys.stderr.write(data)
+
+        try:
+            await asyncio.gather(ws_to_process(), process_to_ws(), stderr_to_terminal())
+        finally:
+            timer.cancel()
+            process.kill()
+            process.wait()
+
+
+PHASES = ("ping-pong", "pipelined 1 KB", "pipelined 64 KB")
+
+
+async def _exchange(websocket, count: int, size: int, window: int) -> dict:
+    params = {"text": "x" * size}
+    latencies = []
+    sent = {}
+    next_id = 0
+    received = 0
+    started = time.perf_counter()
+    while received < count:
+        while next_id < count and next_id - received < window:
+            sent[next_id] = time.perf_counter()
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "id": next_id, "method": "echo", "params": params}))
+            next_id += 1
+        reply = json.loads(await websocket.recv())
+        latencies.append(time.perf_counter() - sent.pop(reply["id"]))
+        received += 1
+    elapsed = time.perf_counter() - started
+    return {"rate": count / elapsed, "mbps": count * size / elapsed / 1e6, "latencies": latencies}
+
+
+async def run(connect, servers: int, requests: int, timeout: float, script: str) -> dict:
+    results = []
+    done = asyncio.Event()
+
+    async def endpoint(websocket):
+        result = {}
+        results.append(result)
+        result["ping-pong"] = await _exchange(websocket, min(requests, 500), 200, 1)
+        result["pipelined 1 KB"] = await _exchange(websocket, requests, 1024, 64)
+        result["pipelined 64 KB"] = await _exchange(websocket, max(requests // 10, 50), 64 * 1024, 64)
+        if sum(len(finished) == len(PHASES) for finished in results) == servers:
+            done.set()
+
+    lag = 0.0
+
+    async def ticker():
+        nonlocal lag
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - started - 0.005)
+
+    async with websockets.serve(endpoint, "127.0.0.1", 0, max_size=None) as server:
+        uri = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        tick = asyncio.create_task(ticker())
+        pipes = [asyncio.create_task(connect(uri, script)) for _ in range(servers)]
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        tick.cancel()
+    for pipe in pipes:
+        pipe.cancel()
+    await asyncio.gather(*pipes, return_exceptions=True)
+    gc.collect()  # Finalise the child transports while the loop is still open.
+    await asyncio.sleep(0)
+    return {"results": results, "lag": lag}
+
+
+def _report(label: str, servers: int, outcome: dict) -> None:
+    line = [f"{label:9s} x{servers}:"]
+    for name in PHASES:
+        runs = [result[name] for result in outcome["results"] if name in result]
+        if len(runs) < servers:
+            line.append(f"{name}: stalled ({len(runs)}/{servers} pipes finished)")
+            break
+        latencies = sorted(latency for run in runs for latency in run["latencies"])
+        if name == "ping-pong":
+            line.append(f"rtt p50 {statistics.median(latencies) * 1e3:5.2f} ms p95 "
+                        f"{latencies[int(len(latencies) * 0.95)] * 1e3:5.2f} ms")
+        else:
+            line.append(f"{name[10:]}: {sum(run['rate'] for run in runs):7.0f} msg/s "
+                        f"{sum(run['mbps'] for run in runs):6.1f} MB/s")
+    line.append(f"max loop lag {outcome['lag'] * 1e3:7.1f} ms")
+    print("  ".join(line))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--servers", default="1,4", help="comma-separated numbers of concurrent pipes")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a run counts as stalled")
+    args = parser.parse_args()
+    logging.getLogger("MCP_PIPE").setLevel(logging.CRITICAL)
+    logging.getLogger("websockets").setLevel(logging.CRITICAL)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as handle:
+        handle.write(ECHO_SERVER)
+    script = handle.name
+    try:
+        for servers in (int(count) for count in args.servers.split(",")):
+            legacy = partial(_legacy_connect, watchdog=args.timeout)
+            for label, connect in (("to_thread", legacy), ("streams", mcp_pipe.connect_to_server)):
+                _report(label, servers, asyncio.run(run(connect, servers, args.requests, args.timeout, script)))
+    finally:
+        Path(script).unlink()
+
+
+if __name__ == "__main__":
+    main()
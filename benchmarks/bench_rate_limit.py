@@ -0,0 +1,132 @@
+"""
+Throughput and throttling with and without the adaptive per-host rate limiter.
+
+    uv run python benchmarks/bench_rate_limit.py [--capacity 30] [--workers 40] [--seconds 8]
+
+A local stand-in for musicu.fcg accepts ``--capacity`` requests per sliding
+second and answers everything above that with code 500001, like QQ Music does
+under bursts. ``--workers`` loops call it through :class:`MusicuBatcher`
+(``max_batch=1``, so every call is one request): three quarters of them as
+background prefetch work and the rest as interactive tool calls. The run is
+repeated with the limiter off and on; a throttled call counts as a failure.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import http_transport  # noqa: E402
+import qqmusic_batch  # noqa: E402
+import rate_limit  # noqa: E402
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 128  # Every worker may connect at once.
+
+
+def _handler(capacity: int):
+    lock = threading.Lock()
+    recent = collections.deque()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            now = time.monotonic()
+            with lock:
+                while recent and now - recent[0] > 1.0:
+                    recent.popleft()
+                allowed = len(recent) < capacity
+                recent.append(now)
+            time.sleep(0.01)
+            if allowed:
+                reply = {"code": 0, **{key: {"code": 0, "data": {}} for key in body if key.startswith("req_")}}
+            else:
+                reply = {"code": qqmusic_batch.THROTTLED}
+            payload = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def run(url: str, workers: int, seconds: float, limiter: rate_limit.RateLimiter) -> dict:
+    http_transport._TRANSPORT = None
+    rate_limit._LIMITER = limiter
+    batcher = qqmusic_batch.MusicuBatcher(url=url, max_batch=1)
+    outcome = {level: collections.Counter() for level in (rate_limit.INTERACTIVE, rate_limit.BACKGROUND)}
+    latency = {level: [] for level in outcome}
+    deadline = time.monotonic() + seconds
+
+    async def worker(level: int) -> None:
+        with rate_limit.priority(level):
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    await batcher.call("vkey.GetVkeyServer", "CgiGetVkey", {"songmid": ["x"]})
+                    outcome[level]["ok"] += 1
+                except qqmusic_batch.MusicuError:
+                    outcome[level]["throttled"] += 1
+                    await asyncio.sleep(0.05)
+                except httpx.TimeoutException:
+                    outcome[level]["timed out"] += 1
+                latency[level].append(time.perf_counter() - started)
+                if level == rate_limit.INTERACTIVE:
+                    await asyncio.sleep(0.1)  # A tool call every so often, not a tight loop.
+
+    await asyncio.gather(*(
+        worker(rate_limit.INTERACTIVE if index % 4 == 0 else rate_limit.BACKGROUND) for index in range(workers)
+    ))
+    await http_transport.get_transport().aclose()
+    return {"outcome": outcome, "latency": latency, "limiter": limiter.stats()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capacity", type=int, default=30, help="requests per second the server accepts")
+    parser.add_argument("--workers", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=8.0)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server = _Server(("127.0.0.1", 0), _handler(args.capacity))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/cgi-bin/musicu.fcg"
+    print(f"server capacity {args.capacity} req/s, {args.workers} workers, {args.seconds:.0f} s")
+
+    for label, rate in (("no limiter", 0), ("AIMD limiter", 20)):
+        result = asyncio.run(run(url, args.workers, args.seconds, rate_limit.RateLimiter(rate=rate, domains=("127.0.0.1",))))
+        for level, name in ((rate_limit.INTERACTIVE, "interactive"), (rate_limit.BACKGROUND, "background")):
+            counts = result["outcome"][level]
+            latencies = sorted(result["latency"][level]) or [0.0]
+            print(f"{label:12s} {name:11s}: {counts['ok'] / args.seconds:6.1f} ok/s  "
+                  f"{counts['throttled']:5d} throttled  {counts['timed out']:3d} timed out  p50 {statistics.median(latencies) * 1e3:7.1f} ms  "
+                  f"p95 {latencies[int(len(latencies) * 0.95)] * 1e3:7.1f} ms")
+        hosts = result["limiter"]["hosts"]
+        if hosts:
+            print(f"{'':12s} final rate {next(iter(hosts.values()))['rate']} req/s")
+
+
+if __name__ == "__main__":
+    main()
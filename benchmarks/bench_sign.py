@@ -0,0 +1,151 @@
+"""
+Microbenchmark and parity check for musics.fcg signing.
+
+    uv run python benchmarks/bench_sign.py [--count 200]
+    uv run python benchmarks/bench_sign.py --record   # re-record the corpus
+
+Every run first checks the pure-Python signers against the recorded
+payload -> sign corpus (``fixtures/sign_corpus.json``, produced by the JS
+bundles) and exits non-zero on any mismatch. It then reports signs/sec for:
+
+- execjs compiling ``loader.js`` for every sign (the original code path)
+- the warm JS engine with distinct payloads (cold LRU) and repeated payloads
+- the native Python signer
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import qqmusic_sign  # noqa: E402
+
+CORPUS_PATH = Path(__file__).resolve().parent / "fixtures" / "sign_corpus.json"
+
+
+def _payload(i: int) -> str:
+    return json.dumps({
+        "comm": {"cv": 4747474, "ct": 24, "format": "json", "uin": 0, "g_tk": 5381},
+        "req_1": {"module": "musicToplist.ToplistInfoServer", "method": "GetDetail",
+                  "param": {"topid": i, "offset": 0, "num": 100, "period": ""}},
+    })
+
+
+def _corpus_payloads():
+    """Payloads shaped like the ones the clients sign, plus encoding edge cases."""
+    loader_js = (ROOT / qqmusic_sign.LOADER_SCRIPT).read_text(encoding="utf-8")
+    payloads = re.findall(r"^data = '(.*)'$", loader_js, re.M)
+    comm = {"cv": 4747474, "ct": 24, "format": "json", "inCharset": "utf-8", "outCharset": "utf-8",
+            "notice": 0, "platform": "yqq.json", "needNewCode": 1, "uin": "1485795050",
+            "g_tk_new_20200303": 780715403, "g_tk": 780715403}
+    for disstid in (7256912512, 8313012275, 9262344645, 1, 211111):
+        payloads.append(json.dumps({"comm": comm, "req_2": {
+            "module": "music.srfDissInfo.aiDissInfo", "method": "uniform_get_Dissinfo",
+            "param": {"disstid": disstid, "userinfo": 1, "tag": 1, "orderlist": 1, "song_begin": 0,
+                      "song_num": 1000, "onlysonglist": 0, "enc_host_uin": ""}}}))
+    for topid in (4, 26, 27, 62, 5):
+        payloads.append(json.dumps({"comm": comm, "req_1": {
+            "module": "musicToplist.ToplistInfoServer", "method": "GetDetail",
+            "param": {"topid": topid, "offset": 0, "num": 100, "period": ""}}}))
+    for bizid, size in (("97773", 25), ("102065756", 10), ("0", 1)):
+        payloads.append(json.dumps({"comm": comm, "req_3": {
+            "module": "music.globalComment.CommentRead", "method": "GetNewCommentList",
+            "param": {"BizType": 1, "BizId": bizid, "PageSize": size, "PageNum": 0, "WithHot": 1}}}))
+    payloads.append(json.dumps({"comm": comm, "req_1": {
+        "module": "musicToplist.ToplistInfoServer", "method": "GetAll", "param": {}}}, separators=(',', ':')))
+    for query in ("邓紫棋", "晴天 周杰伦", "Ｆｕｌｌ－ｗｉｄｔｈ", "emoji 🎵🎶", "line\nbreak\ttab", 'quote " \\ slash'):
+        for ensure_ascii in (True, False):
+            payloads.append(json.dumps({"comm": comm, "req_1": {
+                "method": "DoSearchForQQMusicDesktop", "module": "music.search.SearchCgiService",
+                "param": {"query": query, "page_num": 1, "num_per_page": 10}}}, ensure_ascii=ensure_ascii))
+    payloads += ["", "a", "abc", "{}", "中文", "x" * 100_000]
+    payloads += [_payload(i) for i in range(64)]
+    return payloads
+
+
+async def record_corpus() -> None:
+    engine = qqmusic_sign.JsSignEngine()
+    corpus = []
+    for payload in _corpus_payloads():
+        corpus.append({
+            "payload": payload,
+            "sign": await engine.sign(payload),
+            "legacy_sign": await engine.legacy_sign(payload),
+        })
+    await engine.close()
+    CORPUS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    CORPUS_PATH.write_text(json.dumps(corpus, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+    print(f"recorded {len(corpus)} entries to {CORPUS_PATH}")
+
+
+def check_parity() -> int:
+    corpus = json.loads(CORPUS_PATH.read_text(encoding="utf-8"))
+    failures = 0
+    for entry in corpus:
+        for name, fn in (("sign", qqmusic_sign.sign), ("legacy_sign", qqmusic_sign.legacy_sign)):
+            got = fn(entry["payload"])
+            if got != entry[name]:
+                failures += 1
+                print(f"MISMATCH {name}: {entry['payload'][:60]!r}: {got} != {entry[name]}")
+    print(f"parity: {len(corpus) * 2 - failures}/{len(corpus) * 2} signs match the JS bundles")
+    return failures
+
+
+def bench_execjs(count: int) -> float:
+    import execjs
+
+    js_code = (ROOT / qqmusic_sign.LOADER_SCRIPT).read_text(encoding="utf-8")
+    started = time.perf_counter()
+    for i in range(count):
+        execjs.compile(js_code).call("get_sign", _payload(i))
+    return count / (time.perf_counter() - started)
+
+
+async def bench_engine(count: int, distinct: bool) -> float:
+    engine = qqmusic_sign.JsSignEngine()
+    await engine.sign(_payload(-1))  # start the worker outside the timed section
+    started = time.perf_counter()
+    for i in range(count):
+        await engine.sign(_payload(i if distinct else 0))
+    rate = count / (time.perf_counter() - started)
+    await engine.close()
+    return rate
+
+
+def bench_native(count: int) -> float:
+    payloads = [_payload(i) for i in range(count)]
+    started = time.perf_counter()
+    for payload in payloads:
+        qqmusic_sign.sign(payload)
+    return count / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--record", action="store_true", help="re-record the corpus from the JS bundles")
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record_corpus())
+    if check_parity():
+        sys.exit(1)
+
+    before = bench_execjs(max(args.count // 20, 5))
+    print(f"execjs compile per call : {before:10.1f} signs/s ({1e3 / before:8.3f} ms/sign)")
+    cold = asyncio.run(bench_engine(args.count, distinct=True))
+    print(f"warm engine, cold LRU   : {cold:10.1f} signs/s ({1e3 / cold:8.3f} ms/sign)")
+    warm = asyncio.run(bench_engine(args.count, distinct=False))
+    print(f"warm engine, warm LRU   : {warm:10.1f} signs/s ({1e3 / warm:8.3f} ms/sign)")
+    native = bench_native(args.count * 50)
+    print(f"native python           : {native:10.1f} signs/s ({1e3 / native:8.3f} ms/sign)")
+
+
+if __name__ == "__main__":
+    main()
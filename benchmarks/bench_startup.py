@@ -0,0 +1,52 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the server modules.
+
+    uv run python benchmarks/bench_startup.py [--runs 5]
+
+``mcp_pipe.py`` respawns the server on every reconnect, so this is paid on
+every reconnect. Each run imports in a new process and reports whether the
+heavy client dependencies were pulled in eagerly.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "httpx": "httpx" in sys.modules, "execjs": "execjs" in sys.modules}}))
+"""
+
+
+def probe(module: str) -> dict:
+    env = dict(os.environ, QQM_COOKIE=os.environ.get("QQM_COOKIE", "uin=0; qm_keyst=bench"))
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in ("qqmusic_service", "qqmusic_mcp"):
+        results = [probe(module) for _ in range(args.runs)]
+        median = statistics.median(r["seconds"] for r in results)
+        print(f"import {module:16s}: median {median * 1e3:8.1f} ms"
+              f"  (httpx loaded: {results[0]['httpx']}, execjs loaded: {results[0]['execjs']})")
+
+
+if __name__ == "__main__":
+    main()
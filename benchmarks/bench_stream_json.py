@@ -0,0 +1,166 @@
+"""
+Peak memory and time-to-first-song of streaming vs whole-body JSON decoding.
+
+    uv run python benchmarks/bench_stream_json.py [--songs 1000] [--mbps 40]
+
+A local stand-in for musics.fcg returns a ``uniform_get_Dissinfo`` answer with
+``--songs`` full track objects (the shape ``get_category_playlist`` receives for
+``song_num: 1000``), written in 16 KB chunks at ``--mbps`` to mimic a real link.
+Both paths end with the same projected (mid, name, singer, album, interval)
+records: ``response.json()`` + projection as before, and ``json_stream.iter_array``.
+Memory is measured in a separate traced pass; tracemalloc slows decoding down.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import http_transport  # noqa: E402
+import json_stream  # noqa: E402
+
+CHUNK = 16 * 1024
+
+
+def _track(rng: random.Random, number: int) -> dict:
+    singers = [
+        {"id": rng.randint(1, 10**7), "mid": f"00{number:012d}", "name": f"歌手{rng.randint(1, 5000)}",
+         "title": "", "type": 0, "uin": 0, "pmid": ""}
+        for _ in range(rng.randint(1, 3))
+    ]
+    return {
+        "id": 100000 + number, "type": 0, "songtype": 0, "mid": f"{number:014d}",
+        "name": f"歌曲{number}", "title": f"歌曲{number}", "subtitle": "", "singer": singers,
+        "album": {"id": rng.randint(1, 10**6), "mid": f"A{number:013d}", "name": f"专辑{number // 10}",
+                  "title": f"专辑{number // 10}", "subtitle": "", "time_public": "2020-01-01", "pmid": ""},
+        "mv": {"id": 0, "vid": "", "name": "", "title": "", "vt": 0},
+        "interval": rng.randint(120, 360), "isonly": 0, "language": 0, "genre": 1, "index_cd": 0,
+        "index_album": rng.randint(1, 12), "time_public": "2020-01-01", "status": 0, "fnote": 4009,
+        "file": {"media_mid": f"{number:014d}", "size_24aac": 0, "size_48aac": rng.randint(10**6, 4 * 10**6),
+                 "size_96aac": rng.randint(10**6, 4 * 10**6), "size_192ogg": rng.randint(10**6, 8 * 10**6),
+                 "size_128mp3": rng.randint(10**6, 8 * 10**6), "size_320mp3": rng.randint(10**6, 2 * 10**7),
+                 "size_flac": rng.randint(10**7, 5 * 10**7), "size_ape": 0, "size_dts": 0, "size_try": 0,
+                 "try_begin": 0, "try_end": 0, "url": "", "size_hires": 0, "hires_sample": 0,
+                 "hires_bitdepth": 0, "b_30s": 0, "e_30s": 0, "size_96ogg": 0, "size_360ra": [], "size_dolby": 0},
+        "pay": {"pay_month": 1, "price_track": 200, "price_album": 0, "pay_play": 1, "pay_down": 1,
+                "pay_status": 0, "time_free": 0},
+        "action": {"switch": 17413891, "msgid": 14, "alert": 2, "icons": 8314748, "msgshare": 0,
+                   "msgfav": 0, "msgdown": 0, "msgpay": 6, "switch2": 0, "icon2": 0},
+        "ksong": {"id": 0, "mid": ""}, "volume": {"gain": -7.2, "peak": 1, "lra": 9.1},
+        "label": "0", "url": "", "bpm": 0, "version": 0, "trace": "", "data_type": 0,
+        "modify_stamp": 0, "pingpong": "", "ppurl": "", "tid": 0, "ov": 0, "sa": 0, "es": "",
+        "vs": [f"{rng.getrandbits(40):x}" for _ in range(4)], "vi": [0, 0, 0], "ktag": "", "vf": [0.0, 0.0, 0.0],
+    }
+
+
+def _payload(songs: int) -> bytes:
+    rng = random.Random(7)
+    body = {
+        "code": 0, "ts": 1700000000000, "start_ts": 1700000000000, "traceid": "0",
+        "req_2": {"code": 0, "data": {
+            "dirinfo": {"id": 7000000000, "title": "歌单", "songnum": songs, "desc": "说明" * 200},
+            "songlist": [_track(rng, number) for number in range(songs)],
+            "songlist_size": songs, "total_song_num": songs,
+        }},
+    }
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _handler(payload: bytes, bytes_per_second: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            view = memoryview(payload)
+            for offset in range(0, len(payload), CHUNK):
+                self.wfile.write(view[offset:offset + CHUNK])
+                self.wfile.flush()
+                if bytes_per_second:
+                    time.sleep(CHUNK / bytes_per_second)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def whole_body(url: str, on_song) -> list:
+    response = await http_transport.get_transport().request("POST", url, data=b"{}")
+    tracks = response.json()["req_2"]["data"]["songlist"]
+    songs = []
+    for track in tracks:
+        songs.append(json_stream.project_song(track))
+        on_song()
+    return songs
+
+
+async def streamed(url: str, on_song) -> list:
+    songs = []
+    async with http_transport.get_transport().stream("POST", url, data=b"{}") as response:
+        async for track in json_stream.iter_array(response.aiter_bytes(), "songlist"):
+            songs.append(json_stream.project_song(track))
+            on_song()
+    return songs
+
+
+async def run(path, url: str, traced: bool) -> dict:
+    http_transport._TRANSPORT = None
+    first = []
+    # Open the pooled connection first so both paths start from the same state.
+    await http_transport.get_transport().request("POST", url, data=b"{}")
+    gc.collect()
+    if traced:
+        tracemalloc.start()
+    started = time.perf_counter()
+    songs = await path(url, lambda: first or first.append(time.perf_counter() - started))
+    elapsed = time.perf_counter() - started
+    result = {"songs": songs, "total": elapsed, "first": first[0]}
+    if traced:
+        result["peak"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    await http_transport.get_transport().aclose()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--songs", type=int, default=1000)
+    parser.add_argument("--mbps", type=float, default=40.0, help="simulated link speed, 0 for unthrottled")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    payload = _payload(args.songs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(payload, args.mbps * 1e6 / 8))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/cgi-bin/musics.fcg"
+    print(f"body {len(payload) / 1e6:.2f} MB, {args.songs} songs, link {args.mbps or 'unthrottled'} Mbit/s")
+
+    expected = None
+    for label, path in (("response.json()", whole_body), ("json_stream", streamed)):
+        timed = asyncio.run(run(path, url, traced=False))
+        traced = asyncio.run(run(path, url, traced=True))
+        expected = expected or timed["songs"]
+        assert timed["songs"] == expected and len(expected) == args.songs
+        print(f"{label:16s}: first song {timed['first'] * 1e3:7.1f} ms  all songs {timed['total'] * 1e3:7.1f} ms  "
+              f"peak memory {traced['peak'] / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
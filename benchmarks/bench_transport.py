@@ -0,0 +1,98 @@
+"""
+Latency benchmark: a new ``httpx.AsyncClient`` per request vs the shared pooled transport.
+
+    uv run python benchmarks/bench_transport.py [--url https://u.y.qq.com/] [--count 50]
+
+Without ``--url`` a local keep-alive HTTP server is started, which isolates the
+connection setup cost; point ``--url`` at a real upstream to include DNS and TLS.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import http_transport  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self, body=b'{"code":0}'):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET(body=b"")
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_local_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+async def bench_fresh_clients(url: str, count: int) -> list:
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            await client.get(url)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def bench_shared(url: str, count: int, warm_up: bool) -> tuple:
+    transport = http_transport.HttpTransport()
+    if warm_up:
+        await transport.warm_up([http_transport._origin(url)])
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        await transport.request("GET", url)
+        latencies.append(time.perf_counter() - started)
+    stats = transport.stats()
+    await transport.aclose()
+    return latencies, stats
+
+
+def _report(label: str, latencies: list) -> None:
+    print(f"{label:28s}: p50 {statistics.median(latencies) * 1e3:8.2f} ms"
+          f"   first {latencies[0] * 1e3:8.2f} ms   max {max(latencies) * 1e3:8.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="upstream URL (default: local keep-alive server)")
+    parser.add_argument("--count", type=int, default=50)
+    args = parser.parse_args()
+    url = args.url or _start_local_server()
+
+    _report("new client per request", asyncio.run(bench_fresh_clients(url, args.count)))
+    latencies, _ = asyncio.run(bench_shared(url, args.count, warm_up=False))
+    _report("shared pool", latencies)
+    latencies, stats = asyncio.run(bench_shared(url, args.count, warm_up=True))
+    _report("shared pool + warm-up", latencies)
+    for origin, host in stats["hosts"].items():
+        print(f"  {origin}: requests={host['requests']} pool_hit_rate={host['pool_hit_rate']:.2f} "
+              f"tcp_connects={host['tcp_connects']} tls_handshakes={host['tls_handshakes']}")
+
+
+if __name__ == "__main__":
+    main()
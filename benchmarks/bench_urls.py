@@ -0,0 +1,112 @@
+"""
+Benchmark: N single ``get_music_url`` calls vs one bulk ``get_music_urls`` call.
+
+    uv run python benchmarks/bench_urls.py [--songs 20] [--delay-ms 40] [--chunk 30]
+
+A local stand-in for musicu.fcg answers CgiGetVkey after a fixed server delay
+(every fifth song comes back VIP-gated). The single calls run one after another,
+as an agent queueing a playlist through ``get_music_url_by_songmid`` would.
+
+Each phase starts cold: the playback URL cache (with its VIP negative cache) and
+the single-flight table are replaced first, so the bulk run cannot reuse what
+the single calls resolved.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import http_transport  # noqa: E402
+import qqmusic_batch  # noqa: E402
+import qqmusic_service  # noqa: E402
+import single_flight  # noqa: E402
+import url_cache  # noqa: E402
+
+ROUND_TRIPS = 0
+
+
+def _handler(delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            global ROUND_TRIPS
+            ROUND_TRIPS += 1
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            reply = {"code": 0}
+            for key, value in body.items():
+                if not key.startswith("req_"):
+                    continue
+                param = value["param"]
+                reply[key] = {"code": 0, "data": {
+                    "sip": ["http://127.0.0.1/"],
+                    "midurlinfo": [
+                        {"songmid": songmid, "filename": filename,
+                         "purl": "" if songmid.endswith("0") else f"{filename}?vkey=bench"}
+                        for songmid, filename in zip(param["songmid"], param["filename"])
+                    ],
+                }}
+            payload = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def run(url: str, songmids: list, bulk: bool, chunk: int) -> tuple:
+    global ROUND_TRIPS
+    http_transport._TRANSPORT = None
+    qqmusic_batch._BATCHER = qqmusic_batch.MusicuBatcher(url=url)
+    url_cache._URL_CACHE = url_cache.UrlCache()
+    single_flight._SINGLE_FLIGHT = single_flight.SingleFlight()
+    client = qqmusic_service.QQMusic()
+    ROUND_TRIPS = 0
+    started = time.perf_counter()
+    if bulk:
+        results = await client.get_music_urls([(songmid, "320") for songmid in songmids], chunk_size=chunk)
+        ok = sum(result["status"] == "ok" for result in results)
+    else:
+        results = [await client.get_music_url(songmid, "320") for songmid in songmids]
+        ok = sum(result is not None for result in results)
+    elapsed = time.perf_counter() - started
+    await http_transport.get_transport().aclose()
+    return elapsed, ROUND_TRIPS, ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--songs", type=int, default=20)
+    parser.add_argument("--delay-ms", type=float, default=40.0)
+    parser.add_argument("--chunk", type=int, default=30)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(args.delay_ms / 1e3))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/cgi-bin/musicu.fcg"
+    songmids = [f"00{i:012d}" for i in range(1, args.songs + 1)]
+
+    for label, bulk in ((f"{args.songs} x get_music_url", False), ("get_music_urls", True)):
+        elapsed, round_trips, ok = asyncio.run(run(url, songmids, bulk, args.chunk))
+        print(f"{label:22s}: {elapsed * 1e3:8.1f} ms, {round_trips:3d} round trips, {ok}/{args.songs} resolved")
+
+
+if __name__ == "__main__":
+    main()
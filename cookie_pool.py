@@ -0,0 +1,261 @@
+"""
+Pool of QQ Music accounts (cookies) with load-balanced request routing.
+
+Credentials come from ``QQM_COOKIE`` plus any numbered ``QQM_COOKIE_2``,
+``QQM_COOKIE_3`` ... and the lines of ``QQM_COOKIE_FILE``. Every MCP tool call
+leases one account for its duration (:meth:`CookiePool.lease`); the clients it
+builds inside the lease are bound to that account's cookie. Leases go to the
+usable account with the fewest outstanding calls, except that URL lookups for a
+songmid stick to the account that last resolved it, so its cached vkey URL is
+reused.
+
+Accounts are scored from the ``musicu.fcg`` codes their requests get back:
+code 500001 rests the account for ``QQM_COOKIE_COOLDOWN`` seconds, and
+``QQM_COOKIE_EJECT_AFTER`` consecutive "login expired" answers (code 1000) eject
+it for ``QQM_COOKIE_RETRY`` seconds, after which it gets one more chance. When no
+account is usable the least bad one is still used, so anonymous calls keep working.
+"""
+
+import contextvars
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+__all__ = [
+    "Account",
+    "CookiePool",
+    "accounts",
+    "LOGIN_EXPIRED",
+    "THROTTLED",
+    "current_account",
+    "get_cookie_pool",
+    "load_cookies",
+    "observe",
+    "stats",
+    "stick",
+]
+
+logger = logging.getLogger(__name__)
+
+THROTTLED = 500001
+LOGIN_EXPIRED = 1000
+# songmid -> account that resolved it, for sticky URL lookups.
+_STICKY_SIZE = 4096
+
+_CURRENT: contextvars.ContextVar[Optional["Account"]] = contextvars.ContextVar("qqm_account", default=None)
+
+
+def current_account() -> Optional["Account"]:
+    """The account leased by the calling task, if any."""
+    return _CURRENT.get()
+
+
+def parse_cookie(cookie: str) -> Dict[str, str]:
+    cookies = {}
+    for item in cookie.split(";"):
+        key, _, value = item.strip().partition("=")
+        if key:
+            cookies[key] = value
+    return cookies
+
+
+def load_cookies() -> List[str]:
+    """Cookie strings from ``QQM_COOKIE``, ``QQM_COOKIE_<n>`` and ``QQM_COOKIE_FILE``, without duplicates."""
+    cookies = [os.getenv("QQM_COOKIE", "")]
+    numbered = [name for name in os.environ if name.startswith("QQM_COOKIE_") and name[11:].isdigit()]
+    cookies += [os.environ[name] for name in sorted(numbered, key=lambda name: int(name[11:]))]
+    path = os.getenv("QQM_COOKIE_FILE")
+    if path:
+        try:
+            lines = Path(path).expanduser().read_text(encoding="utf-8").splitlines()
+        except (OSError, UnicodeDecodeError) as exc:
+            logger.warning("QQM_COOKIE_FILE %s could not be read (%s); ignoring it", path, exc)
+            lines = []
+        cookies += [line for line in lines if not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(cookie.strip() for cookie in cookies if cookie.strip()))
+
+
+class Account:
+    """One QQ Music credential and its routing state."""
+
+    def __init__(self, cookie: str, index: int):
+        self.cookie = cookie
+        self.cookies = parse_cookie(cookie)
+        self.uin = self.cookies.get("uin") or self.cookies.get("qqmusic_uin") or f"account{index}"
+        self.index = index
+        self.clients: Dict[str, Any] = {}
+        self.outstanding = 0
+        self.leases = 0
+        self.ok = 0
+        self.throttled = 0
+        self.login_failures = 0
+        self.consecutive_failures = 0
+        self.resting_until = 0.0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def usable(self, now: float) -> bool:
+        return self.ejected_until <= now and self.resting_until <= now
+
+    def state(self, now: float) -> str:
+        if self.ejected_until > now:
+            return "ejected"
+        if self.resting_until > now:
+            return "throttled"
+        return "healthy"
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "uin": self.uin,
+            "state": self.state(now),
+            "outstanding": self.outstanding,
+            "leases": self.leases,
+            "ok": self.ok,
+            "throttled": self.throttled,
+            "login_failures": self.login_failures,
+            "ejections": self.ejections,
+        }
+
+
+class CookiePool:
+    """Routes tool calls across accounts by least outstanding calls, with health tracking."""
+
+    def __init__(
+        self,
+        cookies: List[str],
+        cooldown: Optional[float] = None,
+        eject_after: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        if not cookies:
+            raise ValueError("the cookie pool needs at least one cookie")
+        self.accounts = [Account(cookie, index) for index, cookie in enumerate(cookies)]
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("QQM_COOKIE_COOLDOWN", "30"))
+        self.eject_after = eject_after or int(os.getenv("QQM_COOKIE_EJECT_AFTER", "3"))
+        self.retry_after = retry_after if retry_after is not None else float(os.getenv("QQM_COOKIE_RETRY", "600"))
+        self._by_uin = {account.uin: account for account in self.accounts}
+        self._sticky: "OrderedDict[str, Account]" = OrderedDict()
+        self.sticky_hits = 0
+
+    def pick(self, sticky: Optional[str] = None) -> Account:
+        """The account the next call should use."""
+        now = time.monotonic()
+        candidates = [account for account in self.accounts if account.usable(now)]
+        if not candidates:
+            # Nothing is healthy: prefer resting accounts over ejected ones, then whoever recovers first.
+            candidates = [min(self.accounts, key=lambda account: (account.ejected_until, account.resting_until))]
+        if sticky is not None:
+            account = self._sticky.get(sticky)
+            least = min(candidate.outstanding for candidate in candidates)
+            # Stay on the account that holds the URL unless it is clearly busier than the rest.
+            if account in candidates and account.outstanding <= least + 1:
+                self.sticky_hits += 1
+                return account
+        return min(candidates, key=lambda account: (account.outstanding, account.leases))
+
+    @contextmanager
+    def lease(self, sticky: Optional[str] = None) -> Iterator[Account]:
+        """Route the calls made in this block (and tasks it starts) through one account."""
+        current = _CURRENT.get()
+        if current is not None:
+            yield current
+            return
+        account = self.pick(sticky)
+        account.outstanding += 1
+        account.leases += 1
+        token = _CURRENT.set(account)
+        try:
+            yield account
+        finally:
+            _CURRENT.reset(token)
+            account.outstanding -= 1
+
+    def stick(self, key: str, cookies: Optional[Dict[str, str]]) -> None:
+        """Send later lookups for ``key`` (a songmid) to the account owning ``cookies``."""
+        account = self.account_for(cookies)
+        if account is None or len(self.accounts) == 1:
+            return
+        self._sticky[key] = account
+        self._sticky.move_to_end(key)
+        while len(self._sticky) > _STICKY_SIZE:
+            self._sticky.popitem(last=False)
+
+    def account_for(self, cookies: Optional[Dict[str, str]]) -> Optional[Account]:
+        if not cookies:
+            return None
+        return self._by_uin.get(cookies.get("uin") or cookies.get("qqmusic_uin") or "")
+
+    def observe(self, cookies: Optional[Dict[str, str]], code: Any) -> None:
+        """Score the account owning ``cookies`` by a ``musicu.fcg`` response code."""
+        account = self.account_for(cookies)
+        if account is None:
+            return
+        now = time.monotonic()
+        if code == THROTTLED:
+            account.throttled += 1
+            account.resting_until = now + self.cooldown
+        elif code == LOGIN_EXPIRED:
+            account.login_failures += 1
+            account.consecutive_failures += 1
+            if account.consecutive_failures >= self.eject_after and account.ejected_until <= now:
+                account.ejected_until = now + self.retry_after
+                account.ejections += 1
+                # One more failure after the retry period ejects it again.
+                account.consecutive_failures = self.eject_after - 1
+                logger.warning("QQ Music account %s ejected: its credential is rejected (code %s)", account.uin, code)
+        elif code == 0:
+            account.ok += 1
+            account.consecutive_failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "accounts": [account.snapshot(now) for account in self.accounts],
+            "usable": sum(1 for account in self.accounts if account.usable(now)),
+            "sticky_entries": len(self._sticky),
+            "sticky_hits": self.sticky_hits,
+            "cooldown": self.cooldown,
+            "eject_after": self.eject_after,
+        }
+
+
+_POOL: Optional[CookiePool] = None
+
+
+def get_cookie_pool() -> CookiePool:
+    """Return the process-wide :class:`CookiePool`, loading ``.env`` and the cookies on first use."""
+    global _POOL
+    if _POOL is None:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        cookies = load_cookies()
+        if not cookies:
+            raise RuntimeError("QQM_COOKIE must be set (export an env var or add it to .env)")
+        _POOL = CookiePool(cookies)
+    return _POOL
+
+
+def observe(cookies: Optional[Dict[str, str]], code: Any) -> None:
+    """:meth:`CookiePool.observe` on the process-wide pool, if it has been loaded."""
+    if _POOL is not None:
+        _POOL.observe(cookies, code)
+
+
+def stick(key: str, cookies: Optional[Dict[str, str]]) -> None:
+    """:meth:`CookiePool.stick` on the process-wide pool, if it has been loaded."""
+    if _POOL is not None:
+        _POOL.stick(key, cookies)
+
+
+def accounts() -> List[Account]:
+    """Accounts of the process-wide pool, or none before it has been loaded."""
+    return _POOL.accounts if _POOL is not None else []
+
+
+def stats() -> Dict[str, Any]:
+    return _POOL.stats() if _POOL is not None else {"accounts": [], "usable": 0}
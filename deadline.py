@@ -0,0 +1,331 @@
+"""
+Deadlines for MCP tool calls and per-endpoint timeout budgets for upstream requests.
+
+Every tool call runs inside a :func:`scope` that fixes when its answer is due
+(``QQM_TOOL_DEADLINE`` seconds after it starts). The deadline travels with the
+calling task's context into the sign, rate-limit queue, HTTP and parse steps
+below it, and each step marks itself with :func:`enter`/:func:`check` so a call
+that runs out of time reports the stage it was in.
+
+Each upstream endpoint (``search``, ``musicu``, ``musics``, ``lyrics``,
+``page``, ``mv``, ``user``) has its own connect/read budget; the HTTP timeout
+of a request is that budget clipped to what is left of the deadline, and an
+endpoint's optional retries only run while enough of the deadline remains for
+another connect. Outcomes (ok, errors, retries, timeouts by stage) are counted
+per endpoint and per tool.
+
+Background work (URL prefetch, cache refreshes) runs :func:`detached` from the
+tool that started it, bounded by the endpoint budgets alone.
+
+Configuration (environment):
+
+- ``QQM_TOOL_DEADLINE``: seconds a tool call may take (default 8; ``0`` disables)
+- ``QQM_TIMEOUT_<ENDPOINT>``: ``connect,read[,retries]`` seconds for one endpoint,
+  e.g. ``QQM_TIMEOUT_SEARCH=1,3,1``
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, Iterator, NamedTuple, Optional, TypeVar
+
+from metrics import LatencyWindow
+
+__all__ = [
+    "Budget",
+    "DeadlineExceeded",
+    "DeadlineTracker",
+    "bounded",
+    "check",
+    "detached",
+    "enter",
+    "expires_at",
+    "get_tracker",
+    "remaining",
+    "scope",
+    "scope_until",
+]
+
+if TYPE_CHECKING:
+    import httpx
+
+T = TypeVar("T")
+
+
+class Budget(NamedTuple):
+    """Connect and read timeouts (seconds) of one endpoint, and how often it may be retried."""
+
+    connect: float
+    read: float
+    retries: int = 0
+
+
+DEFAULT_BUDGET = Budget(2.0, 5.0)
+BUDGETS = {
+    "search": Budget(1.0, 3.0, 1),
+    "musicu": Budget(1.0, 3.0),
+    "musics": Budget(1.0, 4.0),
+    "lyrics": Budget(1.0, 2.0, 1),
+    "page": Budget(1.5, 4.0),
+    "mv": Budget(1.0, 1.0),
+    "user": Budget(1.0, 3.0, 1),
+}
+
+_HTTPX_STAGES = (
+    ("ConnectTimeout", "connect"),
+    ("ReadTimeout", "read"),
+    ("WriteTimeout", "write"),
+    ("PoolTimeout", "pool"),
+)
+_EXCEEDED: Optional[type] = None
+
+
+def _exceeded_type() -> type:
+    """Define :class:`DeadlineExceeded` on first use, so importing this module does not load httpx."""
+    global _EXCEEDED
+    if _EXCEEDED is None:
+        import httpx
+
+        class DeadlineExceeded(httpx.TimeoutException):
+            """A call ran out of time; ``stage`` says where (``queue``, ``sign``, ``connect``, ``read`` ...).
+
+            A subclass of ``httpx.TimeoutException`` so existing transport error handling applies.
+            """
+
+            def __init__(self, stage: str, endpoint: Optional[str], message: str):
+                super().__init__(message)
+                self.stage = stage
+                self.endpoint = endpoint
+
+        DeadlineExceeded.__module__, DeadlineExceeded.__qualname__ = __name__, "DeadlineExceeded"
+        _EXCEEDED = DeadlineExceeded
+    return _EXCEEDED
+
+
+def __getattr__(name: str) -> Any:
+    if name == "DeadlineExceeded":
+        return _exceeded_type()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _Scope:
+    def __init__(self, name: str, expires_at: Optional[float]):
+        self.name = name
+        self.expires_at = expires_at
+        self.stage = "start"
+        self.endpoint: Optional[str] = None
+
+
+_SCOPE: contextvars.ContextVar[Optional[_Scope]] = contextvars.ContextVar("qqm_deadline", default=None)
+
+
+@contextmanager
+def _use(value: Optional[_Scope]) -> Iterator[Optional[_Scope]]:
+    token = _SCOPE.set(value)
+    try:
+        yield value
+    finally:
+        _SCOPE.reset(token)
+
+
+def scope(name: str, seconds: Optional[float] = None):
+    """Run the block under a deadline ``seconds`` from now (the tool default if omitted).
+
+    Inside an enclosing scope the earlier of the two deadlines wins.
+    """
+    seconds = get_tracker().tool_deadline if seconds is None else seconds
+    expires = time.monotonic() + seconds if seconds > 0 else None
+    outer = expires_at()
+    if outer is not None and (expires is None or outer < expires):
+        expires = outer
+    return _use(_Scope(name, expires))
+
+
+def scope_until(name: str, expires: Optional[float]):
+    """Run the block under the absolute deadline ``expires`` (``time.monotonic()``), or none."""
+    return _use(_Scope(name, expires))
+
+
+def detached():
+    """Run the block (and tasks it starts) without the caller's deadline."""
+    return _use(None)
+
+
+def expires_at() -> Optional[float]:
+    current = _SCOPE.get()
+    return current.expires_at if current is not None else None
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or ``None`` without one."""
+    expires = expires_at()
+    return expires - time.monotonic() if expires is not None else None
+
+
+def enter(stage: str, endpoint: Optional[str] = None) -> None:
+    """Mark the current task as being in ``stage`` of a request to ``endpoint``."""
+    current = _SCOPE.get()
+    if current is not None:
+        current.stage = stage
+        current.endpoint = endpoint
+
+
+def _expired(current: _Scope) -> "DeadlineExceeded":
+    get_tracker().record(current.endpoint, "timeout", current.stage)
+    target = f" ({current.endpoint})" if current.endpoint else ""
+    return _exceeded_type()(
+        current.stage, current.endpoint, f"{current.name}: deadline exceeded during {current.stage}{target}",
+    )
+
+
+def check(stage: str, endpoint: Optional[str] = None) -> None:
+    """:func:`enter` ``stage``, raising :class:`DeadlineExceeded` if the deadline has already passed."""
+    enter(stage, endpoint)
+    current = _SCOPE.get()
+    if current is not None and current.expires_at is not None and time.monotonic() >= current.expires_at:
+        raise _expired(current)
+
+
+async def bounded(awaitable: Awaitable[T]) -> T:
+    """Await ``awaitable``, cancelling it when the current deadline passes."""
+    current = _SCOPE.get()
+    if current is None or current.expires_at is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(current.expires_at - time.monotonic(), 0.0))
+    except asyncio.TimeoutError:
+        raise _expired(current) from None
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.ok = 0
+        self.errors = 0
+        self.retries = 0
+        self.timeouts: Dict[str, int] = {}
+        self.latency = LatencyWindow(256)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": dict(self.timeouts),
+            **self.latency.snapshot(),
+        }
+
+
+def _env_budget(name: str, default: Budget) -> Budget:
+    setting = os.getenv(f"QQM_TIMEOUT_{name.upper()}")
+    if not setting:
+        return default
+    try:
+        parts = [float(part) for part in setting.split(",")]
+        return Budget(parts[0], parts[1] if len(parts) > 1 else default.read,
+                      int(parts[2]) if len(parts) > 2 else default.retries)
+    except (ValueError, IndexError):
+        return default
+
+
+class DeadlineTracker:
+    """Endpoint budgets, the tool deadline and per-endpoint / per-tool outcome counters."""
+
+    def __init__(self, tool_deadline: Optional[float] = None, budgets: Optional[Dict[str, Budget]] = None):
+        self.tool_deadline = (
+            tool_deadline if tool_deadline is not None else float(os.getenv("QQM_TOOL_DEADLINE", "8"))
+        )
+        if budgets is None:
+            budgets = {name: _env_budget(name, budget) for name, budget in BUDGETS.items()}
+        self.budgets = budgets
+        self._endpoints: Dict[str, _EndpointStats] = {}
+        self._tools: Dict[str, _EndpointStats] = {}
+
+    def budget(self, endpoint: Optional[str]) -> Budget:
+        return self.budgets.get(endpoint, DEFAULT_BUDGET) if endpoint else DEFAULT_BUDGET
+
+    def timeout(self, endpoint: Optional[str]) -> Any:
+        """The ``httpx`` timeout for a request to ``endpoint`` now: its budget, clipped to the deadline.
+
+        Requests without an endpoint outside any deadline keep the client's default.
+        """
+        import httpx
+
+        left = remaining()
+        if endpoint is None and left is None:
+            return httpx.USE_CLIENT_DEFAULT
+        budget = self.budget(endpoint)
+        if left is None:
+            return httpx.Timeout(budget.read, connect=budget.connect)
+        left = max(left, 0.001)
+        return httpx.Timeout(min(budget.read, left), connect=min(budget.connect, left), pool=left)
+
+    def can_retry(self, endpoint: Optional[str], attempt: int) -> bool:
+        """Whether attempt number ``attempt`` (1 for the first retry) fits the budget and the deadline."""
+        budget = self.budget(endpoint)
+        left = remaining()
+        return attempt <= budget.retries and (left is None or left > budget.connect)
+
+    def http_timeout(self, endpoint: Optional[str], exc: "httpx.TimeoutException") -> "DeadlineExceeded":
+        """Translate an ``httpx`` timeout into a :class:`DeadlineExceeded` naming its stage."""
+        import httpx
+
+        stage = next((name for kind, name in _HTTPX_STAGES if isinstance(exc, getattr(httpx, kind))), "http")
+        enter(stage, endpoint)
+        current = _SCOPE.get()
+        left = remaining()
+        if current is not None and left is not None and left <= 0.01:
+            return _expired(current)
+        self.record(endpoint, "timeout", stage)
+        budget = self.budget(endpoint)
+        limit = budget.connect if stage == "connect" else budget.read
+        return _exceeded_type()(stage, endpoint, f"{endpoint or 'request'}: {stage} timed out after {limit:g}s budget")
+
+    def _stats(self, table: Dict[str, _EndpointStats], name: Optional[str]) -> _EndpointStats:
+        key = name or "default"
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = _EndpointStats()
+        return stats
+
+    def record(self, endpoint: Optional[str], outcome: str, stage: Optional[str] = None,
+               seconds: Optional[float] = None) -> None:
+        """Count an ``ok`` / ``error`` / ``retry`` / ``timeout`` (at ``stage``) for ``endpoint``."""
+        self._count(self._stats(self._endpoints, endpoint), outcome, stage, seconds)
+
+    def record_tool(self, tool: str, outcome: str, stage: Optional[str] = None,
+                    seconds: Optional[float] = None) -> None:
+        self._count(self._stats(self._tools, tool), outcome, stage, seconds)
+
+    @staticmethod
+    def _count(stats: _EndpointStats, outcome: str, stage: Optional[str], seconds: Optional[float]) -> None:
+        if outcome == "ok":
+            stats.ok += 1
+        elif outcome == "retry":
+            stats.retries += 1
+        elif outcome == "timeout":
+            stats.timeouts[stage or "unknown"] = stats.timeouts.get(stage or "unknown", 0) + 1
+        else:
+            stats.errors += 1
+        if seconds is not None:
+            stats.latency.add(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tool_deadline": self.tool_deadline,
+            "budgets": {name: budget._asdict() for name, budget in self.budgets.items()},
+            "endpoints": {name: stats.snapshot() for name, stats in self._endpoints.items()},
+            "tools": {name: stats.snapshot() for name, stats in self._tools.items()},
+        }
+
+
+_TRACKER: Optional[DeadlineTracker] = None
+
+
+def get_tracker() -> DeadlineTracker:
+    """Return the process-wide :class:`DeadlineTracker`."""
+    global _TRACKER
+    if _TRACKER is None:
+        _TRACKER = DeadlineTracker()
+    return _TRACKER
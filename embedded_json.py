@@ -0,0 +1,149 @@
+"""
+Streaming extraction of the JSON state embedded in QQ Music HTML pages.
+
+Several pages (playlist, category, radio, album, toplist share pages and
+``playsong.html``) carry their data as a JS literal assigned in a ``<script>``:
+``window.__INITIAL_DATA__ = {...}``, ``firstPageData = {...}`` or
+``__ssrFirstPageData__ ={...}``. :func:`fetch_embedded_json` reads the page
+incrementally, finds the assignment and stops reading once its script element
+is closed, instead of downloading and regex-scanning the whole page. The literal
+is decoded as JSON up to its closing bracket; if it is not plain JSON, JS-only
+tokens (``undefined``, ``void 0``, single-quoted strings, bare keys) are
+rewritten outside of string values first, so text that merely contains the
+word ``undefined`` is left intact.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Dict, Optional
+
+__all__ = ["INITIAL_DATA", "FIRST_PAGE_DATA", "SSR_FIRST_PAGE_DATA", "extract", "fetch_embedded_json", "parse_js_literal"]
+
+INITIAL_DATA = "window.__INITIAL_DATA__"
+FIRST_PAGE_DATA = "firstPageData"
+SSR_FIRST_PAGE_DATA = "__ssrFirstPageData__"
+
+# After the literal ends, read at most this much more so the pooled connection can
+# be reused; longer tails are abandoned and the connection is closed instead.
+DRAIN_LIMIT = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+_SCRIPT_END = "</script>"
+_UNESCAPED_QUOTE = re.compile(r'(?<!\\)(?:\\\\)*"')
+_JS_TOKENS = re.compile(
+    r'"[^"\\]*(?:\\.[^"\\]*)*"'
+    r"|'([^'\\]*(?:\\.[^'\\]*)*)'"
+    r"|(?<=[{,])(\s*)([A-Za-z_$][\w$]*)(?=\s*:)"
+    r"|\b(?:undefined|void 0)\b",
+    re.DOTALL,
+)
+
+
+def _quotes(text: str, start: int, end: int) -> int:
+    """Number of unescaped double quotes in ``text[start:end]``."""
+    count = text.count('"', start, end)
+    if count and text.find("\\", start, end) >= 0:
+        count = len(_UNESCAPED_QUOTE.findall(text, start, end))
+    return count
+
+
+def _word_char(text: str, index: int) -> bool:
+    return 0 <= index < len(text) and (text[index].isalnum() or text[index] in "_$")
+
+
+def _replace_undefined(text: str) -> str:
+    # Fast path for the usual case: the only JS-ism is ``undefined`` values.
+    parts = []
+    copied = checked = 0
+    inside = False
+    position = text.find("undefined")
+    while position >= 0:
+        inside ^= bool(_quotes(text, checked, position) & 1)
+        checked = position
+        end = position + len("undefined")
+        if not inside and not _word_char(text, position - 1) and not _word_char(text, end):
+            parts += (text[copied:position], "null")
+            copied = end
+        position = text.find("undefined", end)
+    parts.append(text[copied:])
+    return "".join(parts)
+
+
+def _requote(match: "re.Match") -> str:
+    if match.group(0) == '"':
+        return '\\"'
+    return "'" if match.group(1) == "'" else match.group(0)
+
+
+def _js_token(match: "re.Match") -> str:
+    token = match.group(0)
+    if token[0] == '"':
+        return token
+    if match.group(1) is not None:
+        # Single-quoted string: unescape \' and escape bare double quotes.
+        return '"' + re.sub(r'\\(.)|"', _requote, match.group(1), flags=re.DOTALL) + '"'
+    if match.group(3) is not None:
+        return match.group(2) + '"' + match.group(3) + '"'
+    return "null"
+
+
+def parse_js_literal(text: str) -> Any:
+    """Parse the object/array literal at the start of ``text``, ignoring any code after it.
+
+    JSON is decoded directly; JSON plus common JS-only tokens is rewritten first.
+    """
+    text = text.lstrip()
+    try:
+        return _DECODER.raw_decode(text)[0]
+    except json.JSONDecodeError:
+        pass
+    try:
+        return _DECODER.raw_decode(_replace_undefined(text))[0]
+    except json.JSONDecodeError:
+        return _DECODER.raw_decode(_JS_TOKENS.sub(_js_token, text))[0]
+
+
+async def extract(chunks: AsyncIterator[bytes], marker: str) -> Any:
+    """Parse the literal assigned to ``marker`` in a UTF-8 HTML stream, reading no further than its script.
+
+    An inline script cannot contain ``</script>``, so the first one after the
+    assignment bounds the literal. Raises ``LookupError`` if the stream ends first.
+    """
+    assignment = re.compile(re.escape(marker) + r"\s*=\s*(?=[{\[])")
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    start = searched = -1
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        if start < 0:
+            match = assignment.search(buffer)
+            if match is None:
+                # Keep enough to match a marker split across chunks.
+                buffer = buffer[-(len(marker) + 64):]
+                continue
+            start = searched = match.end()
+        close = buffer.find(_SCRIPT_END, searched)
+        if close >= 0:
+            return parse_js_literal(buffer[start:close])
+        searched = max(start, len(buffer) - len(_SCRIPT_END))
+    raise LookupError(f"no complete {marker} assignment in page")
+
+
+async def fetch_embedded_json(
+    url: str, marker: str, cookies: Optional[Dict[str, str]] = None, endpoint: str = "page", **kwargs: Any
+) -> Any:
+    """GET ``url`` and return the literal assigned to ``marker``, or ``None`` for a non-200 answer."""
+    import http_transport
+
+    async with http_transport.get_transport().stream("GET", url, cookies=cookies, endpoint=endpoint, **kwargs) as response:
+        if response.status_code != 200:
+            return None
+        chunks = response.aiter_bytes()
+        value = await extract(chunks, marker)
+        drained = 0
+        async for chunk in chunks:
+            drained += len(chunk)
+            if drained > DRAIN_LIMIT:
+                break
+        return value
@@ -5,7 +5,6 @@ MCP tools for file search, file metadata, UPnP discovery, and playback.
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import os
 from pathlib import Path
@@ -23,6 +22,9 @@ from async_upnp_client.client_factory import UpnpFactory
 from async_upnp_client.profiles.dlna import DmrDevice
 from async_upnp_client.search import async_search
 
+import http_transport
+import json_codec
+
 __all__ = [
     "build_manifest",
     "manifest",
@@ -95,22 +97,26 @@ class UpnpClientInfo(BaseModel):
     udn: str = Field(description="Unique device name (UDN).")
     st: str = Field(description="Search target (ST) reported by SSDP.")
 
-manifest = FastMCP(name=MANIFEST_NAME, instructions=MANIFEST_DESCRIPTION)
+manifest = FastMCP(
+    name=MANIFEST_NAME,
+    instructions=MANIFEST_DESCRIPTION,
+    lifespan=http_transport.warmup_lifespan([API_BASE]),
+)
 
 
 def _read_token() -> Optional[str]:
     if not TOKEN_PATH.exists():
         return None
     try:
-        data = json.loads(TOKEN_PATH.read_text())
-    except json.JSONDecodeError:
+        data = json_codec.loads(TOKEN_PATH.read_text())
+    except json_codec.JSONDecodeError:
         return None
     token = data.get("token") if isinstance(data, dict) else None
     return token if token else None
 
 
 def _save_token(token: str) -> None:
-    TOKEN_PATH.write_text(json.dumps({"token": token}, ensure_ascii=False))
+    TOKEN_PATH.write_text(json_codec.dumps({"token": token}, ensure_ascii=False))
     try:
         os.chmod(TOKEN_PATH, 0o600)
     except OSError:
@@ -144,13 +150,18 @@ def _redact_mapping(data: Dict[str, Any]) -> Dict[str, Any]:
     return redacted
 
 
+def _api_client() -> httpx.AsyncClient:
+    """Pooled client for ``XZM_API_BASE`` shared across tool calls."""
+    return http_transport.get_transport().client(API_BASE, timeout=30)
+
+
 async def _login(client: httpx.AsyncClient) -> str:
     payload = {"username": DEFAULT_USERNAME, "password": DEFAULT_PASSWORD}
     logger.info("POST %s%s payload=%s", API_BASE, API_LOGIN, _redact_mapping(payload))
     response = await client.post(API_LOGIN, json=payload)
     logger.info("RESP %s%s status=%s", API_BASE, API_LOGIN, response.status_code)
     response.raise_for_status()
-    data = response.json()
+    data = json_codec.loads(response.content)
     logger.info("RESP %s%s body=%s", API_BASE, API_LOGIN, _redact_value(data))
     if data.get("code") != 200:
         message = data.get("message", "login failed")
@@ -171,7 +182,7 @@ async def _authorized_post(client: httpx.AsyncClient, endpoint: str, payload: Di
     response = await client.post(endpoint, json=payload, headers=headers)
     logger.info("RESP %s%s status=%s", API_BASE, endpoint, response.status_code)
     response.raise_for_status()
-    data = response.json()
+    data = json_codec.loads(response.content)
     logger.info("RESP %s%s body=%s", API_BASE, endpoint, _redact_value(data))
     if data.get("code") == 401:
         token = await _login(client)
@@ -180,7 +191,7 @@ async def _authorized_post(client: httpx.AsyncClient, endpoint: str, payload: Di
         response = await client.post(endpoint, json=payload, headers=headers)
         logger.info("RESP %s%s status=%s", API_BASE, endpoint, response.status_code)
         response.raise_for_status()
-        data = response.json()
+        data = json_codec.loads(response.content)
         logger.info("RESP %s%s body=%s", API_BASE, endpoint, _redact_value(data))
     return data
 
@@ -210,17 +221,17 @@ async def search_files(
         "per_page": max(per_page, 1),
     }
 
-    async with httpx.AsyncClient(base_url=API_BASE, timeout=30) as client:
-        data = {}
-        for idx in range(len(terms), 0, -1):
-            payload["keywords"] = " ".join(terms[:idx])
-            data = await _authorized_post(client, API_SEARCH, payload)
-            if data.get("code") != 200:
-                message = data.get("message", "search failed")
-                raise RuntimeError(f"search failed: {message}")
-            content = data.get("data", {}).get("content", [])
-            if content:
-                break
+    client = _api_client()
+    data = {}
+    for idx in range(len(terms), 0, -1):
+        payload["keywords"] = " ".join(terms[:idx])
+        data = await _authorized_post(client, API_SEARCH, payload)
+        if data.get("code") != 200:
+            message = data.get("message", "search failed")
+            raise RuntimeError(f"search failed: {message}")
+        content = data.get("data", {}).get("content", [])
+        if content:
+            break
 
     content = data.get("data", {}).get("content", [])
     results = []
@@ -244,8 +255,7 @@ async def get_file_info(
         raise ValueError("path or parent+name is required for get_file_info")
 
     payload = {"path": resolved_path, "password": password}
-    async with httpx.AsyncClient(base_url=API_BASE, timeout=30) as client:
-        data = await _authorized_post(client, API_GET, payload)
+    data = await _authorized_post(_api_client(), API_GET, payload)
 
     if data.get("code") != 200:
         message = data.get("message", "get file info failed")
@@ -364,7 +374,7 @@ def build_manifest(manifest_path: Path | str = "file_upnp_mcp_manifest.json") ->
     }
 
     path = Path(manifest_path)
-    path.write_text(json.dumps(manifest_content, ensure_ascii=False, indent=2))
+    path.write_text(json_codec.dumps(manifest_content, ensure_ascii=False, indent=2))
 
 
 def main() -> None:
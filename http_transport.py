@@ -0,0 +1,406 @@
+"""
+Shared outbound HTTP transport for the QQ Music clients and the file API tools.
+
+Every upstream origin (u.y.qq.com, shc.y.qq.com, c.y.qq.com, ``XZM_API_BASE`` ...)
+gets one long-lived ``httpx.AsyncClient`` with its own keep-alive pool, so
+repeated calls reuse TCP/TLS connections instead of handshaking every time.
+HTTP/2 is used when the optional ``h2`` package is installed.
+
+Configuration (environment):
+
+- ``XZM_HTTP2``: ``auto`` (default, on when ``h2`` is importable), ``1`` or ``0``
+- ``XZM_HTTP_MAX_CONNECTIONS`` / ``XZM_HTTP_MAX_KEEPALIVE``: pool limits per origin
+- ``XZM_HTTP_KEEPALIVE_EXPIRY``: idle seconds before a pooled connection is dropped
+- ``XZM_HTTP_WARMUP``: ``1`` to pre-connect the default QQ Music hosts at startup,
+  or a comma-separated list of origins
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import deadline
+import rate_limit
+from metrics import LatencyWindow, ratio
+
+__all__ = [
+    "HttpTransport",
+    "get_transport",
+    "warmup_lifespan",
+    "warmup_origins_from_env",
+    "DEFAULT_WARMUP_ORIGINS",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP_ORIGINS = (
+    "https://u.y.qq.com",
+    "https://u6.y.qq.com",
+    "https://shc.y.qq.com",
+    "https://c.y.qq.com",
+    "https://i.y.qq.com",
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _http2_enabled() -> bool:
+    setting = os.getenv("XZM_HTTP2", "auto").strip().lower()
+    if setting in ("0", "false", "no", "off"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if setting != "auto":
+            logger.warning("XZM_HTTP2=%s but the h2 package is not installed; using HTTP/1.1", setting)
+        return False
+    return True
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _cookie_header(cookies: Dict[str, str]) -> str:
+    return "; ".join(f"{key}={value}" for key, value in cookies.items())
+
+
+def _account(cookies: Optional[Dict[str, str]]) -> Optional[str]:
+    """The account (uin) a request is sent as, so each account is paced on its own."""
+    return (cookies or {}).get("uin") or None
+
+
+def _report(limiter: "rate_limit.RateLimiter", url: str, response: httpx.Response, account: Optional[str]) -> None:
+    """Feed a buffered answer to the limiter, classified by HTTP status and, for a 200, its business code."""
+    if response.status_code == 429 or (response.status_code == 200 and rate_limit.throttled_body(response.content)):
+        limiter.throttled(url, account)
+    elif response.status_code < 500:
+        limiter.success(url, account)
+
+
+def _stage_trace(endpoint: Optional[str]):
+    """httpcore trace callback that keeps the deadline stage in step with the request."""
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if not event_name.endswith(".started"):
+            return
+        if "send_request" in event_name:
+            deadline.enter("write", endpoint)
+        elif "receive_response" in event_name:
+            deadline.enter("read", endpoint)
+
+    return trace
+
+
+class _HostStats:
+    """Counters for one origin's connection pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.pool_hits = 0
+        self.tcp_connects = 0
+        self.tls_handshakes = 0
+        self.errors = 0
+        self.latency = LatencyWindow()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "pool_hits": self.pool_hits,
+            "pool_hit_rate": ratio(self.pool_hits, self.requests),
+            "tcp_connects": self.tcp_connects,
+            "tls_handshakes": self.tls_handshakes,
+            "errors": self.errors,
+            **self.latency.snapshot(),
+        }
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to count handshakes, pool reuse and latency."""
+
+    def __init__(self, stats: _HostStats, **kwargs: Any):
+        self._stats = stats
+        self._inner = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        connected = False
+        outer_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            nonlocal connected
+            if event_name == "connection.connect_tcp.complete":
+                connected = True
+                stats.tcp_connects += 1
+            elif event_name == "connection.start_tls.complete":
+                stats.tls_handshakes += 1
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        started = time.perf_counter()
+        stats.requests += 1
+        try:
+            response = await self._inner.handle_async_request(request)
+        except Exception:
+            stats.errors += 1
+            raise
+        stats.latency.add(time.perf_counter() - started)
+        if not connected:
+            stats.pool_hits += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class HttpTransport:
+    """Per-origin pooled ``httpx.AsyncClient`` instances shared by the whole process."""
+
+    def __init__(
+        self,
+        http2: Optional[bool] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+    ):
+        self.http2 = _http2_enabled() if http2 is None else http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections or _env_int("XZM_HTTP_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=max_keepalive or _env_int("XZM_HTTP_MAX_KEEPALIVE", 10),
+            keepalive_expiry=keepalive_expiry or _env_float("XZM_HTTP_KEEPALIVE_EXPIRY", 30.0),
+        )
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, _HostStats] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def client(self, base_url: str, **client_kwargs: Any) -> httpx.AsyncClient:
+        """Return the pooled client for ``base_url``, creating it on first use.
+
+        ``client_kwargs`` (e.g. ``timeout``) only apply when the client is created.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Pools are bound to the loop that opened them; start fresh on a new loop.
+            self._clients = {}
+            self._loop = loop
+        key = base_url.rstrip("/")
+        client = self._clients.get(key)
+        if client is None:
+            stats = self._stats.setdefault(_origin(key), _HostStats())
+            transport = _InstrumentedTransport(stats, http2=self.http2, limits=self.limits)
+            # Cookies are sent per request; never persist Set-Cookie across callers.
+            jar = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+            client = httpx.AsyncClient(
+                base_url=key,
+                transport=transport,
+                http2=self.http2,
+                cookies=jar,
+                **client_kwargs,
+            )
+            self._clients[key] = client
+        return client
+
+    @staticmethod
+    def _with_cookies(kwargs: Dict[str, Any], cookies: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        if cookies:
+            headers = dict(kwargs.pop("headers", None) or {})
+            headers["Cookie"] = _cookie_header(cookies)
+            kwargs["headers"] = headers
+        return kwargs
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        cookies: Optional[Dict[str, str]] = None,
+        endpoint: Optional[str] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Send a request over the pool for ``url``'s origin; ``cookies`` become a Cookie header.
+
+        ``endpoint`` names the timeout budget (see :mod:`deadline`); timeouts of an
+        endpoint with retries are retried while the caller's deadline allows.
+        """
+        account = _account(cookies)
+        kwargs = self._with_cookies(kwargs, cookies)
+        tracker = deadline.get_tracker()
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(method, url, endpoint, account, kwargs)
+            except deadline.DeadlineExceeded:
+                raise
+            except (httpx.TimeoutException, httpx.ConnectError) as exc:
+                attempt += 1
+                if tracker.can_retry(endpoint, attempt):
+                    tracker.record(endpoint, "retry")
+                    continue
+                if isinstance(exc, httpx.TimeoutException):
+                    raise tracker.http_timeout(endpoint, exc) from exc
+                tracker.record(endpoint, "error")
+                raise
+            except httpx.HTTPError:
+                tracker.record(endpoint, "error")
+                raise
+            tracker.record(endpoint, "ok", seconds=time.perf_counter() - started)
+            deadline.enter("parse", endpoint)
+            return response
+
+    async def _send(
+        self, method: str, url: str, endpoint: Optional[str], account: Optional[str], kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        limiter = rate_limit.get_limiter()
+        deadline.check("queue", endpoint)
+        await limiter.acquire(url, account)
+        deadline.check("connect", endpoint)
+        options = dict(kwargs)
+        timeout = options.pop("timeout", None) or deadline.get_tracker().timeout(endpoint)
+        response = await self.client(_origin(url)).request(
+            method.upper(), url, timeout=timeout, extensions={"trace": _stage_trace(endpoint)}, **options
+        )
+        _report(limiter, url, response, account)
+        return response
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        cookies: Optional[Dict[str, str]] = None,
+        endpoint: Optional[str] = None,
+        **kwargs: Any,
+    ):
+        """Like :meth:`request`, but the response body is read incrementally (``aiter_bytes``).
+
+        Only the caller sees the body: to report a throttled answer it raises an
+        exception whose ``code`` is :data:`rate_limit.THROTTLED` (such as
+        ``qqmusic_batch.MusicuError``) out of the ``async with`` block.
+        """
+        account = _account(cookies)
+        kwargs = self._with_cookies(kwargs, cookies)
+        tracker = deadline.get_tracker()
+        limiter = rate_limit.get_limiter()
+        deadline.check("queue", endpoint)
+        await limiter.acquire(url, account)
+        deadline.check("connect", endpoint)
+        started = time.perf_counter()
+        try:
+            async with self.client(_origin(url)).stream(
+                method.upper(), url, timeout=tracker.timeout(endpoint), extensions={"trace": _stage_trace(endpoint)}, **kwargs
+            ) as response:
+                if response.status_code == 429:
+                    limiter.throttled(url, account)
+                deadline.enter("read", endpoint)
+                yield response
+        except deadline.DeadlineExceeded:
+            raise
+        except httpx.TimeoutException as exc:
+            raise tracker.http_timeout(endpoint, exc) from exc
+        except Exception as exc:
+            if getattr(exc, "code", None) == rate_limit.THROTTLED:
+                limiter.throttled(url, account)
+            tracker.record(endpoint, "error")
+            raise
+        # The body was only seen by the caller: count a success once it was consumed without error.
+        if response.status_code < 400:
+            limiter.success(url, account)
+        tracker.record(endpoint, "ok", seconds=time.perf_counter() - started)
+
+    async def warm_up(self, origins: Iterable[str] = DEFAULT_WARMUP_ORIGINS, timeout: float = 5.0) -> Dict[str, Optional[float]]:
+        """Resolve DNS and complete TCP/TLS for ``origins`` so the first real call reuses a pooled connection."""
+
+        async def _warm(origin: str) -> Optional[float]:
+            started = time.perf_counter()
+            try:
+                await self.client(origin).head(origin + "/", timeout=timeout)
+            except httpx.HTTPError as exc:
+                logger.info("warm-up of %s failed: %s", origin, exc)
+                return None
+            return time.perf_counter() - started
+
+        origins = [origin.rstrip("/") for origin in origins]
+        results = await asyncio.gather(*(_warm(origin) for origin in origins))
+        return dict(zip(origins, results))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+            },
+            "hosts": {origin: stats.snapshot() for origin, stats in self._stats.items()},
+        }
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+def warmup_origins_from_env(defaults: Iterable[str] = DEFAULT_WARMUP_ORIGINS) -> list:
+    """Origins listed by ``XZM_HTTP_WARMUP`` (``1`` means ``defaults``)."""
+    setting = os.getenv("XZM_HTTP_WARMUP", "").strip()
+    if not setting or setting.lower() in ("0", "false", "no", "off"):
+        return []
+    if setting.lower() in ("1", "true", "yes", "on"):
+        return list(defaults)
+    return [origin.strip() for origin in setting.split(",") if origin.strip()]
+
+
+def warmup_lifespan(defaults: Iterable[str] = DEFAULT_WARMUP_ORIGINS):
+    """Build a FastMCP ``lifespan`` that warms the pools in the background and closes them on exit."""
+
+    @asynccontextmanager
+    async def lifespan(server):
+        global _LIFESPANS
+        origins = warmup_origins_from_env(defaults)
+        task = asyncio.create_task(get_transport().warm_up(origins)) if origins else None
+        _LIFESPANS += 1
+        try:
+            yield {}
+        finally:
+            _LIFESPANS -= 1
+            if task is not None:
+                task.cancel()
+            # Servers hosted in one process share the transport: the last one out closes it.
+            if _LIFESPANS == 0:
+                await get_transport().aclose()
+
+    return lifespan
+
+
+_TRANSPORT: Optional[HttpTransport] = None
+# Server lifespans from warmup_lifespan() currently open in this process
+_LIFESPANS = 0
+
+
+def get_transport() -> HttpTransport:
+    """Return the process-wide :class:`HttpTransport`."""
+    global _TRANSPORT
+    if _TRANSPORT is None:
+        _TRANSPORT = HttpTransport()
+    return _TRANSPORT
@@ -0,0 +1,105 @@
+"""
+The JSON codec every module goes through, with an optional fast backend.
+
+:func:`loads` and :func:`dumps` use `orjson <https://github.com/ijl/orjson>`_ when
+it is installed and the standard library otherwise. Whichever backend runs:
+
+- :func:`dumps` returns what ``json.dumps`` returns for the same arguments.
+  orjson is only used for compact output (``separators=(",", ":")``, which is
+  what signed request bodies use); output it would write differently (non-string
+  keys, integers beyond 64 bits, floats between 1e-9 and 1e-4, non-ASCII or DEL
+  characters under ``ensure_ascii``) is encoded by the standard library
+  instead. NaN and infinities, which ``json.dumps`` writes as invalid JSON,
+  come out as ``null``.
+- :func:`loads` accepts ``str`` or ``bytes`` (so ``loads(response.content)`` skips
+  decoding the body to text) and raises ``json.JSONDecodeError`` on bad input.
+
+Streaming decoders (:mod:`json_stream`, :mod:`embedded_json`) keep using
+``json.JSONDecoder.raw_decode``, which orjson has no equivalent for.
+
+Configuration (environment):
+
+- ``XZM_FAST_JSON``: ``auto`` (default) uses orjson if installed, ``0`` always
+  uses the standard library
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Optional, Tuple
+
+__all__ = ["COMPACT", "JSONDecodeError", "backend", "dumps", "loads", "stats"]
+
+logger = logging.getLogger(__name__)
+
+COMPACT = (",", ":")
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def _load_orjson():
+    setting = os.getenv("XZM_FAST_JSON", "auto").strip().lower()
+    if setting in ("0", "false", "no", "off"):
+        return None
+    try:
+        import orjson
+    except ImportError:
+        if setting != "auto":
+            logger.warning("XZM_FAST_JSON=%s but the orjson package is not installed; using json", setting)
+        return None
+    return orjson
+
+
+_orjson = _load_orjson()
+_fallbacks = 0
+# How orjson writes floats in [1e-9, 1e-4), which json writes as e.g. ``1e-05``. A
+# match inside a string only costs a fallback.
+_SMALL_FLOAT = re.compile(rb"0\.0000|e-\d(?!\d)")
+
+
+def backend() -> str:
+    return "orjson" if _orjson is not None else "json"
+
+
+def loads(data: Any) -> Any:
+    """Decode a JSON document from ``str``, ``bytes`` or ``bytearray``."""
+    if _orjson is not None:
+        try:
+            return _orjson.loads(data)
+        except _orjson.JSONDecodeError:
+            pass  # Let json report it (or accept NaN/Infinity, which orjson rejects).
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8")
+    return json.loads(data)
+
+
+def dumps(
+    value: Any,
+    *,
+    ensure_ascii: bool = True,
+    separators: Optional[Tuple[str, str]] = None,
+    sort_keys: bool = False,
+    indent: Optional[int] = None,
+) -> str:
+    """Encode ``value`` like ``json.dumps`` with the same arguments."""
+    global _fallbacks
+    if _orjson is not None and tuple(separators or ()) == COMPACT and indent is None:
+        try:
+            encoded = _orjson.dumps(value, option=_orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            encoded = None  # Non-string keys, big integers or unsupported types.
+        # orjson never escapes non-ASCII (nor DEL, which ensure_ascii writes as \u007f);
+        # an ASCII result without DEL is what ensure_ascii would give too.
+        if (
+            encoded is not None
+            and (not ensure_ascii or (encoded.isascii() and b"\x7f" not in encoded))
+            and not _SMALL_FLOAT.search(encoded)
+        ):
+            return encoded.decode("utf-8")
+        _fallbacks += 1
+    return json.dumps(value, ensure_ascii=ensure_ascii, separators=separators, sort_keys=sort_keys, indent=indent)
+
+
+def stats() -> Dict[str, Any]:
+    return {"backend": backend(), "fallbacks": _fallbacks}
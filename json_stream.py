@@ -0,0 +1,85 @@
+"""
+Incremental decoding of one large array inside a JSON response.
+
+Playlist and toplist responses carry hundreds of full track objects, of which
+callers only need a few fields. :func:`iter_array` reads the body chunk by chunk,
+finds the array stored under a given key and decodes its elements one at a time,
+so only the current element and the unread tail of the body are ever held in
+memory; everything around the array is skipped without being parsed.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List
+
+__all__ = ["iter_array", "project_song", "SONG_FIELDS"]
+
+SONG_FIELDS = ("mid", "name", "singer", "album", "interval")
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# Enough to keep a key and its ``": ["`` if they straddle two chunks.
+_KEY_OVERLAP = 256
+
+
+async def iter_array(chunks: AsyncIterable[bytes], key: str, required: bool = False) -> AsyncIterator[Any]:
+    """Yield the elements of the first array stored under ``"key"`` in a UTF-8 JSON stream.
+
+    Elements must be objects or arrays (as track lists are), so an element cut off
+    at a chunk boundary never decodes early. Nothing is yielded when the key does
+    not occur, or ``KeyError`` is raised with ``required``; a body that ends inside
+    the array raises ``ValueError``.
+    """
+    # A quote cannot appear unescaped inside a JSON string, so this only matches real keys.
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = -1  # Index just past ``[`` once the array has been found.
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        if position < 0:
+            match = start.search(buffer)
+            if match is None:
+                buffer = buffer[-_KEY_OVERLAP:]
+                continue
+            position = match.end()
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer) and buffer[position] == ",":
+                position += 1
+                continue
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                element, position = _DECODER.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # Incomplete element: wait for the next chunk.
+            yield element
+        buffer = buffer[position:]
+        position = 0
+    if position >= 0:
+        raise ValueError(f"JSON body ended inside the {key!r} array")
+    if required:
+        raise KeyError(key)
+
+
+def _names(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [item.get("name", "") for item in value if isinstance(item, dict)]
+    return [value] if isinstance(value, str) and value else []
+
+
+def project_song(track: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a full track object to ``SONG_FIELDS`` (singers joined with ``/``)."""
+    album = track.get("album")
+    return {
+        "mid": track.get("mid") or track.get("songmid", ""),
+        "name": track.get("name") or track.get("songname") or track.get("title", ""),
+        "singer": "/".join(_names(track.get("singer"))),
+        "album": album.get("name", "") if isinstance(album, dict) else track.get("albumname", ""),
+        "interval": track.get("interval", 0),
+    }
@@ -0,0 +1,342 @@
+"""
+Local inverted index over fetched lyrics, for answering lyric searches offline.
+
+Every lyric text fetched through ``QQ_Music.get_lyrics`` is decoded from LRC,
+normalised like search queries and split into overlapping character bigrams,
+which works for Chinese without word segmentation. A query matches a song by
+the fraction of its bigrams found in that song; ``search`` only returns songs
+above ``min_score``, so low-confidence queries still go to the remote search.
+Songs are only answered locally once a remote search has filled in their
+songid, duration and album (see :meth:`LyricsIndex.add_meta`).
+
+The index lives in memory. On first use it is rebuilt in a worker thread from the
+lyrics already persisted by :mod:`metadata_store`; until that finishes every
+query falls back to the remote search.
+
+Configuration (environment):
+
+- ``QQM_LYRICS_INDEX``: ``0`` to disable local lyric search
+- ``QQM_LYRICS_INDEX_MIN_SCORE``: minimum bigram coverage for a local answer (default 0.85)
+- ``QQM_LYRICS_INDEX_MAX_SONGS``: stop indexing new songs past this count (default 200000)
+"""
+
+import html
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from search_cache import normalize_query
+
+__all__ = ["LyricsIndex", "decode_lrc", "get_lyrics_index"]
+
+logger = logging.getLogger(__name__)
+
+_TIMESTAMP = re.compile(r"\[\d+:\d+(?:[.:]\d+)?\]")
+_TAG = re.compile(r"^\[(ti|ar|al|by|offset|kana):(.*)\]$", re.IGNORECASE)
+_TAG_FIELDS = {"ti": "songname", "ar": "singer", "al": "albumname"}
+# Queries shorter than this many bigrams are too ambiguous to answer locally.
+MIN_QUERY_GRAMS = 3
+# Fields only a search result supplies (the LRC tags give name, singer and album);
+# songs indexed from lyrics alone lack them and are not answered locally.
+SEARCH_FIELDS = ("songid", "interval", "albummid")
+# Songs added since the last merge before the delta is folded into the segment
+# (or as many as the segment already holds, whichever is larger, so merges stay amortised).
+COMPACT_MIN_SONGS = 2000
+
+
+def decode_lrc(lrc: str) -> Tuple[List[str], Dict[str, str]]:
+    """Split LRC text into lyric lines and its ``ti``/``ar``/``al`` tags."""
+    lines = []
+    tags = {}
+    for raw in html.unescape(lrc).splitlines():
+        raw = raw.strip()
+        tag = _TAG.match(raw)
+        if tag:
+            field = _TAG_FIELDS.get(tag.group(1).lower())
+            if field and tag.group(2).strip():
+                tags[field] = tag.group(2).strip()
+            continue
+        text = _TIMESTAMP.sub("", raw).strip()
+        if text:
+            lines.append(text)
+    return lines, tags
+
+
+def _grams(text: str) -> set:
+    """Character bigrams of the normalised ``text``, packed as ints (two code points < 2**21)."""
+    text = normalize_query(text).replace(" ", "")
+    if len(text) < 2:
+        return {ord(text)} if text else set()
+    codes = list(map(ord, text))
+    return {codes[i] << 21 | codes[i + 1] for i in range(len(codes) - 1)}
+
+
+def _size(bucket: Union[int, array, None]) -> int:
+    if bucket is None:
+        return 0
+    return 1 if isinstance(bucket, int) else len(bucket)
+
+
+class _Segment:
+    """Frozen postings: sorted gram keys, each gram's doc ids at ``docs[offsets[i]:offsets[i + 1]]``."""
+
+    __slots__ = ("keys", "offsets", "docs", "songs")
+
+    def __init__(self):
+        self.keys = array("Q")
+        self.offsets = array("Q", (0,))
+        self.docs = array("I")
+        # Doc ids below this live in the segment, the rest in the mutable delta.
+        self.songs = 0
+
+    def span(self, gram: int) -> Optional[Tuple[int, int]]:
+        index = bisect_left(self.keys, gram)
+        if index < len(self.keys) and self.keys[index] == gram:
+            return self.offsets[index], self.offsets[index + 1]
+        return None
+
+    def nbytes(self) -> int:
+        return sum(part.itemsize * len(part) for part in (self.keys, self.offsets, self.docs))
+
+
+class LyricsIndex:
+    """Character-bigram inverted index keyed by songmid.
+
+    New songs go to a small mutable delta (bigram -> doc id, or an array of ids once
+    a bigram is shared); the delta is periodically merged into a compact, immutable
+    segment of flat arrays, which keeps large indexes at a few bytes per posting.
+    """
+
+    def __init__(self, min_score: Optional[float] = None, max_songs: Optional[int] = None):
+        self.min_score = min_score if min_score is not None else float(os.getenv("QQM_LYRICS_INDEX_MIN_SCORE", "0.85"))
+        self.max_songs = max_songs or int(os.getenv("QQM_LYRICS_INDEX_MAX_SONGS", "200000"))
+        self.enabled = os.getenv("QQM_LYRICS_INDEX", "1") != "0"
+        self._segment = _Segment()
+        self._delta: Dict[int, Union[int, array]] = {}
+        self._songmids: List[str] = []
+        self._docs: Dict[str, int] = {}
+        self._meta: List[Dict[str, Any]] = []
+        self._loaded = False
+        self._loader: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.build_seconds = 0.0
+        self.compactions = 0
+        self.queries = 0
+        self.local_answers = 0
+        self.incomplete = 0
+
+    def __len__(self) -> int:
+        return len(self._songmids)
+
+    def __contains__(self, songmid: str) -> bool:
+        return songmid in self._docs
+
+    def add(self, songmid: str, lrc: str, meta: Optional[Dict[str, Any]] = None) -> bool:
+        """Index ``lrc`` under ``songmid``; returns False if it was already indexed or is empty."""
+        with self._lock:
+            added = self._add(songmid, lrc, meta)
+            if added and len(self._songmids) - self._segment.songs >= max(COMPACT_MIN_SONGS, self._segment.songs):
+                self.compact()
+        return added
+
+    def _add(self, songmid: str, lrc: str, meta: Optional[Dict[str, Any]] = None) -> bool:
+        if not self.enabled or not songmid or not isinstance(lrc, str) or songmid in self._docs:
+            return False
+        if len(self._songmids) >= self.max_songs:
+            return False
+        started = time.perf_counter()
+        lines, tags = decode_lrc(lrc)
+        # One pass over the whole text; the few bigrams spanning two lines are harmless.
+        grams = _grams("\n".join(lines + [tags.get("songname", "")]))
+        if not grams:
+            return False
+
+        doc = len(self._songmids)
+        self._songmids.append(songmid)
+        self._docs[songmid] = doc
+        self._meta.append({"songmid": songmid, **tags, **(meta or {})})
+        delta = self._delta
+        for gram in grams:
+            bucket = delta.get(gram)
+            if bucket is None:
+                delta[gram] = doc
+            elif isinstance(bucket, int):
+                delta[gram] = array("I", (bucket, doc))
+            else:
+                bucket.append(doc)
+        self.build_seconds += time.perf_counter() - started
+        return True
+
+    def compact(self) -> None:
+        """Merge the delta into the frozen segment (callers hold ``_lock``)."""
+        if not self._delta:
+            return
+        started = time.perf_counter()
+        old, delta = self._segment, self._delta
+        merged = _Segment()
+        keys, offsets, docs = merged.keys, merged.offsets, merged.docs
+
+        def copy(start: int, stop: int) -> None:
+            # Carry over old[start:stop] unchanged, shifting offsets to the new docs array.
+            if start >= stop:
+                return
+            shift = len(docs) - old.offsets[start]
+            keys.extend(old.keys[start:stop])
+            docs.extend(old.docs[old.offsets[start]:old.offsets[stop]])
+            offsets.extend(offset + shift for offset in old.offsets[start + 1:stop + 1])
+
+        position = 0
+        for gram in sorted(delta):
+            following = bisect_left(old.keys, gram, position)
+            copy(position, following)
+            position = following
+            if position < len(old.keys) and old.keys[position] == gram:
+                docs.extend(old.docs[old.offsets[position]:old.offsets[position + 1]])
+                position += 1
+            bucket = delta[gram]
+            if isinstance(bucket, int):
+                docs.append(bucket)
+            else:
+                docs.extend(bucket)
+            keys.append(gram)
+            offsets.append(len(docs))
+        copy(position, len(old.keys))
+
+        merged.songs = len(self._songmids)
+        self._segment, self._delta = merged, {}
+        self.compactions += 1
+        self.build_seconds += time.perf_counter() - started
+
+    def add_meta(self, songmid: str, meta: Dict[str, Any]) -> None:
+        """Merge search-result fields (songid, interval, albummid ...) into an indexed song."""
+        doc = self._docs.get(songmid)
+        if doc is not None:
+            self._meta[doc].update(meta)
+
+    def load(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Index ``(songmid, lrc)`` pairs, e.g. from the metadata store; returns how many were added."""
+        added = 0
+        for songmid, lrc in items:
+            with self._lock:
+                added += self._add(songmid, lrc)
+        with self._lock:
+            self.compact()
+        return added
+
+    def _ensure_loaded(self) -> bool:
+        """Start rebuilding from the metadata store in a worker thread; True once it has finished."""
+        if self._loaded:
+            return True
+        if self._loader is None:
+            self._loader = threading.Thread(target=self._load_from_store, name="lyrics-index-load", daemon=True)
+            self._loader.start()
+        return False
+
+    def _load_from_store(self) -> None:
+        import metadata_store
+
+        started = time.perf_counter()
+        try:
+            added = self.load(metadata_store.get_metadata_store().items("lyrics"))
+        finally:
+            self._loaded = True
+        if added:
+            logger.info("lyrics index rebuilt from %d stored lyrics in %.3fs", added, time.perf_counter() - started)
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Songs whose lyrics cover at least ``min_score`` of the query's bigrams, best first.
+
+        Each result is the song's known metadata plus ``score``; an empty list means
+        the caller should fall back to the remote search. That includes any hit
+        whose metadata has not been completed by :meth:`add_meta` yet, since a
+        lyrics-only entry has no songid, duration or album mid to answer with.
+        Fewer than ``limit`` hits only answer part of the query: the caller puts
+        them ahead of the remote results.
+        """
+        if not self.enabled or not self._ensure_loaded():
+            return []
+        self.queries += 1
+        segment, delta = self._segment, self._delta
+        spans = {gram: segment.span(gram) for gram in _grams(query)}
+
+        def frequency(gram: int) -> int:
+            span = spans[gram]
+            return (span[1] - span[0] if span else 0) + _size(delta.get(gram))
+
+        grams = sorted(spans, key=frequency)
+        if len(grams) < MIN_QUERY_GRAMS or not self._songmids:
+            return []
+
+        need = math.ceil(self.min_score * len(grams))
+        # A song matching ``need`` grams must appear in one of the rarest ``len - need + 1``.
+        candidates = set()
+        for gram in grams[:len(grams) - need + 1]:
+            span = spans[gram]
+            if span:
+                candidates.update(segment.docs[span[0]:span[1]])
+            bucket = delta.get(gram)
+            if isinstance(bucket, int):
+                candidates.add(bucket)
+            elif bucket is not None:
+                candidates.update(bucket)
+
+        def contains(gram: int, doc: int) -> bool:
+            if doc < segment.songs:
+                span = spans[gram]
+                if not span:
+                    return False
+                index = bisect_left(segment.docs, doc, span[0], span[1])
+                return index < span[1] and segment.docs[index] == doc
+            bucket = delta.get(gram)
+            if isinstance(bucket, int):
+                return bucket == doc
+            return bucket is not None and doc in bucket
+
+        scored = []
+        for doc in candidates:
+            matched = sum(1 for gram in grams if contains(gram, doc))
+            if matched >= need:
+                scored.append((matched / len(grams), doc))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        hits = scored[:limit]
+        if any(not all(self._meta[doc].get(field) for field in SEARCH_FIELDS) for _, doc in hits):
+            self.incomplete += 1
+            return []
+        if len(hits) >= limit:
+            self.local_answers += 1
+        return [{**self._meta[doc], "score": score} for score, doc in hits]
+
+    def stats(self) -> Dict[str, Any]:
+        segment = self._segment
+        return {
+            "enabled": self.enabled,
+            "songs": len(self._songmids),
+            "segment_grams": len(segment.keys),
+            "segment_postings": len(segment.docs),
+            "segment_bytes": segment.nbytes(),
+            "delta_songs": len(self._songmids) - segment.songs,
+            "delta_grams": len(self._delta),
+            "compactions": self.compactions,
+            "build_seconds": self.build_seconds,
+            "queries": self.queries,
+            "local_answers": self.local_answers,
+            "incomplete_fallbacks": self.incomplete,
+            "min_score": self.min_score,
+        }
+
+
+_INDEX: Optional[LyricsIndex] = None
+
+
+def get_lyrics_index() -> LyricsIndex:
+    """Return the process-wide :class:`LyricsIndex`."""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = LyricsIndex()
+    return _INDEX
@@ -1,6 +1,6 @@
 """
 Simple MCP stdio <-> WebSocket pipe with optional unified config.
-Version: 0.2.0
+Version: 0.4.0
 
 Usage (env):
     export MCP_ENDPOINT=<ws_endpoint>
@@ -16,20 +16,29 @@ Run a single local server script (back-compat)
 Config discovery order:
     $MCP_CONFIG, then ./mcp_config.json
 
+Python servers built on FastMCP can also run inside this process (opt-in), which
+saves a child process and a stdio hop per message and lets them share caches:
+    "qqmusic": {"type": "inprocess", "module": "qqmusic_mcp:manifest"}
+Their lifespans stay open across reconnects, and their "env" entries apply to
+the whole process, so two of them may not set one variable to different values.
+
 Env overrides:
     (none for proxy; uses current Python: python -m mcp_proxy)
+    XZM_PIPE_BUFFER: bytes buffered per child pipe before backpressure (default 262144)
+    XZM_PIPE_WS_QUEUE: incoming WebSocket messages queued before backpressure (default 16)
 """
 
 import asyncio
+import importlib
 import websockets
-import subprocess
 import logging
 import os
 import signal
 import sys
-import json
 from dotenv import load_dotenv
 
+import json_codec
+
 # Auto-load environment variables from a .env file if present
 load_dotenv()
 
@@ -44,6 +53,14 @@ logger = logging.getLogger('MCP_PIPE')
 INITIAL_BACKOFF = 1  # Initial wait time in seconds
 MAX_BACKOFF = 600  # Maximum wait time in seconds
 
+# Lifespans of in-process manifests: id(manifest) -> (task, opened future, stop event)
+_lifespans = {}
+
+# Flow-control settings: bytes buffered per child pipe before the other side has
+# to wait, and WebSocket messages queued before reading from the socket pauses
+PIPE_BUFFER = int(os.environ.get("XZM_PIPE_BUFFER", 256 * 1024))
+WS_MAX_QUEUE = int(os.environ.get("XZM_PIPE_WS_QUEUE", 16))
+
 async def connect_with_retry(uri, target):
     """Connect to WebSocket server with retry mechanism for a given server target."""
     reconnect_attempt = 0
@@ -67,20 +84,26 @@ async def connect_to_server(uri, target):
     """Connect to WebSocket server and pipe stdio for the given server target."""
     try:
         logger.info(f"[{target}] Connecting to WebSocket server...")
-        async with websockets.connect(uri) as websocket:
+        async with websockets.connect(uri, max_queue=WS_MAX_QUEUE) as websocket:
             logger.info(f"[{target}] Successfully connected to WebSocket server")
 
+            # Serve an in-process manifest directly, without a child process
+            manifest = load_manifest(target)
+            if manifest is not None:
+                await serve_manifest(websocket, manifest, target)
+                return
+
             # Start server process (built from CLI arg or config)
             cmd, env = build_server_command(target)
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                encoding='utf-8',
-                text=True,
-                env=env
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                limit=PIPE_BUFFER,
             )
+            process.stdin.transport.set_write_buffer_limits(high=PIPE_BUFFER)
             logger.info(f"[{target}] Started server process: {' '.join(cmd)}")
             
             # Create two tasks: read from WebSocket and write to process, read from process and write to WebSocket
@@ -97,34 +120,54 @@ async def connect_to_server(uri, target):
         raise  # Re-throw exception
     finally:
         # Ensure the child process is properly terminated
-        if 'process' in locals():
+        if 'process' in locals() and process.returncode is None:
             logger.info(f"[{target}] Terminating server process")
             try:
                 process.terminate()
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except ProcessLookupError:
+                pass
+            except asyncio.TimeoutError:
                 process.kill()
+                await process.wait()
             logger.info(f"[{target}] Server process terminated")
 
+async def read_line(reader):
+    """Read one line, however long, while the reader buffers at most PIPE_BUFFER bytes."""
+    parts = []
+    while True:
+        try:
+            parts.append(await reader.readuntil(b'\n'))
+            break
+        except asyncio.LimitOverrunError as e:
+            # No newline within the buffer limit yet: take what is there and keep reading.
+            parts.append(await reader.readexactly(e.consumed))
+        except asyncio.IncompleteReadError as e:
+            parts.append(e.partial)  # End of stream; the last line may lack its newline.
+            break
+    return b''.join(parts)
+
 async def pipe_websocket_to_process(websocket, process, target):
     """Read data from WebSocket and write to process stdin"""
     try:
         while True:
             # Read message from WebSocket
             message = await websocket.recv()
-            logger.debug(f"[{target}] << {message[:120]}...")
+            if isinstance(message, str):
+                message = message.encode('utf-8')
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[%s] << %s...", target, message[:120])
             
-            # Write to process stdin (in text mode)
-            if isinstance(message, bytes):
-                message = message.decode('utf-8')
-            process.stdin.write(message + '\n')
-            process.stdin.flush()
+            # Write to process stdin; drain() waits while the child is behind, so
+            # unread messages stay in the bounded WebSocket queue instead of piling up here
+            process.stdin.write(message + b'\n')
+            await process.stdin.drain()
     except Exception as e:
         logger.error(f"[{target}] Error in WebSocket to process pipe: {e}")
         raise  # Re-throw exception to trigger reconnection
     finally:
         # Close process stdin
-        if not process.stdin.closed:
+        if not process.stdin.is_closing():
             process.stdin.close()
 
 async def pipe_process_to_websocket(process, websocket, target):
@@ -132,16 +175,17 @@ async def pipe_process_to_websocket(process, websocket, target):
     try:
         while True:
             # Read data from process stdout
-            data = await asyncio.to_thread(process.stdout.readline)
+            data = await read_line(process.stdout)
             
             if not data:  # If no data, the process may have ended
                 logger.info(f"[{target}] Process has ended output")
                 break
                 
-            # Send data to WebSocket
-            logger.debug(f"[{target}] >> {data[:120]}...")
-            # In text mode, data is already a string, no need to decode
-            await websocket.send(data)
+            # Send data to WebSocket; send() waits while the socket is behind, and the
+            # child then blocks on a full stdout pipe until it catches up
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[%s] >> %s...", target, data[:120])
+            await websocket.send(data.decode('utf-8'))
     except Exception as e:
         logger.error(f"[{target}] Error in process to WebSocket pipe: {e}")
         raise  # Re-throw exception to trigger reconnection
@@ -151,19 +195,102 @@ async def pipe_process_stderr_to_terminal(process, target):
     try:
         while True:
             # Read data from process stderr
-            data = await asyncio.to_thread(process.stderr.readline)
+            data = await read_line(process.stderr)
             
             if not data:  # If no data, the process may have ended
                 logger.info(f"[{target}] Process has ended stderr output")
                 break
                 
-            # Print stderr data to terminal (in text mode, data is already a string)
-            sys.stderr.write(data)
+            # Print stderr data to terminal
+            sys.stderr.write(data.decode('utf-8', errors='replace'))
             sys.stderr.flush()
     except Exception as e:
         logger.error(f"[{target}] Error in process stderr pipe: {e}")
         raise  # Re-throw exception to trigger reconnection
 
+async def serve_manifest(websocket, manifest, target):
+    """Serve a FastMCP manifest in this process, one MCP session per WebSocket connection.
+
+    JSON-RPC messages go between the socket and the server's memory streams
+    directly: no child process, no stdio pipes and no second encoding per message.
+    """
+    import anyio
+    from mcp import types
+    from mcp.server.lowlevel.server import NotificationOptions
+    from mcp.shared.message import SessionMessage
+
+    read_writer, read_stream = anyio.create_memory_object_stream(0)
+    write_stream, write_reader = anyio.create_memory_object_stream(0)
+    server = manifest._mcp_server
+
+    async def websocket_to_server():
+        async with read_writer:
+            while True:
+                message = await websocket.recv()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[%s] << %s...", target, message[:120])
+                try:
+                    parsed = types.JSONRPCMessage.model_validate_json(message)
+                except Exception as e:
+                    await read_writer.send(e)  # Logged by the session, as over stdio
+                    continue
+                await read_writer.send(SessionMessage(parsed))
+
+    async def server_to_websocket():
+        async with write_reader:
+            async for session_message in write_reader:
+                data = session_message.message.model_dump_json(by_alias=True, exclude_none=True)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[%s] >> %s...", target, data[:120])
+                await websocket.send(data)
+
+    await hold_lifespan(manifest)
+    options = server.create_initialization_options(NotificationOptions(tools_changed=True))
+    tasks = [
+        asyncio.create_task(websocket_to_server()),
+        asyncio.create_task(server_to_websocket()),
+        asyncio.create_task(server.run(read_stream, write_stream, options)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def hold_lifespan(manifest):
+    """Open ``manifest``'s lifespan once for the life of this process; every connection shares it.
+
+    Each lifespan runs in a task of its own, so it is entered and exited in the
+    same task whichever connection opened it. :func:`release_lifespans` closes them.
+    """
+    entry = _lifespans.get(id(manifest))
+    if entry is None:
+        loop = asyncio.get_running_loop()
+        ready, stop = loop.create_future(), asyncio.Event()
+
+        async def run():
+            try:
+                async with manifest._lifespan_manager():
+                    ready.set_result(None)
+                    await stop.wait()
+            except BaseException as e:
+                _lifespans.pop(id(manifest), None)  # Let the next connection try again
+                if not ready.done():
+                    ready.set_exception(e)
+                raise
+
+        entry = _lifespans[id(manifest)] = (loop.create_task(run()), ready, stop)
+    await asyncio.shield(entry[1])
+
+async def release_lifespans():
+    """Close every lifespan opened by :func:`hold_lifespan`."""
+    entries = list(_lifespans.values())
+    _lifespans.clear()
+    for _, _, stop in entries:
+        stop.set()
+    await asyncio.gather(*(task for task, _, _ in entries), return_exceptions=True)
+
 def signal_handler(sig, frame):
     """Handle interrupt signals"""
     logger.info("Received interrupt signal, shutting down...")
@@ -176,12 +303,64 @@ def load_config():
         return {}
     try:
         with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+            return json_codec.loads(f.read())
     except Exception as e:
         logger.warning(f"Failed to load config {path}: {e}")
         return {}
 
 
+def is_inprocess(entry):
+    return isinstance(entry, dict) and (entry.get("type") or entry.get("transportType") or "").lower() == "inprocess"
+
+def inprocess_env_conflicts(servers):
+    """Env keys that enabled in-process entries set to different values, as {key: {server: value}}."""
+    values = {}
+    for name, entry in servers.items():
+        if is_inprocess(entry) and not entry.get("disabled"):
+            for k, v in (entry.get("env") or {}).items():
+                values.setdefault(str(k), {})[name] = str(v)
+    return {k: by_server for k, by_server in values.items() if len(set(by_server.values())) > 1}
+
+def load_manifest(target):
+    """Import the FastMCP manifest of an ``inprocess`` config entry; None for other targets.
+
+    ``module`` is ``package.module`` or ``package.module:attribute`` (attribute
+    defaults to ``manifest``). The entry's ``env`` is applied to this process
+    before the import, so it is shared with every other in-process server;
+    entries that set the same variable to different values are refused.
+    """
+    cfg = load_config()
+    servers = cfg.get("mcpServers", {}) if isinstance(cfg, dict) else {}
+    entry = servers.get(target)
+    if not is_inprocess(entry):
+        return None
+    if entry.get("disabled"):
+        raise RuntimeError(f"Server '{target}' is disabled in config")
+    module_name, _, attribute = (entry.get("module") or "").partition(":")
+    if not module_name:
+        raise RuntimeError(f"Server '{target}' (type inprocess) is missing 'module'")
+    env = {str(k): str(v) for k, v in (entry.get("env") or {}).items()}
+    conflicts = sorted(set(env) & set(inprocess_env_conflicts(servers)))
+    if conflicts:
+        raise RuntimeError(
+            f"Server '{target}': in-process servers share one environment and set {', '.join(conflicts)} "
+            "to different values; run them as stdio servers instead"
+        )
+    os.environ.update(env)
+    manifest = getattr(importlib.import_module(module_name), attribute or "manifest", None)
+    if manifest is None or not hasattr(manifest, "tool"):
+        raise RuntimeError(f"Server '{target}': {entry['module']} is not a FastMCP manifest")
+    # Hosting goes through FastMCP internals (the same ones its in-memory client transport uses).
+    if not all(hasattr(manifest, name) for name in ("_mcp_server", "_lifespan_manager")):
+        import fastmcp
+
+        raise RuntimeError(
+            f"Server '{target}': fastmcp {fastmcp.__version__} does not support in-process hosting; "
+            "run it as a stdio server"
+        )
+    return manifest
+
+
 def build_server_command(target=None):
     """Build [cmd,...] and env for the server process for a given target.
 
@@ -229,6 +408,9 @@ def build_server_command(target=None):
             cmd.append(url)
             return cmd, child_env
 
+        if typ == "inprocess":
+            raise RuntimeError(f"Server '{target}' runs in process and has no command")
+
         raise RuntimeError(f"Unsupported server type: {typ}")
 
     # Fallback to script path (back-compat)
@@ -263,10 +445,20 @@ if __name__ == "__main__":
                 logger.info(f"Skipping disabled servers: {', '.join(skipped)}")
             if not enabled:
                 raise RuntimeError("No enabled mcpServers found in config")
+            conflicts = inprocess_env_conflicts(servers_cfg)
+            if conflicts:
+                raise RuntimeError(
+                    "In-process servers share one environment but set different values for "
+                    + "; ".join(f"{k} ({', '.join(sorted(by_server))})" for k, by_server in sorted(conflicts.items()))
+                    + "; run them as stdio servers instead"
+                )
             logger.info(f"Starting servers: {', '.join(enabled)}")
             tasks = [asyncio.create_task(connect_with_retry(endpoint_url, t)) for t in enabled]
             # Run all forever; if any crashes it will auto-retry inside
-            await asyncio.gather(*tasks)
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                await release_lifespans()
         else:
             if os.path.exists(target_arg):
                 await connect_with_retry(endpoint_url, target_arg)
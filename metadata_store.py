@@ -0,0 +1,269 @@
+"""
+Persistent SQLite store for QQ Music metadata that rarely changes.
+
+Track info, album pages, lyrics and playlists are kept on disk under the same
+runtime directory the file tools use (``~/.xiaozhi_mcp_music``), so a server
+respawned by ``mcp_pipe.py`` answers repeated queries without going back to QQ
+Music. Every kind has its own TTL; when the database grows past its size
+budget the least recently read entries are evicted.
+
+Configuration (environment):
+
+- ``QQM_METADATA_DB``: database path (default ``~/.xiaozhi_mcp_music/metadata.sqlite3``;
+  ``0`` or ``off`` disables the store)
+- ``QQM_METADATA_MAX_BYTES``: size budget for stored values (default 64000000)
+- ``QQM_METADATA_TTL_<KIND>``: TTL in seconds for one kind, e.g. ``QQM_METADATA_TTL_LYRICS``
+"""
+
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import json_codec
+from metrics import ratio
+
+__all__ = ["MetadataStore", "get_metadata_store", "read_through", "DEFAULT_TTLS"]
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_DIR = Path.home() / ".xiaozhi_mcp_music"
+
+DEFAULT_TTLS = {
+    "track": 7 * 86400,
+    "album": 7 * 86400,
+    "lyrics": 30 * 86400,
+    "playlist": 3600,
+    "category_playlist": 3600,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+DROP INDEX IF EXISTS metadata_accessed_at;
+CREATE INDEX IF NOT EXISTS metadata_lru ON metadata (accessed_at, size);
+"""
+
+
+def _default_cacheable(value: Any) -> bool:
+    # Empty pages and the throttling marker are transient, never persist them.
+    return bool(value) and value != "Error"
+
+
+class MetadataStore:
+    """Key/value store of JSON documents grouped by kind, each kind with its own TTL."""
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: Optional[int] = None, ttls: Optional[Dict[str, float]] = None):
+        setting = os.getenv("QQM_METADATA_DB", "").strip()
+        if path is None and setting.lower() not in ("0", "off", "false", "no"):
+            path = Path(setting).expanduser() if setting else RUNTIME_DIR / "metadata.sqlite3"
+        self.path = path
+        self.max_bytes = max_bytes or int(os.getenv("QQM_METADATA_MAX_BYTES", "64000000"))
+        self.ttls = dict(DEFAULT_TTLS)
+        for kind in self.ttls:
+            override = os.getenv(f"QQM_METADATA_TTL_{kind.upper()}")
+            if override:
+                self.ttls[kind] = float(override)
+        self.ttls.update(ttls or {})
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                self._bytes = self._total(conn)
+                self._conn = conn
+            except (OSError, sqlite3.Error) as exc:
+                logger.warning("metadata store at %s unavailable, continuing without it: %s", self.path, exc)
+                self.path = None
+        return self._conn
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """Return the stored value, or ``None`` when missing or older than the kind's TTL."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT value, stored_at FROM metadata WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+                now = time.time()
+                if row is not None and now - row[1] >= self.ttls.get(kind, 3600):
+                    self._delete(conn, kind, key)
+                    self.expired += 1
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE metadata SET accessed_at = ? WHERE kind = ? AND key = ?", (now, kind, key))
+            except sqlite3.Error as exc:
+                self.errors += 1
+                logger.warning("metadata store read of %s/%s failed: %s", kind, key, exc)
+                return None
+        self.hits += 1
+        return json_codec.loads(row[0])
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        payload = json_codec.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                self._delete(conn, kind, key)
+                now = time.time()
+                conn.execute(
+                    "INSERT INTO metadata (kind, key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, key, payload, len(payload), now, now),
+                )
+                # Every server mcp_pipe starts writes to the same file: size it from the
+                # database, not from this process's own writes.
+                self._bytes = self._total(conn)
+                if self._bytes > self.max_bytes:
+                    self._evict(conn)
+            except sqlite3.Error as exc:
+                self.errors += 1
+                logger.warning("metadata store write of %s/%s failed: %s", kind, key, exc)
+
+    def items(self, kind: str) -> List[Tuple[str, Any]]:
+        """All unexpired ``(key, value)`` pairs of ``kind``."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            try:
+                rows = conn.execute(
+                    "SELECT key, value FROM metadata WHERE kind = ? AND stored_at > ?",
+                    (kind, time.time() - self.ttls.get(kind, 3600)),
+                ).fetchall()
+            except sqlite3.Error as exc:
+                self.errors += 1
+                logger.warning("metadata store scan of %s failed: %s", kind, exc)
+                return []
+        return [(key, json_codec.loads(value)) for key, value in rows]
+
+    async def get_or_fetch(
+        self,
+        kind: str,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = _default_cacheable,
+    ) -> Any:
+        """Return the stored value for ``(kind, key)`` or await ``fetch()`` and store its result."""
+        value = self.get(kind, key)
+        if value is not None:
+            return value
+        value = await fetch()
+        if cacheable(value):
+            self.put(kind, key, value)
+        return value
+
+    def _delete(self, conn: sqlite3.Connection, kind: str, key: str) -> None:
+        row = conn.execute("SELECT size FROM metadata WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM metadata WHERE kind = ? AND key = ?", (kind, key))
+            self._bytes -= row[0]
+
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        # Answered from the metadata_lru index, without reading the stored values.
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # Trim to 90% of the budget so a full store does not evict on every write.
+        target = self.max_bytes * 0.9
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have evicted since our write; recount under the write lock.
+            total = self._total(conn)
+            count = freed = 0
+            for (size,) in conn.execute("SELECT size FROM metadata ORDER BY accessed_at"):
+                if total - freed <= target:
+                    break
+                freed += size
+                count += 1
+            if count:
+                conn.execute(
+                    "DELETE FROM metadata WHERE rowid IN (SELECT rowid FROM metadata ORDER BY accessed_at LIMIT ?)",
+                    (count,),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._bytes = total - freed
+        self.evictions += count
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._conn
+            counts = dict(conn.execute("SELECT kind, COUNT(*) FROM metadata GROUP BY kind").fetchall()) if conn else {}
+        return {
+            "path": str(self.path) if self.path else None,
+            "entries": counts,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": ratio(self.hits, self.hits + self.misses),
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+def read_through(kind: str, cacheable: Callable[[Any], bool] = _default_cacheable):
+    """Decorate an async ``method(self, key, ...)`` so its results are served from the store."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, key, *args, **kwargs):
+            return await get_metadata_store().get_or_fetch(
+                kind, str(key), lambda: fn(self, key, *args, **kwargs), cacheable
+            )
+
+        return wrapper
+
+    return decorator
+
+
+_STORE: Optional[MetadataStore] = None
+
+
+def get_metadata_store() -> MetadataStore:
+    """Return the process-wide :class:`MetadataStore`; the database is opened on first use."""
+    global _STORE
+    if _STORE is None:
+        _STORE = MetadataStore()
+    return _STORE
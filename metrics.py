@@ -0,0 +1,32 @@
+"""
+Small in-process metric helpers shared by the transport, caches and dispatchers.
+"""
+
+from collections import deque
+from typing import Dict, Optional
+
+__all__ = ["LatencyWindow", "ratio"]
+
+
+def ratio(part: float, whole: float) -> Optional[float]:
+    """``part / whole``, or ``None`` before anything has been counted."""
+    return part / whole if whole else None
+
+
+class LatencyWindow:
+    """Keeps the most recent ``size`` samples (seconds) and reports percentiles in ms."""
+
+    def __init__(self, size: int = 512):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1e3
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        return {"p50_ms": self.percentile(0.5), "p95_ms": self.percentile(0.95)}
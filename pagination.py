@@ -0,0 +1,138 @@
+"""
+Concurrent, ordered crawling of paginated QQ Music endpoints.
+
+Endpoints such as ``CgiGetDiss`` return a fixed number of songs per call, so long
+lists take many round trips. :class:`PageCrawler` keeps a bounded number of page
+requests in flight, yields pages strictly in order as soon as each contiguous
+prefix has arrived, retries a failed page on its own, and cancels whatever is
+still outstanding when the consumer stops iterating.
+
+Configuration (environment):
+
+- ``QQM_PAGE_CONCURRENCY``: page requests in flight per crawl (default 4)
+- ``QQM_PAGE_RETRIES``: extra attempts for a failed page before giving up (default 2)
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+import deadline
+import rate_limit
+from metrics import ratio
+
+__all__ = ["PageCrawler", "get_page_crawler"]
+
+logger = logging.getLogger(__name__)
+
+
+class PageCrawler:
+    """Fetches pages ``0, 1, 2 ...`` concurrently and yields them in order."""
+
+    def __init__(self, concurrency: Optional[int] = None, retries: Optional[int] = None, backoff: float = 0.25):
+        self.concurrency = concurrency or int(os.getenv("QQM_PAGE_CONCURRENCY", "4"))
+        self.retries = retries if retries is not None else int(os.getenv("QQM_PAGE_RETRIES", "2"))
+        self.backoff = backoff
+        self.crawls = 0
+        self.pages = 0
+        self.retried = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    async def crawl(
+        self,
+        fetch: Callable[[int], Awaitable[Any]],
+        count: Optional[int] = None,
+        start: int = 0,
+        is_last: Optional[Callable[[Any], bool]] = None,
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    ) -> AsyncIterator[Any]:
+        """Yield ``await fetch(page)`` for pages ``start .. count - 1`` in order.
+
+        With ``count`` unknown the crawl runs until ``is_last(result)`` is true;
+        pages fetched speculatively past the end are cancelled. A page that still
+        fails after ``retries`` extra attempts raises and ends the crawl.
+        """
+        self.crawls += 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Pages past the one being awaited may run ahead, but only this far, so a
+        # slow page cannot make the crawl buffer the rest of the list.
+        window = self.concurrency * 2
+        tasks: Dict[int, asyncio.Task] = {}
+        loop = asyncio.get_running_loop()
+
+        launched = emitted = start
+        try:
+            while count is None or emitted < count:
+                while launched < emitted + window and (count is None or launched < count):
+                    tasks[launched] = loop.create_task(self._fetch_bulk(fetch, launched, retry_on, semaphore))
+                    launched += 1
+                result = await tasks.pop(emitted)
+                emitted += 1
+                self.pages += 1
+                yield result
+                if is_last is not None and is_last(result):
+                    break
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+                    self.cancelled += 1
+            if tasks:
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def _fetch_bulk(self, fetch, page, retry_on, semaphore) -> Any:
+        # Look-ahead pages queue behind interactive requests at the rate limiter.
+        with rate_limit.priority(rate_limit.BULK):
+            return await self.fetch_page(fetch, page, retry_on, semaphore)
+
+    async def fetch_page(
+        self,
+        fetch: Callable[[int], Awaitable[Any]],
+        page: int,
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ) -> Any:
+        """Return ``await fetch(page)``, retrying it up to ``retries`` times on ``retry_on``."""
+        tries = 0
+        while True:
+            try:
+                if semaphore is None:
+                    return await fetch(page)
+                async with semaphore:
+                    return await fetch(page)
+            except retry_on as exc:
+                delay = self.backoff * 2 ** tries
+                left = deadline.remaining()
+                # A retry is only worth it if the caller's deadline leaves room for it.
+                if tries >= self.retries or isinstance(exc, deadline.DeadlineExceeded) or (left is not None and left <= delay):
+                    self.failed += 1
+                    raise
+                tries += 1
+                self.retried += 1
+                logger.info("page %d failed (%s), retry %d/%d", page, exc, tries, self.retries)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "retries": self.retries,
+            "crawls": self.crawls,
+            "pages": self.pages,
+            "retried": self.retried,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "retry_rate": ratio(self.retried, self.pages + self.failed),
+        }
+
+
+_CRAWLER: Optional[PageCrawler] = None
+
+
+def get_page_crawler() -> PageCrawler:
+    """Return the process-wide :class:`PageCrawler`."""
+    global _CRAWLER
+    if _CRAWLER is None:
+        _CRAWLER = PageCrawler()
+    return _CRAWLER
@@ -0,0 +1,156 @@
+"""
+Opt-in speculative prefetch of playback URLs for the top search hits.
+
+Agents usually follow ``search_music_by_lyrics`` with ``get_music_url_by_songmid``
+on the first result. With prefetch enabled, every search schedules a background
+resolution of its top-k songmids at the default quality into :mod:`url_cache`,
+so the follow-up call is answered locally. A newer search cancels the previous
+prefetch; a follow-up that arrives while its song is still being prefetched waits
+for that request instead of sending its own.
+
+Configuration (environment):
+
+- ``QQM_PREFETCH``: ``1`` to enable (default off)
+- ``QQM_PREFETCH_TOP_K``: how many hits to resolve per search (default 2)
+- ``QQM_PREFETCH_QUALITY``: quality to resolve (default ``128``, the tool default)
+- ``QQM_PREFETCH_CONCURRENCY``: max CgiGetVkey requests in flight for prefetching (default 2)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import deadline
+import rate_limit
+from metrics import ratio
+
+__all__ = ["UrlPrefetcher", "get_prefetcher"]
+
+logger = logging.getLogger(__name__)
+
+# Songs remembered as "recently offered by a search" for hit-rate accounting.
+_TRACKED = 256
+
+
+class UrlPrefetcher:
+    """Resolves the top search hits into the URL cache ahead of the follow-up call."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        top_k: Optional[int] = None,
+        quality: Optional[str] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.enabled = enabled if enabled is not None else os.getenv("QQM_PREFETCH", "0") == "1"
+        self.top_k = top_k or int(os.getenv("QQM_PREFETCH_TOP_K", "2"))
+        self.quality = quality or os.getenv("QQM_PREFETCH_QUALITY", "128")
+        self.concurrency = concurrency or int(os.getenv("QQM_PREFETCH_CONCURRENCY", "2"))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._task_songs: frozenset = frozenset()
+        # (songmid, quality) -> upstream seconds it took to prefetch, or None while in flight.
+        self._offered: "OrderedDict[Tuple[str, str], Optional[float]]" = OrderedDict()
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.followups = 0
+        self.hits = 0
+        self.saved_seconds = 0.0
+
+    def schedule(self, songmids: Iterable[str], client: Any) -> None:
+        """Start prefetching the first ``top_k`` of ``songmids`` with ``client`` (a ``QQMusic``)."""
+        if not self.enabled:
+            return
+        songs = [(songmid, self.quality) for songmid in list(dict.fromkeys(s for s in songmids if s))[:self.top_k]]
+        if not songs:
+            return
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.cancelled += 1
+        for song in songs:
+            self._offered[song] = None
+            self._offered.move_to_end(song)
+        while len(self._offered) > _TRACKED:
+            self._offered.popitem(last=False)
+        self.scheduled += len(songs)
+        self._task_songs = frozenset(songs)
+        self._task = asyncio.get_running_loop().create_task(self._run(songs, client))
+
+    async def _run(self, songs, client) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                with rate_limit.priority(rate_limit.BACKGROUND), deadline.detached():
+                    results = await client.get_music_urls(songs, concurrency=self.concurrency)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.errors += 1
+                logger.info("URL prefetch of %d songs failed: %s", len(songs), exc)
+                return
+        elapsed = time.perf_counter() - started
+        for result in results:
+            song = (result["songmid"], result["file_type"])
+            if result["status"] == "ok" and song in self._offered:
+                self._offered[song] = elapsed
+                self.completed += 1
+
+    async def settle(self, songmid: str, file_type: str) -> None:
+        """If ``songmid`` is being prefetched right now, wait for that request to land."""
+        task = self._task
+        if task is None or task.done() or (songmid, file_type) not in self._task_songs:
+            return
+        try:
+            # Shielded: a cancelled follow-up must not cancel the prefetch for others.
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+        except Exception:
+            pass
+
+    def record_followup(self, songmid: str, file_type: str, seconds: float) -> None:
+        """Account a URL lookup; only songs offered by a recent search count toward the hit rate."""
+        song = (songmid, file_type)
+        if not self.enabled or song not in self._offered:
+            return
+        self.followups += 1
+        prefetched = self._offered.pop(song)
+        if prefetched is not None:
+            self.hits += 1
+            self.saved_seconds += max(prefetched - seconds, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "top_k": self.top_k,
+            "quality": self.quality,
+            "concurrency": self.concurrency,
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+            "followups": self.followups,
+            "hits": self.hits,
+            "hit_rate": ratio(self.hits, self.followups),
+            "saved_ms_total": self.saved_seconds * 1e3,
+            "saved_ms_per_hit": ratio(self.saved_seconds * 1e3, self.hits),
+        }
+
+
+_PREFETCHER: Optional[UrlPrefetcher] = None
+
+
+def get_prefetcher() -> UrlPrefetcher:
+    """Return the process-wide :class:`UrlPrefetcher`."""
+    global _PREFETCHER
+    if _PREFETCHER is None:
+        _PREFETCHER = UrlPrefetcher()
+    return _PREFETCHER
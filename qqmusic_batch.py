@@ -0,0 +1,220 @@
+"""
+Micro-batching dispatcher for QQ Music ``musicu.fcg`` sub-requests.
+
+``musicu.fcg`` accepts several named sub-requests (``req_0``, ``req_1`` ...) in one
+body. Calls made through :meth:`MusicuBatcher.call` within a short window (and
+with the same cookies and headers) are packed into a single multi-module request, sent once
+(signed against ``musics.fcg`` when ``QQM_BATCH_SIGNED=1``) and each caller gets
+its own sub-response back.
+
+Configuration (environment):
+
+- ``QQM_BATCH_WINDOW_MS``: how long the first call waits for company (default 2;
+  ``0`` still coalesces calls issued in the same event-loop tick)
+- ``QQM_BATCH_MAX``: flush as soon as this many sub-requests are queued (default 20)
+- ``QQM_BATCH_SIGNED``: ``1`` to send batches to ``musics.fcg`` with a sign
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import cookie_pool
+import deadline
+import json_codec
+import qqmusic_sign
+import rate_limit
+from metrics import LatencyWindow, ratio
+
+__all__ = ["MusicuBatcher", "MusicuError", "get_batcher"]
+
+MUSICU_URL = "https://u.y.qq.com/cgi-bin/musicu.fcg"
+MUSICS_URL = "https://u6.y.qq.com/cgi-bin/musics.fcg"
+DEFAULT_COMM = {"uin": "0", "format": "json", "ct": 24, "cv": 0}
+THROTTLED = 500001
+
+
+class MusicuError(RuntimeError):
+    """A batched sub-request got no usable answer; ``code`` is the failing response code.
+
+    That is the top-level code when it is a throttle (500001) or no ``req_N`` came
+    back, otherwise the sub-response's own non-zero code.
+    """
+
+    def __init__(self, code: Any, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class _Batch:
+    def __init__(self, loop, cookies: Optional[Dict[str, str]], headers: Optional[Dict[str, str]]):
+        self.loop = loop
+        self.cookies = cookies
+        self.headers = headers
+        self.entries: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        # The batch is sent at the most urgent priority of its callers, and may
+        # take as long as the most patient one (no deadline if any has none).
+        self.priority = rate_limit.BACKGROUND
+        self.expires_at = deadline.expires_at()
+
+
+class MusicuBatcher:
+    """Coalesces concurrent ``musicu.fcg`` sub-requests into one round trip."""
+
+    def __init__(
+        self,
+        window: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        signed: Optional[bool] = None,
+        comm: Optional[Dict[str, Any]] = None,
+        url: Optional[str] = None,
+    ):
+        self.window = window if window is not None else float(os.getenv("QQM_BATCH_WINDOW_MS", "2")) / 1e3
+        self.max_batch = max_batch or int(os.getenv("QQM_BATCH_MAX", "20"))
+        self.signed = signed if signed is not None else os.getenv("QQM_BATCH_SIGNED", "0") == "1"
+        self.comm = dict(comm or DEFAULT_COMM)
+        self.url = url or (MUSICS_URL if self.signed else MUSICU_URL)
+        self.endpoint = "musics" if self.signed else "musicu"
+        self._pending: Dict[str, _Batch] = {}
+        self._sending: Set[asyncio.Task] = set()  # Strong references until each send finishes
+        self.calls = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.errors = 0
+        self.latency = LatencyWindow()
+
+    async def call(
+        self,
+        module: str,
+        method: str,
+        param: Dict[str, Any],
+        cookies: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        alone: bool = False,
+    ) -> Dict[str, Any]:
+        """Queue one sub-request and return its ``{"code": ..., "data": ...}`` sub-response.
+
+        ``alone`` sends it right away in a request of its own, for callers that
+        already sized it to what upstream accepts in one request (bulk chunks).
+        """
+        loop = asyncio.get_running_loop()
+        # Only calls with the same cookies and headers can share a request.
+        key = json_codec.dumps([cookies or {}, headers or {}], separators=(",", ":"), sort_keys=True)
+        batch = None if alone else self._pending.get(key)
+        if alone:
+            batch = _Batch(loop, cookies, headers)
+        elif batch is None or batch.loop is not loop:
+            batch = self._pending[key] = _Batch(loop, cookies, headers)
+            batch.timer = loop.call_later(self.window, self._flush, key, batch)
+        future = loop.create_future()
+        batch.entries.append(({"module": module, "method": method, "param": param}, future))
+        batch.priority = min(batch.priority, rate_limit.current_priority())
+        expires = deadline.expires_at()
+        if batch.expires_at is not None:
+            batch.expires_at = None if expires is None else max(batch.expires_at, expires)
+        self.calls += 1
+        if alone:
+            self._flush(key, batch)
+        elif len(batch.entries) >= self.max_batch:
+            batch.timer.cancel()
+            self._flush(key, batch)
+        deadline.enter("batch", self.endpoint)
+        return await future
+
+    def _flush(self, key: str, batch: _Batch) -> None:
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: _Batch) -> None:
+        entries = batch.entries
+        body: Dict[str, Any] = {"comm": self.comm}
+        for index, (request, _) in enumerate(entries):
+            body[f"req_{index}"] = request
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(entries))
+        started = time.perf_counter()
+        try:
+            with rate_limit.priority(batch.priority), deadline.scope_until("musicu batch", batch.expires_at):
+                response = await self._post(body, batch)
+                result = json_codec.loads(response.content)
+        except Exception as exc:
+            self.errors += 1
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.latency.add(time.perf_counter() - started)
+
+        code = result.get("code")
+        answers = [result.get(f"req_{index}") for index in range(len(entries))]
+        codes = [code] + [sub.get("code") for sub in answers if isinstance(sub, dict)]
+        # The transport has already reported a throttling code to the rate limiter.
+        # Score the account behind these cookies by its worst answer.
+        worst = next((sub_code for sub_code in codes if sub_code in (THROTTLED, cookie_pool.LOGIN_EXPIRED)), code)
+        cookie_pool.observe(batch.cookies, worst)
+        for (request, future), sub in zip(entries, answers):
+            if future.done():
+                continue
+            if sub is None or code == THROTTLED:
+                future.set_exception(MusicuError(code, f"musicu.fcg returned no answer for {request['method']} (code {code})"))
+            elif sub.get("code", 0) != 0:
+                sub_code = sub.get("code")
+                future.set_exception(MusicuError(sub_code, f"musicu.fcg answered {request['method']} with code {sub_code}"))
+            else:
+                future.set_result(sub)
+
+    async def _post(self, body: Dict[str, Any], batch: _Batch):
+        import http_transport
+
+        # The same bytes httpx's ``json=`` would send, encoded by the project codec.
+        payload = json_codec.dumps(body, separators=(",", ":"), ensure_ascii=False)
+        if self.signed:
+            deadline.check("sign", self.endpoint)
+            sign = await qqmusic_sign.get_signer().sign(payload)
+            return await http_transport.get_transport().request(
+                "POST",
+                self.url,
+                params={"_": int(time.time() * 1000), "sign": sign},
+                content=payload.encode("utf-8"),
+                cookies=batch.cookies,
+                headers=batch.headers,
+                endpoint=self.endpoint,
+            )
+        return await http_transport.get_transport().request(
+            "POST",
+            self.url,
+            content=payload.encode("utf-8"),
+            cookies=batch.cookies,
+            headers={**(batch.headers or {}), "Content-Type": "application/json"},
+            endpoint=self.endpoint,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "batches": self.batches,
+            "avg_batch_size": ratio(self.calls, self.batches),
+            "max_batch_size": self.max_batch_seen,
+            "round_trips_saved": max(self.calls - self.batches, 0),
+            "errors": self.errors,
+            "window_ms": self.window * 1e3,
+            "signed": self.signed,
+            **self.latency.snapshot(),
+        }
+
+
+_BATCHER: Optional[MusicuBatcher] = None
+
+
+def get_batcher() -> MusicuBatcher:
+    """Return the process-wide :class:`MusicuBatcher`."""
+    global _BATCHER
+    if _BATCHER is None:
+        _BATCHER = MusicuBatcher()
+    return _BATCHER
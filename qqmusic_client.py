@@ -1,11 +1,29 @@
 import time
 import base64
-import httpx
-import json
 import random
-import re
-import execjs
 import string
+from contextlib import aclosing
+
+import cookie_pool
+import deadline
+import embedded_json
+import json_codec
+import lyrics_index
+import metadata_store
+import pagination
+import qqmusic_batch
+import qqmusic_sign
+import search_cache
+import single_flight
+
+PLAYLIST_PAGE_SIZE = 15
+
+
+def _page_errors():
+    # 分页请求失败后单独重试的错误类型；httpx 在用到时才导入，保持模块导入轻量
+    import httpx
+
+    return (httpx.HTTPError, qqmusic_batch.MusicuError, ValueError, KeyError)
 
 
 class QQ_Music:
@@ -20,8 +38,6 @@ class QQ_Music:
             'User-Agent': 'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Mobile Safari/537.36 Edg/123.0.0.0',
             'Referer': 'https://y.qq.com/',
         }
-        with open("./main.js", 'r', encoding='utf-8') as f:
-            self.js_code = f.read()
         self._cookies = {}
 
     def set_cookie(self, cookie):  # 网页Cookie转换到Python字典格式
@@ -34,66 +50,76 @@ class QQ_Music:
                 list_ret[parts[0]] = parts[1] + '=' + parts[2]
         return list_ret
 
-    def get_sign(self, data):  # QQMusic_Sign算法
-        return execjs.compile(self.js_code).call("o", data)
+    async def get_sign(self, data):  # QQMusic_Sign算法
+        return await qqmusic_sign.get_signer().legacy_sign(data)
 
     async def _request(self, method, url, **kwargs):
-        method = method.upper()
-        async with httpx.AsyncClient() as client:
-            return await client.request(method, url, **kwargs)
+        import http_transport
 
+        return await http_transport.get_transport().request(method, url, **kwargs)
+
+    @single_flight.shared('playsong', lambda self, music_mid: (music_mid, self._cookies.get('uin', '')))
     async def get_music_url(self, music_mid):  # 通过Mid获取音乐播放URL
-        response = await self._request(
-            'GET',
+        data = await embedded_json.fetch_embedded_json(
             f'https://i.y.qq.com/v8/playsong.html?songmid={music_mid}&_qmp=0',
+            embedded_json.SSR_FIRST_PAGE_DATA,
             cookies=self._cookies,
             headers=self.headers_mobile,
         )
-        if response.status_code != 200:
+        if data is None:
             return {}
-        return json.loads(re.findall('__ssrFirstPageData__\\s=(.*?)</script>', response.text)[0])['songList'][0]['url']
+        return data['songList'][0]['url']
 
+    @metadata_store.read_through('track')
     async def get_music_info(self, music_id):  # 通过音乐的ID获取歌曲信息
-        uin = ''.join(random.sample('1234567890', 10))
-        data = {"comm": {"cv": 4747474, "ct": 24, "format": "json", "inCharset": "utf-8", "outCharset": "utf-8",
-                         "notice": 0, "platform": "yqq.json", "needNewCode": 1, "uin": uin,
-                         "g_tk_new_20200303": 708550273, "g_tk": 708550273},
-                "req_1": {"module": "music.trackInfo.UniformRuleCtrl", "method": "CgiGetTrackInfo",
-                          "param": {"ids": [music_id], "types": [0]}}}
-        response = await self._request(
-            'GET',
-            'https://u.y.qq.com/cgi-bin/musicu.fcg?data={}'.format(json.dumps(data)),
-            headers=self._headers,
-            cookies=self._cookies,
-        )
-        result = json.loads(response.text)
-        if result['code'] == 500001:
-            return 'Error'
-        return result['req_1']['data']['tracks']
+        return await self.get_music_infos([music_id])
 
+    async def get_music_infos(self, music_ids, alone=False):  # 一次请求获取多首歌曲信息，批量接口见 qqmusic_service.get_track_infos
+        # alone=True 时不与其他调用合并，按调用方分好的块单独发送
+        try:
+            result = await qqmusic_batch.get_batcher().call(
+                'music.trackInfo.UniformRuleCtrl',
+                'CgiGetTrackInfo',
+                {"ids": list(music_ids), "types": [0] * len(music_ids)},
+                cookies=self._cookies,
+                headers=self._headers,
+                alone=alone,
+            )
+        except qqmusic_batch.MusicuError as exc:
+            if exc.code == qqmusic_batch.THROTTLED:
+                return 'Error'
+            raise
+        return result['data']['tracks']
+
+    @metadata_store.read_through('album')
     async def get_album_info(self, album_mid):  # 获取专辑信息
-        response = await self._request(
-            'GET',
+        data = await embedded_json.fetch_embedded_json(
             f'https://i.y.qq.com/n2/m/share/details/album.html?ADTAG=ryqq.albumDetail&source=ydetail&albummid={album_mid}',
+            embedded_json.FIRST_PAGE_DATA,
             cookies=self._cookies,
             headers=self.headers_mobile,
         )
-        if response.status_code != 200:
+        if data is None:
             return {}
-        return json.loads(re.findall('firstPageData\\s=(.*?)\n', response.text)[0])
+        return data
 
+    @single_flight.shared('search', lambda self, name, page, limit=20: (search_cache.normalize_query(name), page, limit))
     async def search_music(self, name, page, limit=20):  # 搜索歌曲,name歌曲名,limit返回数量
+        return await search_cache.get_search_cache().get_or_fetch(name, page, limit, self._search_music_remote)
+
+    async def _search_music_remote(self, name, page, limit):
         response = await self._request(
             'GET',
             'https://shc.y.qq.com/soso/fcgi-bin/search_for_qq_cp?_=1657641526460&g_tk=1037878909&uin=1804681355&format=json&inCharset=utf-8&outCharset=utf-8&notice=0'
             '&platform=h5&needNewCode=1&w={}&zhidaqu=1&catZhida=1&t=0&flag=1&ie=utf-8&sem=1'
             '&aggr=0&perpage={}&n={}&p={}&remoteplace=txt.mqq.all'.format(name, limit, limit, page),
             headers=self._headers,
+            endpoint='search',
         )
-        return response.json()['data']['song']['list']
+        return json_codec.loads(response.content)['data']['song']['list']
 
     async def search_music_2(self, name, limit=20):  # 搜索歌曲,name歌曲名,limit返回数量
-        data = json.dumps(
+        data = json_codec.dumps(
             {"comm": {"g_tk": 997034911, "uin": ''.join(random.sample(string.digits, 10)), "format": "json",
                        "inCharset": "utf-8",
                        "outCharset": "utf-8", "notice": 0, "platform": "h5", "needNewCode": 1, "ct": 23, "cv": 0},
@@ -117,17 +143,18 @@ class QQ_Music:
                               'UCBrowser/12.8.2.1268 Mobile AliApp(TUnionSDK/0.1.20.3)',
             },
             data=data,
+            endpoint='search',
         )
-        return response.json()['req_0']['data']['body']['song']['list']
+        return json_codec.loads(response.content)['req_0']['data']['body']['song']['list']
 
+    @metadata_store.read_through('playlist')
     async def get_playlist_info(self, playlist_id):  # 通过歌单ID获取歌单信息
-        response = await self._request(
-            'GET',
+        return await embedded_json.fetch_embedded_json(
             f'https://y.qq.com/n/ryqq/playlist/{playlist_id}',
+            embedded_json.INITIAL_DATA,
             headers=self._headers,
             cookies=self._cookies,
         )
-        return json.loads(str(re.findall('window.__INITIAL_DATA__ =(.*?)</script>', response.text)[0]).replace('undefined', '"undefined"'))
 
     async def get_playlist_info_num(self, playlist_id, song_num):
         data = {
@@ -138,7 +165,7 @@ class QQ_Music:
                     "disstid": playlist_id,
                     "onlysonglist": 1,
                     "song_begin": song_num,
-                    "song_num": 15
+                    "song_num": PLAYLIST_PAGE_SIZE
                 }
             },
             "comm": {
@@ -150,50 +177,91 @@ class QQ_Music:
         }
         response = await self._request(
             'GET',
-            'https://u.y.qq.com/cgi-bin/musicu.fcg?data={}'.format(json.dumps(data)),
+            'https://u.y.qq.com/cgi-bin/musicu.fcg?data={}'.format(json_codec.dumps(data)),
             headers=self._headers,
             cookies=self._cookies,
+            endpoint='musicu',
         )
-        resp = json.loads(response.text)
-        if resp['code'] == 500001:
+        resp = json_codec.loads(response.content)
+        cookie_pool.observe(self._cookies, resp['code'])
+        if resp['code'] == 500001:  # 限流已由 http_transport 按响应体上报
             return 'Error'
         return resp
 
+    async def iter_playlist_songs(self, playlist_id, limit=None):  # 按顺序并发分页读取歌单全部歌曲
+        async def fetch(page):
+            resp = await self.get_playlist_info_num(playlist_id, page * PLAYLIST_PAGE_SIZE)
+            if resp == 'Error':
+                raise qqmusic_batch.MusicuError(qqmusic_batch.THROTTLED, f'CgiGetDiss throttled at song {page * PLAYLIST_PAGE_SIZE}')
+            return resp['req_0']['data']
+
+        # 第一页单独请求以得到歌曲总数，其余页按顺序并发获取，消费方停止迭代时取消未完成的请求
+        crawler = pagination.get_page_crawler()
+        page_errors = _page_errors()
+        first = await crawler.fetch_page(fetch, 0, page_errors)
+        total = first.get('total_song_num') or (first.get('dirinfo') or {}).get('songnum')
+        wanted = total if limit is None else (limit if total is None else min(limit, total))
+        if wanted is not None and wanted <= 0:
+            return
+
+        def short(data):
+            return len(data.get('songlist') or []) < PLAYLIST_PAGE_SIZE
+
+        yielded = 0
+        for song in (first.get('songlist') or [])[:wanted]:
+            yield song
+            yielded += 1
+        if short(first) or yielded == wanted:
+            return
+        count = -(-wanted // PLAYLIST_PAGE_SIZE) if wanted is not None else None
+        async with aclosing(crawler.crawl(fetch, count=count, start=1, is_last=short, retry_on=page_errors)) as pages:
+            async for page in pages:
+                for song in page.get('songlist') or []:
+                    if yielded == wanted:
+                        return
+                    yield song
+                    yielded += 1
+
     async def get_recommended_playlist(self):
-        response = await self._request(
-            'GET',
+        return await embedded_json.fetch_embedded_json(
             'https://y.qq.com/n/ryqq/category',
+            embedded_json.INITIAL_DATA,
             headers=self._headers,
             cookies=self._cookies,
         )
-        return json.loads(str(re.findall('window.__INITIAL_DATA__ =(.*?)</script>', response.text)[0]).replace('undefined', '"undefined"'))
 
+    @single_flight.shared('lyrics', lambda self, mid: mid)
     async def get_lyrics(self, mid):
+        lyrics = await self._get_lyrics(mid)
+        lyrics_index.get_lyrics_index().add(mid, lyrics)
+        return lyrics
+
+    @metadata_store.read_through('lyrics')
+    async def _get_lyrics(self, mid):
         response = await self._request(
             'GET',
             'https://c.y.qq.com/lyric/fcgi-bin/fcg_query_lyric_new.fcg?_={}&format=json&loginUin={}&songmid={}'.format(
                 time.time(), ''.join(random.sample('1234567890', 10)), mid),
             headers=self._headers,
             cookies=self._cookies,
+            endpoint='lyrics',
         )
-        return base64.b64decode(response.json()['lyric']).decode('utf-8')
+        return base64.b64decode(json_codec.loads(response.content)['lyric']).decode('utf-8')
 
     async def get_radio_info(self):
-        response = await self._request(
-            'GET',
+        return await embedded_json.fetch_embedded_json(
             'https://y.qq.com/n/ryqq/radio',
+            embedded_json.INITIAL_DATA,
             headers=self._headers,
             cookies=self._cookies,
         )
-        return json.loads(str(re.findall('window.__INITIAL_DATA__ =(.*?)</script>', response.text)[0]).replace('undefined', '"undefined"'))
 
     async def get_toplist_music(self):
-        response = await self._request(
-            'GET',
+        return await embedded_json.fetch_embedded_json(
             'https://i.y.qq.com/n2/m/share/details/toplist.html?ADTAG=ryqq.toplist&type=0&id=4',
+            embedded_json.FIRST_PAGE_DATA,
             headers=self.headers,
         )
-        return json.loads(re.compile('firstPageData\\s=(.*?)\n').findall(response.text)[0])
 
     async def get_mv_url(self, vid):
         data = {"comm": {"ct": 6, "cv": 0, "g_tk": 1366999994, "uin": ''.join(random.sample('1234567890', 10)),
@@ -210,28 +278,27 @@ class QQ_Music:
         response = await self._request(
             'POST',
             'https://u.y.qq.com/cgi-bin/musicu.fcg',
-            data=json.dumps(data),
-            timeout=1,
+            data=json_codec.dumps(data),
             headers=self._headers,
+            endpoint='mv',
         )
-        return response.json()
+        return json_codec.loads(response.content)
 
     async def get_singer_album_info(self, mid):
         uin = ''.join(random.sample('1234567890', 10))
-        data = {"req_0": {"module": "music.homepage.HomepageSrv", "method": "GetHomepageTabDetail",
-                          "param": {"uin": uin, "singerMid": mid, "tabId": "album", "page": 0,
-                                    "pageSize": 10, "order": 0}},
-                "comm": {"g_tk": 1666686892, "uin": int(uin), "format": "json", "platform": "h5", "ct": 23}}
-        response = await self._request(
-            'GET',
-            'https://u.y.qq.com/cgi-bin/musicu.fcg?data={}'.format(json.dumps(data)),
-            headers=self._headers,
-            cookies=self._cookies,
-        )
-        resp = response.json()
-        if resp['code'] == 500001:
-            return 'Error'
-        return resp['req_0']['data']['list']
+        try:
+            result = await qqmusic_batch.get_batcher().call(
+                'music.homepage.HomepageSrv',
+                'GetHomepageTabDetail',
+                {"uin": uin, "singerMid": mid, "tabId": "album", "page": 0, "pageSize": 10, "order": 0},
+                cookies=self._cookies,
+                headers=self._headers,
+            )
+        except qqmusic_batch.MusicuError as exc:
+            if exc.code == qqmusic_batch.THROTTLED:
+                return 'Error'
+            raise
+        return result['data']['list']
 
     async def get_Toplist_Info(self):
         data = {
@@ -254,14 +321,18 @@ class QQ_Music:
                 "param": {}
             }
         }
+        body = json_codec.dumps(data, separators=(',', ':'))
+        deadline.check('sign', 'musics')
+        sign = await self.get_sign(body)
         response = await self._request(
             'GET',
-            'https://u.y.qq.com/cgi-bin/musics.fcg?_={}&sign={}'.format(int(time.time() * 1000), self.get_sign(data)),
+            'https://u.y.qq.com/cgi-bin/musics.fcg?_={}&sign={}'.format(int(time.time() * 1000), sign),
             headers=self._headers,
             cookies=self._cookies,
-            data=json.dumps(data, separators=(',', ':')),
+            data=body,
+            endpoint='musics',
         )
-        return response.json()['req_1']
+        return json_codec.loads(response.content)['req_1']
 
     @property
     def headers(self):
@@ -5,17 +5,42 @@ The tools mirror Flask helpers so that an LLM or tooling agent can search QQ Mus
 or resolve playback URLs without hitting HTTP endpoints directly.
 """
 
-import json
+import functools
+import time
 from pathlib import Path
-from typing import Annotated, Dict, List
+from typing import Annotated, Any, Dict, Iterable, List, Optional
 
 from fastmcp.server.server import FastMCP
-from pydantic import BaseModel, Field
-
+from pydantic import BaseModel, Field, TypeAdapter
+from typing_extensions import TypedDict
+
+import cookie_pool
+import deadline
+import http_transport
+import json_codec
+import lyrics_index
+import metadata_store
+import pagination
+import prefetch
+import qqmusic_batch
 import qqmusic_service
+import rate_limit
+import search_cache
+import single_flight
+import url_cache
 from qqmusic_service import build_main_client, build_service_client
 
-__all__ = ["build_manifest", "manifest", "search_music_by_lyrics", "get_music_url_by_songmid"]
+__all__ = [
+    "build_manifest",
+    "manifest",
+    "search_music_by_lyrics",
+    "get_music_url_by_songmid",
+    "get_music_urls",
+    "get_song_qualities",
+    "get_track_infos",
+    "get_playlist_songs",
+    "get_service_stats",
+]
 
 MANIFEST_NAME = "qqmusic_mcp"
 MANIFEST_VERSION = "1.0"
@@ -23,19 +48,31 @@ MANIFEST_DESCRIPTION = (
     "Defines MCP tools that allow AI clients to search QQ Music and resolve playback URLs."
 )
 
-manifest = FastMCP(name=MANIFEST_NAME, instructions=MANIFEST_DESCRIPTION)
+manifest = FastMCP(
+    name=MANIFEST_NAME,
+    instructions=MANIFEST_DESCRIPTION,
+    lifespan=http_transport.warmup_lifespan(),
+)
 
 
-class SongMetadata(BaseModel):
-    """Normalized schema for QQ Music search results."""
+class SongMetadata(TypedDict):
+    """Normalized schema for QQ Music search results.
+
+    A plain dict rather than a model, so a page of songs is validated in one
+    :data:`_SONG_LIST` call instead of one model instance per song. None of its
+    fields hold URLs.
+    """
+
+    songname: Annotated[str, Field(description="Human-readable title of the song.")]
+    singer: Annotated[str, Field(description="Primary singer name.")]
+    albumname: Annotated[str, Field(description="Album title.")]
+    duration: Annotated[str, Field(description="Duration formatted as M:SS.")]
+    songmid: Annotated[str, Field(description="QQ Music songmid identifier.")]
+    songid: Annotated[int, Field(description="Numeric QQ Music song ID.")]
+    albummid: Annotated[str, Field(description="QQ Music album identifier.")]
 
-    songname: str = Field(description="Human-readable title of the song.")
-    singer: str = Field(description="Primary singer name.")
-    albumname: str = Field(description="Album title.")
-    duration: str = Field(description="Duration formatted as M:SS.")
-    songmid: str = Field(description="QQ Music songmid identifier.")
-    songid: int = Field(description="Numeric QQ Music song ID.")
-    albummid: str = Field(description="QQ Music album identifier.")
+
+_SONG_LIST = TypeAdapter(List[SongMetadata])
 
 
 class MusicUrlInfo(BaseModel):
@@ -47,17 +84,87 @@ class MusicUrlInfo(BaseModel):
     bitrate: str = Field(description="Descriptive bitrate string returned by the service.")
 
 
-def _replace_http_with_https(data):
-    if isinstance(data, dict):
-        return {k: _replace_http_with_https(v) for k, v in data.items()}
-    if isinstance(data, list):
-        return [_replace_http_with_https(item) for item in data]
-    if isinstance(data, str):
-        return data.replace("http://", "https://")
-    return data
+class MusicUrlResult(BaseModel):
+    """Per-song entry of a bulk playback URL resolution."""
+
+    songmid: str = Field(description="QQ Music songmid identifier.")
+    file_type: str = Field(description="Requested audio quality code.")
+    status: str = Field(description="'ok', 'vip' (needs a VIP account) or 'unavailable'.")
+    url: Optional[str] = Field(default=None, description="Resolved HTTPS playback URL when status is 'ok'.")
+    bitrate: Optional[str] = Field(default=None, description="Descriptive bitrate string when status is 'ok'.")
+
+
+class TrackInfoResult(BaseModel):
+    """Per-song entry of a bulk track metadata lookup."""
+
+    songid: int = Field(description="Numeric QQ Music song ID.")
+    status: str = Field(description="'ok' or 'unavailable'.")
+    track: Optional[SongMetadata] = Field(default=None, description="Song metadata when status is 'ok'.")
+
+
+def _timed(fn):
+    """Run each tool under its deadline and one leased account, and report its latency and outcome.
+
+    Lookups for a ``songmid`` stick to the account that resolved its URL before.
+    """
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        tracker = deadline.get_tracker()
+        outcome, stage = "error", None
+        try:
+            with deadline.scope(fn.__name__), qqmusic_service.registry.lease(kwargs.get("songmid")):
+                result = await deadline.bounded(fn(*args, **kwargs))
+            outcome = "ok"
+            return result
+        except deadline.DeadlineExceeded as exc:
+            outcome, stage = "timeout", exc.stage
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            tracker.record_tool(fn.__name__, outcome, stage, elapsed)
+            qqmusic_service.registry.record_call(fn.__name__, elapsed)
+
+    return wrapper
+
+
+def _song_row(song: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a search hit, a lyrics-index entry or a playlist track to SongMetadata's fields."""
+    singers = song.get("singer")
+    if isinstance(singers, list):
+        first = singers[0] if singers else None
+        singer_name = (first.get("name") or "") if isinstance(first, dict) else ""
+    else:
+        singer_name = singers if isinstance(singers, str) else ""
+    # Playlist and toplist tracks use the newer field names with a nested album.
+    album = song.get("album")
+    if not isinstance(album, dict):
+        album = {}
+    interval = song.get("interval") or 0
+    return {
+        "songname": (song.get("songname") or song.get("name") or "").replace('"', ""),
+        "singer": singer_name.replace('"', ""),
+        "albumname": song.get("albumname") or album.get("name") or "",
+        "duration": f"{interval // 60}:{interval % 60:02d}",
+        "songmid": song.get("songmid") or song.get("mid") or "",
+        # Newer payloads carry the numeric ID as ``id``, and either may be null.
+        "songid": song.get("songid") or song.get("id") or 0,
+        "albummid": song.get("albummid") or album.get("mid") or "",
+    }
+
+
+def _song_list(songs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalize raw songs to SongMetadata dicts in one pass, validated as a whole."""
+    return _SONG_LIST.validate_python([_song_row(song) for song in songs])
+
+
+def _song_metadata(song: Dict[str, Any]) -> Dict[str, Any]:
+    return _song_list((song,))[0]
 
 
 @manifest.tool(description="Search QQ Music by lyric keywords and return normalized song metadata.")
+@_timed
 async def search_music_by_lyrics(
     lyrics: Annotated[str, Field(description="Lyrics fragment or song title to search for.")],
     page: Annotated[int, Field(description="Result page number (1-indexed).")] = 1,
@@ -68,32 +175,33 @@ async def search_music_by_lyrics(
 
     page = max(page, 1)
     limit = max(limit, 1)
+    index = lyrics_index.get_lyrics_index()
+    # Confident matches against lyrics fetched earlier skip the remote search when
+    # they fill the page, and otherwise come first ahead of the remote results.
+    local = _song_list(index.search(lyrics, limit)) if page == 1 else []
+    if len(local) >= limit:
+        return _prefetch_urls(local)
+
     qqm = build_main_client()
-    raw_songs = await qqm.search_music(lyrics, page, limit)
-    normalized = []
-
-    for song in raw_songs[:limit]:
-        singers = song.get("singer") or []
-        singer_name = ""
-        if singers and isinstance(singers, list):
-            first = singers[0]
-            singer_name = first.get("name", "") if isinstance(first, dict) else ""
-        normalized.append(
-            SongMetadata(
-                songname=song.get("songname", "").replace('"', ""),
-                singer=singer_name.replace('"', ""),
-                albumname=song.get("albumname", ""),
-                duration=f"{song.get('interval', 0) // 60}:{song.get('interval', 0) % 60:02d}",
-                songmid=song.get("songmid", ""),
-                songid=song.get("songid", ""),
-                albummid=song.get("albummid", ""),
-            ).dict()
-        )
-
-    return _replace_http_with_https(normalized)
+    raw_songs = (await qqm.search_music(lyrics, page, limit))[:limit]
+    normalized = _song_list(raw_songs)
+    for entry, song in zip(normalized, raw_songs):
+        index.add_meta(entry["songmid"], {**entry, "interval": song.get("interval") or 0})
+
+    seen = {song["songmid"] for song in local}
+    return _prefetch_urls((local + [song for song in normalized if song["songmid"] not in seen])[:limit])
+
+
+def _prefetch_urls(songs: List[Dict]) -> List[Dict]:
+    # Opt-in: resolve the top hits in the background for the likely follow-up URL call.
+    prefetcher = prefetch.get_prefetcher()
+    if prefetcher.enabled:
+        prefetcher.schedule((song["songmid"] for song in songs), build_service_client())
+    return songs
 
 
 @manifest.tool(description="Retrieve a playback URL for a given QQ Music songmid and quality.")
+@_timed
 async def get_music_url_by_songmid(
     songmid: Annotated[str, Field(description="QQ Music songmid identifier.")],
     file_type: Annotated[
@@ -110,14 +218,130 @@ async def get_music_url_by_songmid(
         raise ValueError("songmid is required for get_music_url_by_songmid")
 
     qqmusic = build_service_client()
+    prefetcher = prefetch.get_prefetcher()
+    started = time.perf_counter()
+    await prefetcher.settle(songmid, file_type)
     result = await qqmusic.get_music_url(songmid, file_type)
+    prefetcher.record_followup(songmid, file_type, time.perf_counter() - started)
 
     if not result:
+        if qqmusic.is_vip_only(songmid, file_type):
+            fallback = qqmusic.known_lower_quality(songmid, file_type)
+            hint = (
+                f"quality '{fallback}' is known to work" if fallback
+                else "no lower quality is known to work yet; get_song_qualities lists what is available"
+            )
+            raise LookupError(f"{songmid} @ {file_type} needs a VIP account; {hint}")
         raise LookupError(f"No URL available for {songmid} @ {file_type}")
 
     return MusicUrlInfo(songmid=songmid, file_type=file_type, **result).dict()
 
 
+@manifest.tool(description="Resolve playback URLs for many QQ Music songmids at once, in input order.")
+@_timed
+async def get_music_urls(
+    songmids: Annotated[List[str], Field(description="QQ Music songmid identifiers to resolve.")],
+    file_type: Annotated[
+        str,
+        Field(description="Audio quality for every song: 'm4a', '128', '320' or 'flac' (default: '128')."),
+    ] = "128",
+    file_types: Annotated[
+        Optional[Dict[str, str]],
+        Field(description="Optional per-song quality overrides, mapping songmid to quality code."),
+    ] = None,
+) -> List[Dict]:
+    if not songmids:
+        raise ValueError("songmids is required for get_music_urls")
+
+    overrides = file_types or {}
+    qqmusic = build_service_client()
+    results = await qqmusic.get_music_urls(
+        [(songmid, overrides.get(songmid, file_type)) for songmid in songmids]
+    )
+    return [MusicUrlResult(**result).dict() for result in results]
+
+
+@manifest.tool(
+    description=(
+        "List the audio qualities available for a QQ Music songmid, with their playback URLs "
+        "and the highest one, using a single upstream request."
+    )
+)
+@_timed
+async def get_song_qualities(
+    songmid: Annotated[str, Field(description="QQ Music songmid identifier.")],
+) -> Dict:
+    if not songmid:
+        raise ValueError("songmid is required for get_song_qualities")
+
+    return await qqmusic_service.get_song_qualities(songmid)
+
+
+@manifest.tool(
+    description=(
+        "Look up song metadata for many numeric QQ Music song IDs at once, in input order; "
+        "IDs are fetched in concurrent batches and cached for later lookups."
+    )
+)
+@_timed
+async def get_track_infos(
+    songids: Annotated[List[int], Field(description="Numeric QQ Music song IDs (songid) to look up.")],
+) -> List[Dict]:
+    if not songids:
+        raise ValueError("songids is required for get_track_infos")
+
+    results = await qqmusic_service.get_track_infos(songids)
+    return [
+        TrackInfoResult(
+            songid=result["songid"],
+            status=result["status"],
+            track=_song_metadata(result["track"]) if result["track"] else None,
+        ).dict()
+        for result in results
+    ]
+
+
+@manifest.tool(
+    description=(
+        "List the songs of a QQ Music playlist in order, fetching its pages concurrently "
+        "and stopping once `limit` songs have been read."
+    )
+)
+@_timed
+async def get_playlist_songs(
+    playlist_id: Annotated[str, Field(description="QQ Music playlist (disstid) identifier.")],
+    limit: Annotated[int, Field(description="Maximum number of songs to return.")] = 100,
+) -> List[Dict]:
+    if not playlist_id:
+        raise ValueError("playlist_id is required for get_playlist_songs")
+
+    qqm = build_main_client()
+    songs = []
+    async for song in qqm.iter_playlist_songs(playlist_id, max(limit, 1)):
+        songs.append(song)
+    return _song_list(songs)
+
+
+@manifest.tool(description="Report startup, first-call latency, client, connection-pool, cache and timeout statistics for this server.")
+async def get_service_stats() -> Dict[str, Any]:
+    return {
+        "registry": qqmusic_service.registry.stats(),
+        "transport": http_transport.get_transport().stats(),
+        "musicu_batcher": qqmusic_batch.get_batcher().stats(),
+        "url_cache": url_cache.get_url_cache().stats(),
+        "search_cache": search_cache.get_search_cache().stats(),
+        "metadata_store": metadata_store.get_metadata_store().stats(),
+        "lyrics_index": lyrics_index.get_lyrics_index().stats(),
+        "url_prefetch": prefetch.get_prefetcher().stats(),
+        "page_crawler": pagination.get_page_crawler().stats(),
+        "rate_limiter": rate_limit.get_limiter().stats(),
+        "deadlines": deadline.get_tracker().stats(),
+        "single_flight": single_flight.get_single_flight().stats(),
+        "cookie_pool": cookie_pool.stats(),
+        "json_codec": json_codec.stats(),
+    }
+
+
 def build_manifest(manifest_path: Path | str = "qqmusic_mcp_manifest.json") -> None:
     tools = manifest._tool_manager.list_tools()
     manifest_content = {
@@ -137,10 +361,11 @@ def build_manifest(manifest_path: Path | str = "qqmusic_mcp_manifest.json") -> N
     }
 
     path = Path(manifest_path)
-    path.write_text(json.dumps(manifest_content, ensure_ascii=False, indent=2))
+    path.write_text(json_codec.dumps(manifest_content, ensure_ascii=False, indent=2))
 
 
 def main() -> None:
+    qqmusic_service.registry.mark_serving()
     manifest.run()
 
 
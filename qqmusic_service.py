@@ -1,41 +1,135 @@
-import json
+import asyncio
 import logging
 import os
+import re
 import time
-
-import execjs
-import httpx
-from dotenv import load_dotenv
-
+from collections import OrderedDict
+
+import cookie_pool
+import deadline
+import json_codec
+import json_stream
+import metadata_store
+import qqmusic_batch
 import qqmusic_client
-
-load_dotenv()
+import qqmusic_sign
+import rate_limit
+import single_flight
+import url_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 初始化QQ音乐对象
-cookie_str = os.getenv('QQM_COOKIE')
-if not cookie_str:
-    raise RuntimeError("QQM_COOKIE must be set (export an env var or add it to .env)")
+_IMPORTED_AT = time.perf_counter()
+# 流式响应中保留的开头字节数，找不到歌曲数组时从中读取返回码
+_STREAM_HEAD = 4096
+_CODE = re.compile(rb'"code"\s*:\s*(-?\d+)')
+
+
+class ClientRegistry:
+    """Process-wide QQ Music clients, built on first use and then reused.
+
+    Nothing is read at import time: ``.env`` is loaded, the cookies are parsed and
+    the clients are constructed the first time a tool needs them, so a respawned
+    server starts answering ``initialize`` as soon as its modules are imported.
+    Each account of the cookie pool gets its own pair of clients; the ones handed
+    out belong to the account leased by the calling tool (see ``cookie_pool``).
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.first_calls = {}
+
+    @property
+    def pool(self):
+        return cookie_pool.get_cookie_pool()
+
+    @property
+    def cookie_str(self):
+        return self.pool.accounts[0].cookie
+
+    def lease(self, sticky=None):
+        """Route the calls made in this block through the least busy account (``sticky``: a songmid)."""
+        return self.pool.lease(sticky)
+
+    def _account(self):
+        return cookie_pool.current_account() or self.pool.pick()
+
+    def main_client(self):
+        """Return the shared qqmusic_client.QQ_Music bound to the current account's cookie."""
+        account = self._account()
+        client = account.clients.get('main')
+        if client is None:
+            started = time.perf_counter()
+            client = qqmusic_client.QQ_Music()
+            client._cookies = client.set_cookie(account.cookie)
+            account.clients['main'] = client
+            self.timings.setdefault('main_client_build', time.perf_counter() - started)
+        return client
+
+    def service_client(self):
+        """Return the shared QQMusic helper bound to the current account's cookie."""
+        account = self._account()
+        client = account.clients.get('service')
+        if client is None:
+            started = time.perf_counter()
+            client = QQMusic()
+            client.set_cookies(account.cookie)
+            account.clients['service'] = client
+            self.timings.setdefault('service_client_build', time.perf_counter() - started)
+        return client
+
+    def mark_serving(self):
+        """Record how long it took from importing this module to serving requests."""
+        self.timings.setdefault('cold_start', time.perf_counter() - _IMPORTED_AT)
+        logger.info("qqmusic service ready %.3fs after import", self.timings['cold_start'])
+
+    def record_call(self, name, seconds):
+        """Remember the latency of the first call to ``name``."""
+        if name not in self.first_calls:
+            self.first_calls[name] = seconds
+            logger.info("first %s call took %.3fs", name, seconds)
+
+    def stats(self):
+        accounts = cookie_pool.accounts()
+        return {
+            'timings': dict(self.timings),
+            'first_calls': dict(self.first_calls),
+            'clients_built': {
+                'main': sum(1 for account in accounts if 'main' in account.clients),
+                'service': sum(1 for account in accounts if 'service' in account.clients),
+            },
+        }
+
+
+registry = ClientRegistry()
+
 
-QQM = qqmusic_client.QQ_Music()
-QQM._cookies = QQM.set_cookie(cookie_str)
+def __getattr__(name):
+    # Back-compat for ``qqmusic_service.QQM`` / ``qqmusic_service.cookie_str``.
+    if name == 'QQM':
+        return registry.main_client()
+    if name == 'cookie_str':
+        return registry.cookie_str
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def build_main_client(cookie=None):
-    """Return a new qqmusic_client.QQ_Music bound to the configured cookie."""
-    raw_cookie = cookie if cookie is not None else cookie_str
+    """Return the shared qqmusic_client.QQ_Music, or a new one bound to ``cookie``."""
+    if cookie is None:
+        return registry.main_client()
     client = qqmusic_client.QQ_Music()
-    if raw_cookie:
-        client._cookies = client.set_cookie(raw_cookie)
+    if cookie:
+        client._cookies = client.set_cookie(cookie)
     return client
 
 
 def build_service_client(cookie=None):
-    """Instantiate the higher-level QQMusic helper bound to the cookie."""
+    """Return the shared QQMusic helper, or a new one bound to ``cookie``."""
+    if cookie is None:
+        return registry.service_client()
     service_client = QQMusic()
-    service_client.set_cookies(cookie if cookie is not None else cookie_str)
+    service_client.set_cookies(cookie)
     return service_client
 
 class QQMusic:
@@ -76,9 +170,9 @@ class QQMusic:
         }
 
     async def _request(self, method, url, **kwargs):
-        method = method.upper()
-        async with httpx.AsyncClient() as client:
-            return await client.request(method, url, **kwargs)
+        import http_transport
+
+        return await http_transport.get_transport().request(method, url, **kwargs)
 
     def set_cookies(self, cookie_str):
         cookies = {}
@@ -88,71 +182,188 @@ class QQMusic:
         self.cookies = cookies
         return cookies
 
-    async def get_music_url(self, songmid, file_type='128'):
+    def _check_file_type(self, file_type):
+        if file_type not in self.file_config:
+            raise ValueError("Invalid file_type. Choose from 'm4a', '128', '320', 'flac'")
+
+    def _filename(self, songmid, file_type):
+        self._check_file_type(file_type)
+        file_info = self.file_config[file_type]
+        return f"{file_info['s']}{songmid}{songmid}{file_info['e']}"
+
+    def _url_key(self, songmid, file_type):
+        return (songmid, file_type, self.cookies.get('uin', ''))
+
+    async def _get_vkeys(self, songs, alone=False):
         """
-        获取音乐播放URL
+        用一次 CgiGetVkey 请求解析多首歌曲，并把可用的地址写入 url_cache
 
         参数:
-        songmid: str - 歌曲的MID
-        file_type: str - 音质类型，可选参数：'m4a', '128', '320', 'flac'
+        songs: list - (songmid, file_type) 元组列表
+        alone: bool - 为 True 时不与其他调用合并，按调用方分好的块单独发送
 
         返回:
-        dict - 包含音乐播放URL和比特率的字典
+        dict - (songmid, file_type) -> {'url', 'bitrate'}；VIP 歌曲为 None，响应中缺失的歌曲不出现
         """
-        if file_type not in self.file_config:
-            raise ValueError("Invalid file_type. Choose from 'm4a', '128', '320', 'flac'")
-
-        file_info = self.file_config[file_type]
-        file = f"{file_info['s']}{songmid}{songmid}{file_info['e']}"
-
-        req_data = {
-            'req_1': {
-                'module': 'vkey.GetVkeyServer',
-                'method': 'CgiGetVkey',
-                'param': {
-                    'filename': [file],
-                    'guid': self.guid,
-                    'songmid': [songmid],
-                    'songtype': [0],
-                    'uin': self.uin,
-                    'loginflag': 1,
-                    'platform': '20',
-                },
-            },
-            'loginUin': self.uin,
-            'comm': {
+        files = {self._filename(songmid, file_type): (songmid, file_type) for songmid, file_type in songs}
+        filenames = list(files)
+        data = await qqmusic_batch.get_batcher().call(
+            'vkey.GetVkeyServer',
+            'CgiGetVkey',
+            {
+                'filename': filenames,
+                'guid': self.guid,
+                'songmid': [songmid for songmid, _ in files.values()],
+                'songtype': [0] * len(files),
                 'uin': self.uin,
-                'format': 'json',
-                'ct': 24,
-                'cv': 0,
+                'loginflag': 1,
+                'platform': '20',
             },
-        }
-
-        response = await self._request(
-            'POST',
-            self.base_url,
-            json=req_data,
             cookies=self.cookies,
             headers=self.headers,
+            alone=alone,
         )
-        data = response.json()
 
-        purl = data['req_1']['data']['midurlinfo'][0]['purl']
-        if purl == '':
-            # VIP
-            return None
+        body = data.get('data') or {}
+        sip = (body.get('sip') or [''])[0]
+        # vkey 有效期（秒）
+        ttl = body.get('expiration')
+        cache = url_cache.get_url_cache()
+        resolved = {}
+        for index, info in enumerate(body.get('midurlinfo') or []):
+            filename = info.get('filename') or (filenames[index] if index < len(filenames) else None)
+            song = files.get(filename)
+            if song is None:
+                continue
+            purl = info.get('purl', '')
+            if purl == '':
+                # VIP：记入负缓存；响应中缺失的歌曲（临时失败）不缓存
+                resolved[song] = None
+                cache.put_vip(self._url_key(*song))
+                continue
+            prefix = purl[:4]
+            bitrate = next((config['bitrate'] for config in self.file_config.values() if config['s'] == prefix), '')
+            resolved[song] = {'url': sip + purl, 'bitrate': bitrate}
+            cache.put(self._url_key(*song), resolved[song], ttl)
+            cookie_pool.stick(song[0], self.cookies)
+        return resolved
+
+    async def _refresh_urls(self, keys):
+        await self._get_vkeys([(songmid, file_type) for songmid, file_type, _ in keys], alone=True)
+
+    def _cached_urls(self, songs):
+        """从 url_cache 取出已缓存的地址（已知需要 VIP 的为 None），并为即将过期的条目安排后台刷新"""
+        cache = url_cache.get_url_cache()
+        resolved = {}
+        stale = []
+        for song in songs:
+            key = self._url_key(*song)
+            if cache.is_vip(key):
+                resolved[song] = None
+                continue
+            cached = cache.get(key)
+            if cached is None:
+                continue
+            resolved[song] = cached
+            if cache.needs_refresh(key):
+                stale.append(key)
+        if stale:
+            cache.refresh(stale, self._refresh_urls)
+        return resolved
+
+    @single_flight.shared('music_url', lambda self, songmid, file_type='128': (songmid, file_type, self.cookies.get('uin', '')))
+    async def get_music_url(self, songmid, file_type='128'):
+        """
+        获取音乐播放URL
 
-        url = data['req_1']['data']['sip'][0] + purl
-        prefix = purl[:4]
-        bitrate = next((info['bitrate'] for key, info in self.file_config.items() if info['s'] == prefix), '')
+        参数:
+        songmid: str - 歌曲的MID
+        file_type: str - 音质类型，可选参数：'m4a', '128', '320', 'flac'
 
-        return {'url': url, 'bitrate': bitrate}
+        返回:
+        dict - 包含音乐播放URL和比特率的字典
+        """
+        self._check_file_type(file_type)
+        song = (songmid, file_type)
+        resolved = self._cached_urls([song])
+        if song not in resolved:
+            resolved = await self._get_vkeys([song])
+        return resolved.get(song)
+
+    def is_vip_only(self, songmid, file_type):
+        """该音质最近一次查询结果是否为需要 VIP（负缓存仍有效）"""
+        return url_cache.get_url_cache().is_vip(self._url_key(songmid, file_type), hit=False)
+
+    def known_lower_quality(self, songmid, file_type):
+        """
+        返回比 file_type 低、且 url_cache 中已有可用地址的最高音质，没有则返回 None
+        """
+        cache = url_cache.get_url_cache()
+        lower = QUALITY_ORDER[QUALITY_ORDER.index(file_type) + 1:] if file_type in QUALITY_ORDER else []
+        return next((ft for ft in lower if cache.peek(self._url_key(songmid, ft)) is not None), None)
+
+    async def get_music_urls(self, items, chunk_size=None, concurrency=None):
+        """
+        批量获取音乐播放URL
+
+        参数:
+        items: list - (songmid, file_type) 元组列表，每首歌可以指定不同音质
+        chunk_size: int - 每个 CgiGetVkey 请求包含的文件数（默认 QQM_VKEY_CHUNK 或 30）
+        concurrency: int - 同时进行的请求数（默认 QQM_VKEY_CONCURRENCY 或 4）
+
+        返回:
+        list - 与输入顺序一致，每项包含 songmid、file_type、status
+               （'ok' / 'vip' / 'unavailable'）以及 url 和 bitrate
+        """
+        chunk_size = chunk_size or int(os.getenv('QQM_VKEY_CHUNK', '30'))
+        semaphore = asyncio.Semaphore(concurrency or int(os.getenv('QQM_VKEY_CONCURRENCY', '4')))
+
+        requested = list(items)
+        for _, file_type in requested:
+            self._check_file_type(file_type)
+        songs = list(dict.fromkeys(requested))
+        resolved = self._cached_urls(songs)
+        missing = [song for song in songs if song not in resolved]
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+        import httpx
+
+        async def resolve(chunk):
+            async with semaphore:
+                try:
+                    resolved.update(await self._get_vkeys(chunk, alone=True))
+                except (httpx.HTTPError, qqmusic_batch.MusicuError, ValueError) as exc:
+                    logger.warning("CgiGetVkey chunk of %d files failed: %s", len(chunk), exc)
+
+        await asyncio.gather(*(resolve(chunk) for chunk in chunks))
+
+        results = []
+        for song in requested:
+            entry = {'songmid': song[0], 'file_type': song[1], 'status': 'unavailable', 'url': None, 'bitrate': None}
+            if song in resolved:
+                info = resolved[song]
+                if info is None:
+                    entry['status'] = 'vip'
+                else:
+                    entry.update(info, status='ok')
+            results.append(entry)
+        return results
     
+    @metadata_store.read_through('category_playlist', lambda value: value.get('code') == 0)
     async def get_category_playlist(self, disstid, cookie):
-        id = disstid
-        ck = cookie
-        # cookies = QQMusic.set_cookies(cookie_str)
-        data = json.dumps({
+        response = await self._request('POST', **await self._signed_post(self._category_playlist_body(disstid, cookie), cookie))
+        # print(response.json)
+        return json_codec.loads(response.content)['req_2']
+
+    async def iter_category_playlist_songs(self, disstid, cookie):
+        """
+        流式读取歌单歌曲：边接收响应边解码 songlist，逐首产出 (mid, name, singer, album, interval)，不构建完整 JSON 树
+        """
+        async for song in self._stream_songs(self._category_playlist_body(disstid, cookie), cookie, 'songlist'):
+            yield song
+
+    def _category_playlist_body(self, disstid, cookie):
+        return json_codec.dumps({
             "comm":{
                 "cv":4747474,
                 "ct":24,
@@ -162,7 +373,7 @@ class QQMusic:
                 "notice":0,
                 "platform":"yqq.json",
                 "needNewCode":1,
-                "uin":ck['uin'],
+                "uin":cookie['uin'],
                 "g_tk_new_20200303":780715403,
                 "g_tk":780715403
             },
@@ -170,7 +381,7 @@ class QQMusic:
                 "module":"music.srfDissInfo.aiDissInfo",
                 "method":"uniform_get_Dissinfo",
                 "param":{
-                    "disstid":int(id),
+                    "disstid":int(disstid),
                     "userinfo":1,
                     "tag":1,
                     "orderlist":1,
@@ -182,33 +393,20 @@ class QQMusic:
             }
         })
 
-        with open("./loader.js", 'r', encoding="utf-8") as f:
-            js_code = f.read()
-
-        time_str = round(time.time() * 1000)
-        sign = execjs.compile(js_code).call("get_sign",data)
+    async def get_toplist_playlist(self, topid, cookie):
+        response = await self._request('POST', **await self._signed_post(self._toplist_body(topid, cookie), cookie))
+        # print(response.json)
+        return json_codec.loads(response.content)['req_1']
 
-        url = 'https://u6.y.qq.com/cgi-bin/musics.fcg'
-        params = {
-            '_': time_str,
-            'sign': sign,
-        }
+    async def iter_toplist_songs(self, topid, cookie):
+        """
+        流式读取排行榜歌曲：边接收响应边解码 songInfoList，逐首产出 (mid, name, singer, album, interval)
+        """
+        async for song in self._stream_songs(self._toplist_body(topid, cookie), cookie, 'songInfoList'):
+            yield song
 
-        response = await self._request(
-            'POST',
-            url,
-            headers=self.headers,
-            data=data.encode(),
-            cookies=ck,
-            params=params,
-        )
-        # print(response.json)
-        return response.json()['req_2']
-    
-    async def get_toplist_playlist(self, topid, cookie):
-        id = topid
-        ck = cookie
-        data = json.dumps({
+    def _toplist_body(self, topid, cookie):
+        return json_codec.dumps({
             "comm": {
                 "cv": 4747474,
                 "ct": 24,
@@ -218,7 +416,7 @@ class QQMusic:
                 "notice": 0,
                 "platform": "yqq.json",
                 "needNewCode": 1,
-                "uin": ck['uin'],
+                "uin": cookie['uin'],
                 "g_tk_new_20200303": 673978184,
                 "g_tk": 673978184
             },
@@ -226,43 +424,64 @@ class QQMusic:
                 "module": "musicToplist.ToplistInfoServer",
                 "method": "GetDetail",
                 "param": {
-                    "topid": int(id),
+                    "topid": int(topid),
                     "offset": 0,
                     "num": 100,
                     "period": ""
                 }
             }
         })
-        with open("./loader.js", 'r', encoding="utf-8") as f:
-            js_code = f.read()
-
-        time_str = round(time.time() * 1000)
-        sign = execjs.compile(js_code).call("get_sign",data)
-        print(sign)
 
-        url = 'https://u6.y.qq.com/cgi-bin/musics.fcg'
-        params = {
-            '_': time_str,
-            'sign': sign,
+    async def _signed_post(self, data, cookie):
+        """
+        musics.fcg 签名请求的参数
+        """
+        deadline.check('sign', 'musics')
+        sign = await qqmusic_sign.get_signer().sign(data)
+        return {
+            'url': 'https://u6.y.qq.com/cgi-bin/musics.fcg',
+            'headers': self.headers,
+            'data': data.encode(),
+            'cookies': cookie,
+            'params': {'_': round(time.time() * 1000), 'sign': sign},
+            'endpoint': 'musics',
         }
-        print(sign)
 
-        response = await self._request(
-            'POST',
-            url,
-            headers=self.headers,
-            data=data.encode(),
-            cookies=ck,
-            params=params,
-        )
-        # print(response.json)
-        return response.json()['req_1']
+    async def _stream_songs(self, data, cookie, key):
+        """
+        发送 musics.fcg 请求并流式产出 key 数组中的歌曲；HTTP 错误照常抛出，
+        响应中没有该数组（限流、登录失效等）时抛出带返回码的 MusicuError，不当作空歌单
+        """
+        import http_transport
+
+        async with http_transport.get_transport().stream('POST', **await self._signed_post(data, cookie)) as response:
+            response.raise_for_status()
+            head = bytearray()
+
+            async def chunks():
+                async for chunk in response.aiter_bytes():
+                    if len(head) < _STREAM_HEAD:
+                        head.extend(chunk[:_STREAM_HEAD - len(head)])
+                    yield chunk
+
+            try:
+                async for track in json_stream.iter_array(chunks(), key, required=True):
+                    yield json_stream.project_song(track)
+            except KeyError:
+                if rate_limit.throttled_body(head):
+                    code = rate_limit.THROTTLED
+                else:
+                    # 顶层 code 为 0 时取子请求（req_N）中第一个非 0 的返回码，如 1000 登录失效
+                    codes = [int(code) for code in _CODE.findall(head)]
+                    code = next((code for code in codes if code), codes[0] if codes else None)
+                # 从 stream() 中抛出：code 为 500001 时由其上报限流
+                raise qqmusic_batch.MusicuError(code, f'musics.fcg answered without {key!r} (code {code})') from None
     
     async def get_comment(self, bizid, cookie, size):
         id = bizid
         ck = cookie
         pagesize = size
-        data = json.dumps({
+        data = json_codec.dumps({
             "comm": {
                 "cv": 4747474,
                 "ct": 24,
@@ -320,19 +539,15 @@ class QQMusic:
                 }
             }
         })
-        with open("./loader.js", 'r', encoding="utf-8") as f:
-            js_code = f.read()
-
         time_str = round(time.time() * 1000)
-        sign = execjs.compile(js_code).call("get_sign",data)
-        print(sign)
+        deadline.check('sign', 'musics')
+        sign = await qqmusic_sign.get_signer().sign(data)
 
         url = 'https://u6.y.qq.com/cgi-bin/musics.fcg'
         params = {
             '_': time_str,
             'sign': sign,
         }
-        print(sign)
 
         response = await self._request(
             'POST',
@@ -341,9 +556,10 @@ class QQMusic:
             data=data.encode(),
             cookies=ck,
             params=params,
+            endpoint='musics',
         )
         # print(response.json)
-        return response.json()['req_3']
+        return json_codec.loads(response.content)['req_3']
     
     async def get_user_songlist(self, id):
         headers = {
@@ -381,8 +597,9 @@ class QQMusic:
             url,
             headers=headers,
             params=params,
+            endpoint='user',
         )
-        result = response.json()
+        result = json_codec.loads(response.content)
         
         if result.get('code') == 4000:
             return {
@@ -447,8 +664,9 @@ class QQMusic:
             headers=self.headers,
             params=params,
             cookies=ck,
+            endpoint='user',
         )
-        result = response.json()
+        result = json_codec.loads(response.content)
         
         if not result.get('data'):
             return {
@@ -467,20 +685,98 @@ class QQMusic:
             }
         }
         
-async def get_song_qualities(songmid):
-    """获取歌曲所有可用音质信息的辅助函数"""
-    qqmusic = QQMusic()
-    qqmusic.set_cookies(cookie_str)
-    
-    file_types = ['flac', '320', '128', 'm4a']
-    results = {}
-    
-    for file_type in file_types:
-        if result := await qqmusic.get_music_url(songmid, file_type):
-            results[file_type] = result
-    
-    return {
+QUALITY_ORDER = ['flac', '320', '128', 'm4a']
+
+_quality_cache = OrderedDict()
+
+
+async def get_song_qualities(songmid, refresh=False):
+    """获取歌曲所有可用音质信息的辅助函数
+
+    所有音质在一次 CgiGetVkey 请求中查询；结果按 (账号 uin, 歌曲) 缓存 ``QQM_QUALITY_CACHE_TTL`` 秒
+    （默认 600，远小于 vkey 有效期），``refresh=True`` 跳过缓存。可用音质取决于账号的 VIP 状态，
+    因此不同账号的结果分开缓存。
+    """
+    ttl = float(os.getenv('QQM_QUALITY_CACHE_TTL', '600'))
+    with registry.lease(songmid) as account:
+        key = (account.uin, songmid)
+        cached = _quality_cache.get(key)
+        if cached is not None and not refresh and time.monotonic() - cached[0] < ttl:
+            _quality_cache.move_to_end(key)
+            return cached[1]
+
+        qqmusic = build_service_client()
+        entries = await qqmusic.get_music_urls([(songmid, file_type) for file_type in QUALITY_ORDER])
+    results = {
+        entry['file_type']: {'url': entry['url'], 'bitrate': entry['bitrate']}
+        for entry in entries
+        if entry['status'] == 'ok'
+    }
+    qualities = {
         'available_qualities': list(results.keys()),
         'urls': results,
-        'highest_quality': next((ft for ft in file_types if ft in results), None)
+        'highest_quality': next((ft for ft in QUALITY_ORDER if ft in results), None)
     }
+
+    # 全部 unavailable 多半是请求失败，不缓存
+    if any(entry['status'] != 'unavailable' for entry in entries):
+        _quality_cache[key] = (time.monotonic(), qualities)
+        _quality_cache.move_to_end(key)
+        while len(_quality_cache) > int(os.getenv('QQM_QUALITY_CACHE_SIZE', '1024')):
+            _quality_cache.popitem(last=False)
+    return qualities
+
+
+async def get_track_infos(songids, chunk_size=None, concurrency=None):
+    """批量获取歌曲信息（CgiGetTrackInfo）
+
+    参数:
+    songids: list - 数字歌曲 ID 列表，可以重复
+    chunk_size: int - 每个请求包含的 ID 数（默认 QQM_TRACK_CHUNK 或 50）
+    concurrency: int - 同时进行的请求数（默认 QQM_TRACK_CONCURRENCY 或 4）
+
+    返回:
+    list - 与输入顺序一致，每项包含 songid、status（'ok' / 'unavailable'）和 track
+
+    结果按 ID 写入 metadata_store 的 'track' 缓存，与 ``QQ_Music.get_music_info`` 共用，
+    之后的单曲查询不再访问上游。
+    """
+    chunk_size = chunk_size or int(os.getenv('QQM_TRACK_CHUNK', '50'))
+    semaphore = asyncio.Semaphore(concurrency or int(os.getenv('QQM_TRACK_CONCURRENCY', '4')))
+
+    requested = [int(songid) for songid in songids]
+    store = metadata_store.get_metadata_store()
+    tracks = {}
+    for songid in dict.fromkeys(requested):
+        cached = store.get('track', str(songid))
+        if cached:
+            tracks[songid] = cached[0]
+    missing = [songid for songid in dict.fromkeys(requested) if songid not in tracks]
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    qqm = build_main_client()
+    import httpx
+
+    async def resolve(chunk):
+        async with semaphore:
+            try:
+                # 每块已按上游单次请求的大小切好，不再交给 musicu 合并窗口拼成一个大请求
+                found = await qqm.get_music_infos(chunk, alone=True)
+            except (httpx.HTTPError, qqmusic_batch.MusicuError, KeyError) as exc:
+                logger.warning("CgiGetTrackInfo chunk of %d ids failed: %s", len(chunk), exc)
+                return
+        if found == 'Error':
+            logger.warning("CgiGetTrackInfo chunk of %d ids was throttled", len(chunk))
+            return
+        wanted = set(chunk)
+        for track in found:
+            # 上游不保证返回顺序，也可能缺项，按 id 对应而不是按位置
+            if isinstance(track, dict) and track.get('id') in wanted:
+                tracks[track['id']] = track
+                store.put('track', str(track['id']), [track])
+
+    await asyncio.gather(*(resolve(chunk) for chunk in chunks))
+
+    return [
+        {'songid': songid, 'status': 'ok' if songid in tracks else 'unavailable', 'track': tracks.get(songid)}
+        for songid in requested
+    ]
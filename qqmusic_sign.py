@@ -0,0 +1,285 @@
+"""
+Request signing for QQ Music ``musics.fcg`` calls.
+
+``sign``/``legacy_sign`` are pure-Python ports of ``loader(350).default`` in
+``loader.js`` (the ``zzc`` sign) and ``o`` in ``main.js`` (the older ``zzb`` sign).
+They are what :func:`get_signer` hands out by default.
+
+The original webpack bundles stay available as a fallback: :class:`JsSignEngine`
+evaluates them once inside a long-lived Node worker (``sign_worker.js``),
+answers calls over stdio without blocking the event loop, and keeps recent
+payload -> sign results in a small LRU. Set ``QQM_SIGN_BACKEND=js`` to use it
+for every call.
+"""
+
+import asyncio
+import base64
+import hashlib
+import itertools
+import logging
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import json_codec
+
+__all__ = [
+    "JsSignEngine",
+    "NativeSigner",
+    "SignEngineError",
+    "get_sign_engine",
+    "get_signer",
+    "legacy_sign",
+    "sign",
+    "LOADER_SCRIPT",
+    "MAIN_SCRIPT",
+]
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+WORKER_PATH = BASE_DIR / "sign_worker.js"
+LOADER_SCRIPT = "loader.js"  # exposes get_sign (musics.fcg "zzc" sign)
+MAIN_SCRIPT = "main.js"  # exposes o (legacy "zzb" sign)
+DEFAULT_CACHE_SIZE = 256
+
+# loader.js: SHA1 digest positions for the head/tail and the XOR key for the body.
+_ZZC_HEAD = (23, 14, 6, 36, 16, 40, 7, 19)
+_ZZC_TAIL = (16, 1, 32, 12, 19, 27, 8, 5)
+_ZZC_KEY = (89, 39, 179, 150, 218, 82, 58, 252, 177, 52, 186, 123, 120, 64, 242, 133, 143, 161, 121, 179)
+# main.js: the same layout over an MD5 digest.
+_ZZB_HEAD = (21, 4, 9, 26, 16, 20, 27, 30)
+_ZZB_TAIL = (18, 11, 3, 2, 1, 7, 6, 25)
+_ZZB_KEY = (212, 45, 80, 68, 195, 163, 163, 203, 157, 220, 254, 91, 204, 79, 104, 6)
+_B64_STRIP = re.compile(r"[\\/+=]")
+
+
+class SignEngineError(RuntimeError):
+    """Raised when the Node signing worker cannot start or a call fails."""
+
+
+def _scramble(prefix: str, digest: str, head, tail, key) -> str:
+    # Positions past the end of the digest are skipped, as in the JS VM.
+    head_part = "".join(digest[i] for i in head if i < len(digest))
+    tail_part = "".join(digest[i] for i in tail if i < len(digest))
+    body = bytes(int(digest[i * 2:i * 2 + 2], 16) ^ k for i, k in enumerate(key))
+    middle = _B64_STRIP.sub("", base64.b64encode(body).decode("ascii"))
+    return f"{prefix}{head_part}{middle}{tail_part}".lower()
+
+
+def sign(data: Union[str, bytes]) -> str:
+    """Return the ``zzc`` sign of a ``musics.fcg`` body (``loader.js`` ``get_sign``)."""
+    raw = data.encode("utf-8") if isinstance(data, str) else data
+    digest = hashlib.sha1(raw).hexdigest().upper()
+    return _scramble("zzc", digest, _ZZC_HEAD, _ZZC_TAIL, _ZZC_KEY)
+
+
+def legacy_sign(data: Union[str, bytes]) -> str:
+    """Return the ``zzb`` sign computed by ``main.js``'s ``o``."""
+    raw = data.encode("utf-8") if isinstance(data, str) else data
+    digest = hashlib.md5(raw).hexdigest().upper()
+    return _scramble("zzb", digest, _ZZB_HEAD, _ZZB_TAIL, _ZZB_KEY)
+
+
+class _NodeWorker:
+    """A single Node process with one signing script preloaded."""
+
+    def __init__(self, script: str):
+        self.script = script
+        self.startup_seconds: Optional[float] = None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._starting: Optional[asyncio.Task] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    def _alive(self, loop: asyncio.AbstractEventLoop) -> bool:
+        return self._process is not None and self._loop is loop and self._process.returncode is None
+
+    async def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._alive(loop):
+            return
+        if self._starting is None or self._loop is not loop:
+            self._loop = loop
+            self._process = None
+            self._starting = loop.create_task(self._spawn())
+        try:
+            await asyncio.shield(self._starting)
+        except BaseException:
+            if self._starting is not None and self._starting.done():
+                self._starting = None
+            raise
+
+    async def _spawn(self) -> None:
+        node = shutil.which("node") or shutil.which("nodejs")
+        if not node:
+            raise SignEngineError("Node.js runtime not found on PATH")
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            node,
+            str(WORKER_PATH),
+            self.script,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=str(BASE_DIR),
+        )
+        ready = await process.stdout.readline()
+        if not ready:
+            await process.wait()
+            raise SignEngineError(f"sign worker for {self.script} exited during startup")
+        self.startup_seconds = time.perf_counter() - started
+        logger.info("sign worker for %s ready in %.3fs", self.script, self.startup_seconds)
+        self._process = process
+        self._reader = asyncio.get_running_loop().create_task(self._read_replies(process))
+
+    async def _read_replies(self, process: asyncio.subprocess.Process) -> None:
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                reply = json_codec.loads(line)
+                future = self._pending.pop(reply.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in reply:
+                    future.set_exception(SignEngineError(reply["error"]))
+                else:
+                    future.set_result(reply.get("result"))
+        finally:
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(SignEngineError(f"sign worker for {self.script} exited"))
+
+    async def call(self, function: str, *args: Any) -> Any:
+        await self._ensure_started()
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        message = json_codec.dumps({"id": call_id, "fn": function, "args": list(args)}, ensure_ascii=False, separators=(",", ":"))
+        self._process.stdin.write(message.encode("utf-8") + b"\n")
+        await self._process.stdin.drain()
+        return await future
+
+    async def close(self) -> None:
+        process, self._process = self._process, None
+        self._starting = None
+        if process is None or process.returncode is not None:
+            return
+        process.stdin.close()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        if self._reader is not None:
+            await self._reader
+
+
+class JsSignEngine:
+    """Warm JavaScript signer shared by every client in the process."""
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._workers: Dict[str, _NodeWorker] = {}
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _worker(self, script: str) -> _NodeWorker:
+        worker = self._workers.get(script)
+        if worker is None:
+            worker = self._workers[script] = _NodeWorker(script)
+        return worker
+
+    async def call(self, script: str, function: str, *args: Any) -> Any:
+        """Call ``function`` defined by ``script`` with JSON-serialisable ``args``."""
+        key = json_codec.dumps([script, function, args], ensure_ascii=False, separators=(",", ":"))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        self.misses += 1
+        result = await self._worker(script).call(function, *args)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def sign(self, data: Any) -> str:
+        """Sign a ``musics.fcg`` body with ``loader.js``'s ``get_sign``."""
+        return await self.call(LOADER_SCRIPT, "get_sign", data)
+
+    async def legacy_sign(self, data: Any) -> str:
+        """Sign with ``main.js``'s ``o`` (the ``zzb`` variant used by ``QQ_Music``)."""
+        return await self.call(MAIN_SCRIPT, "o", data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache_size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "workers": {name: worker.startup_seconds for name, worker in self._workers.items()},
+        }
+
+    async def close(self) -> None:
+        for worker in self._workers.values():
+            await worker.close()
+
+
+class NativeSigner:
+    """Pure-Python signer with the same async surface as :class:`JsSignEngine`.
+
+    Non-string payloads are handed to the JS engine, since the bundles coerce
+    them with JavaScript semantics that are not worth reimplementing.
+    """
+
+    def __init__(self):
+        self.native_calls = 0
+        self.fallback_calls = 0
+
+    async def sign(self, data: Any) -> str:
+        if isinstance(data, str):
+            self.native_calls += 1
+            return sign(data)
+        self.fallback_calls += 1
+        return await get_sign_engine().sign(data)
+
+    async def legacy_sign(self, data: Any) -> str:
+        if isinstance(data, str):
+            self.native_calls += 1
+            return legacy_sign(data)
+        self.fallback_calls += 1
+        return await get_sign_engine().legacy_sign(data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"native_calls": self.native_calls, "fallback_calls": self.fallback_calls}
+
+
+_ENGINE: Optional[JsSignEngine] = None
+_SIGNER: Optional[Union[NativeSigner, JsSignEngine]] = None
+
+
+def get_sign_engine() -> JsSignEngine:
+    """Return the process-wide :class:`JsSignEngine`."""
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = JsSignEngine()
+    return _ENGINE
+
+
+def get_signer() -> Union[NativeSigner, JsSignEngine]:
+    """Return the process-wide signer selected by ``QQM_SIGN_BACKEND`` (``native`` or ``js``)."""
+    global _SIGNER
+    if _SIGNER is None:
+        backend = os.getenv("QQM_SIGN_BACKEND", "native").strip().lower()
+        _SIGNER = get_sign_engine() if backend == "js" else NativeSigner()
+    return _SIGNER
@@ -0,0 +1,228 @@
+"""
+Adaptive per-host rate limiting for QQ Music upstreams.
+
+Every ``*.qq.com`` host the transport talks to (u.y.qq.com, u6.y.qq.com,
+shc.y.qq.com, c.y.qq.com, i.y.qq.com, y.qq.com) gets its own token bucket, one
+per account when requests carry a logged-in cookie (see ``cookie_pool``). The
+refill rate follows AIMD: each successful response raises it a little, while a
+throttling signal (HTTP 429, or a 200 whose body carries ``musicu.fcg`` code
+500001, see :func:`throttled_body`) halves it, at most
+once per cool-down, so the rate settles just below what the host tolerates.
+
+Requests that have to wait are released in priority order: interactive tool
+calls first, then bulk crawls (playlist pages), then background work (URL
+prefetch and cache refreshes), with aging so lower levels are never starved.
+The priority is taken from the calling task's context, set with :func:`priority`.
+
+Configuration (environment):
+
+- ``QQM_RATE_LIMIT``: starting requests per second per host (default 20; ``0`` disables)
+- ``QQM_RATE_LIMIT_MIN`` / ``QQM_RATE_LIMIT_MAX``: bounds for the adapted rate (default 1 / 50)
+- ``QQM_RATE_LIMIT_BURST``: bucket size, requests that may go out back to back (default 10)
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import LatencyWindow
+
+__all__ = ["INTERACTIVE", "BULK", "BACKGROUND", "THROTTLED", "RateLimiter", "get_limiter", "priority", "throttled_body"]
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+THROTTLED = 500001
+# musicu.fcg answers throttled calls with HTTP 200 and code 500001, at the top level
+# or in any of a batch's sub-responses.
+_THROTTLED_BODY = re.compile(rb'"code"\s*:\s*500001(?!\d)')
+
+
+def throttled_body(content: bytes) -> bool:
+    """Whether an HTTP 200 body carries the ``musicu.fcg`` throttling code."""
+    return _THROTTLED_BODY.search(content) is not None
+
+# A queued request is overtaken by newer, more urgent ones for at most this many
+# seconds per priority level, so background work is delayed but never starved.
+AGING = 2.0
+
+_PRIORITY = contextvars.ContextVar("qqm_request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Send the requests made inside this block (and tasks it starts) at ``level``."""
+    token = _PRIORITY.set(level)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def current_priority() -> int:
+    return _PRIORITY.get()
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+class _Bucket:
+    """Token bucket for one host, with a priority queue of waiting requests."""
+
+    def __init__(self, limiter: "RateLimiter"):
+        self.limiter = limiter
+        self.rate = limiter.rate
+        self.tokens = float(limiter.burst)
+        self.updated = time.monotonic()
+        self.decreased_at = 0.0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.requests = 0
+        self.delayed = 0
+        self.throttled = 0
+        self.wait = {level: LatencyWindow(256) for level in _PRIORITY_NAMES}
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.limiter.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, level: int) -> None:
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Waiters and the pump belong to the loop that created them.
+            self._loop, self._waiters, self._pump = loop, [], None
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            self.wait[level].add(0.0)
+            return
+        self.delayed += 1
+        started = time.perf_counter()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (time.monotonic() + level * AGING, next(self._order), future))
+        if self._pump is None or self._pump.done():
+            self._pump = loop.create_task(self._release())
+        await future
+        self.wait[level].add(time.perf_counter() - started)
+
+    async def _release(self) -> None:
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)  # Cancelled while waiting.
+                continue
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                heapq.heappop(self._waiters)[2].set_result(None)
+                continue
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def success(self) -> None:
+        # Additive increase: about +1 request/s for every second's worth of successes.
+        self.rate = min(self.limiter.max_rate, self.rate + 1.0 / self.rate)
+
+    def throttle(self) -> None:
+        self.throttled += 1
+        now = time.monotonic()
+        # Responses already in flight report the same congestion; back off once per cool-down.
+        if now - self.decreased_at < self.limiter.cooldown:
+            return
+        self.decreased_at = now
+        self.rate = max(self.limiter.min_rate, self.rate * 0.5)
+        self.tokens = min(self.tokens, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 2),
+            "tokens": round(self.tokens, 2),
+            "queued": sum(1 for _, _, future in self._waiters if not future.done()),
+            "requests": self.requests,
+            "delayed": self.delayed,
+            "throttled": self.throttled,
+            "wait_ms": {name: self.wait[level].snapshot() for level, name in _PRIORITY_NAMES.items()},
+        }
+
+
+class RateLimiter:
+    """Per-host AIMD token buckets for the QQ Music hosts."""
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        cooldown: float = 1.0,
+        domains: Tuple[str, ...] = ("qq.com",),
+    ):
+        self.rate = rate if rate is not None else float(os.getenv("QQM_RATE_LIMIT", "20"))
+        self.min_rate = min_rate or float(os.getenv("QQM_RATE_LIMIT_MIN", "1"))
+        self.max_rate = max_rate or float(os.getenv("QQM_RATE_LIMIT_MAX", "50"))
+        self.burst = burst or int(os.getenv("QQM_RATE_LIMIT_BURST", "10"))
+        self.cooldown = cooldown
+        self.domains = domains
+        self._buckets: Dict[str, _Bucket] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _bucket(self, url: str, account: Optional[str] = None) -> Optional[_Bucket]:
+        host = _host(url)
+        if not self.enabled or not any(host == domain or host.endswith("." + domain) for domain in self.domains):
+            return None
+        key = f"{host} ({account})" if account else host
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self)
+        return bucket
+
+    async def acquire(self, url: str, account: Optional[str] = None) -> None:
+        """Wait for a token for ``url``'s host (and ``account``), behind queued requests of higher priority."""
+        bucket = self._bucket(url, account)
+        if bucket is not None:
+            await bucket.acquire(current_priority())
+
+    def success(self, url: str, account: Optional[str] = None) -> None:
+        bucket = self._bucket(url, account)
+        if bucket is not None:
+            bucket.success()
+
+    def throttled(self, url: str, account: Optional[str] = None) -> None:
+        """Report a throttling answer (HTTP 429, code 500001) from ``url``'s host to ``account``."""
+        bucket = self._bucket(url, account)
+        if bucket is not None:
+            bucket.throttle()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "min_rate": self.min_rate,
+            "max_rate": self.max_rate,
+            "burst": self.burst,
+            "hosts": {host: bucket.stats() for host, bucket in self._buckets.items()},
+        }
+
+
+_LIMITER: Optional[RateLimiter] = None
+
+
+def get_limiter() -> RateLimiter:
+    """Return the process-wide :class:`RateLimiter`."""
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = RateLimiter()
+    return _LIMITER
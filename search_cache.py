@@ -0,0 +1,187 @@
+"""
+Search result cache with query normalisation and stale-while-revalidate.
+
+Queries are keyed by their normalised form (NFKC, case-folded, punctuation
+dropped, whitespace collapsed), so "晴天，" and "晴天 " share an entry. A cached
+page also answers any smaller window it fully contains: page 1 of ``limit=20``
+serves page 1 (or 2, 3, 4) of ``limit=5``. Entries are fresh for ``ttl``
+seconds; after that they are still returned immediately for up to ``stale``
+more seconds while a background fetch replaces them.
+
+Configuration (environment):
+
+- ``QQM_SEARCH_CACHE_TTL``: seconds an entry is fresh (default 300, ``0`` disables)
+- ``QQM_SEARCH_CACHE_STALE``: extra seconds a stale entry may be served (default 3600)
+- ``QQM_SEARCH_CACHE_SIZE``: maximum number of cached pages (default 512)
+"""
+
+import asyncio
+import logging
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import deadline
+import rate_limit
+from metrics import ratio
+
+__all__ = ["SearchCache", "get_search_cache", "normalize_query"]
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, int, int]
+Fetch = Callable[[str, int, int], Awaitable[List[Any]]]
+
+
+_PUNCTUATION: Optional[Dict[int, str]] = None
+
+
+def normalize_query(query: str) -> str:
+    """Fold width, case, punctuation and whitespace differences out of ``query``."""
+    global _PUNCTUATION
+    if _PUNCTUATION is None:
+        # Translation table for BMP punctuation, built once (~25 ms) on first use.
+        _PUNCTUATION = {code: " " for code in range(0x10000) if unicodedata.category(chr(code)).startswith("P")}
+    text = unicodedata.normalize("NFKC", query).casefold().translate(_PUNCTUATION)
+    if text and max(text) > "\uffff":
+        text = "".join(" " if unicodedata.category(char).startswith("P") else char for char in text)
+    return " ".join(text.split()) or query.strip()
+
+
+class _Entry:
+    __slots__ = ("songs", "fetched_at")
+
+    def __init__(self, songs: List[Any], fetched_at: float):
+        self.songs = songs
+        self.fetched_at = fetched_at
+
+
+class SearchCache:
+    """LRU of search result pages keyed by ``(normalised query, page, limit)``."""
+
+    def __init__(self, ttl: Optional[float] = None, stale: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("QQM_SEARCH_CACHE_TTL", "300"))
+        self.stale = stale if stale is not None else float(os.getenv("QQM_SEARCH_CACHE_STALE", "3600"))
+        self.max_entries = max_entries or int(os.getenv("QQM_SEARCH_CACHE_SIZE", "512"))
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._windows: Dict[str, set] = {}
+        self._refreshing = set()
+        self._tasks = set()
+        self.hits = 0
+        self.window_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get_or_fetch(self, query: str, page: int, limit: int, fetch: Fetch) -> List[Any]:
+        """Return page ``page`` of ``limit`` results for ``query``, calling ``fetch`` only on a miss."""
+        if self.ttl <= 0:
+            return await fetch(query, page, limit)
+        normalized = normalize_query(query)
+        found = self._lookup(normalized, page, limit)
+        if found is None:
+            self.misses += 1
+            songs = await fetch(query, page, limit)
+            self._store((normalized, page, limit), songs)
+            return list(songs)
+
+        key, entry = found
+        age = time.monotonic() - entry.fetched_at
+        if age >= self.ttl:
+            self.stale_hits += 1
+            self._refresh(key, query, fetch)
+        elif key == (normalized, page, limit):
+            self.hits += 1
+        else:
+            self.window_hits += 1
+        start = (page - 1) * limit - (key[1] - 1) * key[2]
+        return entry.songs[start:start + limit]
+
+    def _lookup(self, normalized: str, page: int, limit: int) -> Optional[Tuple[Key, _Entry]]:
+        first, last = (page - 1) * limit, page * limit
+        now = time.monotonic()
+        candidates = []
+        for cached_page, cached_limit in sorted(self._windows.get(normalized, ()), key=lambda window: window[1]):
+            if not ((cached_page - 1) * cached_limit <= first and last <= cached_page * cached_limit):
+                continue
+            key = (normalized, cached_page, cached_limit)
+            entry = self._entries[key]
+            age = now - entry.fetched_at
+            if age >= self.ttl + self.stale:
+                self._drop(key)
+                continue
+            candidates.append((age >= self.ttl, key, entry))
+        if not candidates:
+            return None
+        # Fresh before stale, then the smallest covering page.
+        _, key, entry = min(candidates, key=lambda candidate: candidate[0])
+        self._entries.move_to_end(key)
+        return key, entry
+
+    def _store(self, key: Key, songs: List[Any]) -> None:
+        self._entries[key] = _Entry(list(songs), time.monotonic())
+        self._entries.move_to_end(key)
+        self._windows.setdefault(key[0], set()).add(key[1:])
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: Key) -> None:
+        self._entries.pop(key, None)
+        windows = self._windows.get(key[0])
+        if windows is not None:
+            windows.discard(key[1:])
+            if not windows:
+                del self._windows[key[0]]
+
+    def _refresh(self, key: Key, query: str, fetch: Fetch) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def run():
+            try:
+                with rate_limit.priority(rate_limit.BACKGROUND), deadline.detached():
+                    value = await fetch(query, key[1], key[2])
+                self._store(key, value)
+                self.refreshes += 1
+            except Exception as exc:
+                self.refresh_errors += 1
+                logger.warning("background refresh of search %r failed: %s", key[0], exc)
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._windows.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.hits + self.window_hits + self.stale_hits
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "window_hits": self.window_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": ratio(served, served + self.misses),
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+_SEARCH_CACHE: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """Return the process-wide :class:`SearchCache`."""
+    global _SEARCH_CACHE
+    if _SEARCH_CACHE is None:
+        _SEARCH_CACHE = SearchCache()
+    return _SEARCH_CACHE
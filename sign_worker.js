@@ -0,0 +1,35 @@
+// Persistent signing worker used by qqmusic_sign.py.
+//
+// Loads one signing script (loader.js or main.js) once, then answers
+// newline-delimited JSON calls on stdin: {"id": 1, "fn": "get_sign", "args": [...]}
+// with {"id": 1, "result": ...} or {"id": 1, "error": "..."} on stdout.
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const vm = require('vm');
+
+const script = path.resolve(__dirname, process.argv[2]);
+const write = process.stdout.write.bind(process.stdout);
+
+// The bundles log sample results; keep stdout reserved for the protocol.
+console.log = (...args) => process.stderr.write(args.join(' ') + '\n');
+
+global.require = require;
+vm.runInThisContext(fs.readFileSync(script, 'utf8'), { filename: script });
+write(JSON.stringify({ ready: true }) + '\n');
+
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+    let msg;
+    try {
+        msg = JSON.parse(line);
+    } catch (e) {
+        return;
+    }
+    let reply;
+    try {
+        reply = { id: msg.id, result: global[msg.fn].apply(null, msg.args || []) };
+    } catch (e) {
+        reply = { id: msg.id, error: String(e) };
+    }
+    write(JSON.stringify(reply) + '\n');
+});
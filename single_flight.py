@@ -0,0 +1,131 @@
+"""
+Single-flight de-duplication of identical in-flight upstream calls.
+
+Methods decorated with :func:`shared` are keyed by a canonical form of their
+arguments (e.g. the normalised search query, or songmid + quality + account).
+While a call with that key is running, later identical calls await the same
+result instead of going upstream again. The shared call runs in its own task,
+detached from any one caller's deadline: a waiter that is cancelled or times out
+simply stops waiting, and the call is only cancelled once nobody waits for it.
+
+This de-duplicates within one server process; servers started side by side by
+``mcp_pipe.py`` only share what lands in the on-disk metadata store.
+
+Configuration (environment):
+
+- ``QQM_SINGLE_FLIGHT``: ``0`` to send every call upstream (default on)
+"""
+
+import asyncio
+import functools
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import deadline
+from metrics import ratio
+
+__all__ = ["SingleFlight", "get_single_flight", "shared"]
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _KindStats:
+    __slots__ = ("calls", "shared")
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+
+
+class SingleFlight:
+    """Shares one in-flight call among concurrent callers with the same key."""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = enabled if enabled is not None else os.getenv("QQM_SINGLE_FLIGHT", "1") != "0"
+        self._flights: Dict[Tuple[str, Hashable], _Flight] = {}
+        self._kinds: Dict[str, _KindStats] = {}
+        self.abandoned = 0
+
+    async def do(self, kind: str, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Return ``await call()``, joining an identical call that is already running."""
+        stats = self._kinds.get(kind)
+        if stats is None:
+            stats = self._kinds[kind] = _KindStats()
+        stats.calls += 1
+        if not self.enabled:
+            return await call()
+
+        loop = asyncio.get_running_loop()
+        full_key = (kind, key)
+        flight = self._flights.get(full_key)
+        if flight is None or flight.task.get_loop() is not loop:
+            with deadline.detached():
+                task = loop.create_task(call())
+            flight = self._flights[full_key] = _Flight(task)
+            task.add_done_callback(functools.partial(self._finished, full_key, flight))
+        else:
+            stats.shared += 1
+
+        flight.waiters += 1
+        deadline.enter("single-flight")
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # The last waiter gave up; nobody else can use the answer.
+                self.abandoned += 1
+                self._finished(full_key, flight)
+                flight.task.cancel()
+
+    def _finished(self, full_key: Tuple[str, Hashable], flight: _Flight, task: Any = None) -> None:
+        if self._flights.get(full_key) is flight:
+            del self._flights[full_key]
+
+    def stats(self) -> Dict[str, Any]:
+        calls = sum(stats.calls for stats in self._kinds.values())
+        shared = sum(stats.shared for stats in self._kinds.values())
+        return {
+            "enabled": self.enabled,
+            "calls": calls,
+            "shared": shared,
+            "dedup_ratio": ratio(shared, calls),
+            "in_flight": len(self._flights),
+            "abandoned": self.abandoned,
+            "kinds": {
+                kind: {"calls": stats.calls, "shared": stats.shared, "dedup_ratio": ratio(stats.shared, stats.calls)}
+                for kind, stats in self._kinds.items()
+            },
+        }
+
+
+def shared(kind: str, key: Callable[..., Hashable]):
+    """Decorate an async method so concurrent calls with the same ``key(self, *args, **kwargs)`` share one call."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            return await get_single_flight().do(
+                kind, key(self, *args, **kwargs), lambda: fn(self, *args, **kwargs)
+            )
+
+        return wrapper
+
+    return decorator
+
+
+_SINGLE_FLIGHT: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide :class:`SingleFlight`."""
+    global _SINGLE_FLIGHT
+    if _SINGLE_FLIGHT is None:
+        _SINGLE_FLIGHT = SingleFlight()
+    return _SINGLE_FLIGHT
@@ -0,0 +1,64 @@
+"""MusicuBatcher hands each caller its own sub-response, or a MusicuError for a failed one."""
+
+import asyncio
+
+import pytest
+
+import json_codec
+import qqmusic_batch
+import qqmusic_client
+
+
+class _Response:
+    def __init__(self, body):
+        self.content = json_codec.dumps(body).encode()
+
+
+def _batcher(monkeypatch, answer):
+    batcher = qqmusic_batch.MusicuBatcher(window=0.001)
+
+    async def post(body, batch):
+        return _Response(answer(body))
+
+    monkeypatch.setattr(batcher, "_post", post)
+    monkeypatch.setattr(qqmusic_batch, "_BATCHER", batcher)
+    return batcher
+
+
+async def _calls(batcher, count):
+    return await asyncio.gather(
+        *(batcher.call("music.trackInfo.UniformRuleCtrl", "CgiGetTrackInfo", {"ids": [n]}) for n in range(count)),
+        return_exceptions=True,
+    )
+
+
+def test_sub_responses_go_to_their_callers(monkeypatch):
+    def answer(body):
+        return {"code": 0, **{key: {"code": 0, "data": request["param"]} for key, request in body.items() if key != "comm"}}
+
+    results = asyncio.run(_calls(_batcher(monkeypatch, answer), 3))
+    assert [result["data"] for result in results] == [{"ids": [0]}, {"ids": [1]}, {"ids": [2]}]
+
+
+def test_failed_sub_response_raises_its_code(monkeypatch):
+    def answer(body):
+        return {"code": 0, "req_0": {"code": 0, "data": {}}, "req_1": {"code": 1000}, "req_2": {"code": 500001}}
+
+    results = asyncio.run(_calls(_batcher(monkeypatch, answer), 3))
+    assert results[0] == {"code": 0, "data": {}}
+    assert all(isinstance(result, qqmusic_batch.MusicuError) for result in results[1:])
+    assert [result.code for result in results[1:]] == [1000, 500001]
+
+
+def test_throttled_batch_raises_even_with_sub_responses(monkeypatch):
+    def answer(body):
+        return {"code": 500001, "req_0": {"code": 0, "data": {}}, "req_1": {}}
+
+    results = asyncio.run(_calls(_batcher(monkeypatch, answer), 2))
+    assert all(isinstance(result, qqmusic_batch.MusicuError) and result.code == 500001 for result in results)
+
+
+@pytest.mark.parametrize("body", [{"code": 500001, "req_0": {}}, {"code": 0, "req_0": {"code": 500001}}])
+def test_throttled_track_info_returns_error_marker(monkeypatch, body):
+    _batcher(monkeypatch, lambda request: body)
+    assert asyncio.run(qqmusic_client.QQ_Music().get_music_infos([1])) == "Error"
@@ -0,0 +1,32 @@
+"""json_codec.dumps must write exactly what json.dumps writes."""
+
+import json
+
+import pytest
+
+import json_codec
+
+# Every ASCII and C1 control character, DEL, the JS line separators and a BOM.
+CONTROL = [chr(code) for code in range(0x20)] + [chr(code) for code in range(0x7F, 0xA0)] + ["\u2028", "\u2029", "\ufeff"]
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("separators", [None, json_codec.COMPACT])
+def test_control_characters_match_stdlib(ensure_ascii, separators):
+    for char in CONTROL:
+        for value in ({"k": char}, {char: "v"}, [f"a{char}b"]):
+            expected = json.dumps(value, ensure_ascii=ensure_ascii, separators=separators)
+            assert json_codec.dumps(value, ensure_ascii=ensure_ascii, separators=separators) == expected, repr(char)
+
+
+@pytest.mark.parametrize("value", [1e-5, 0.0001, 1.5e-9, 123.456, 2**64, {1: "int key"}, "中文 🎵", float("1e300")])
+def test_fallback_values_match_stdlib(value):
+    for ensure_ascii in (True, False):
+        expected = json.dumps(value, ensure_ascii=ensure_ascii, separators=json_codec.COMPACT)
+        assert json_codec.dumps(value, ensure_ascii=ensure_ascii, separators=json_codec.COMPACT) == expected
+
+
+def test_loads_accepts_bytes_and_str():
+    assert json_codec.loads(b'{"a":[1,"\\u007f"]}') == json_codec.loads('{"a":[1,"\\u007f"]}') == {"a": [1, "\x7f"]}
+    with pytest.raises(json_codec.JSONDecodeError):
+        json_codec.loads(b"{")
@@ -0,0 +1,44 @@
+"""MetadataStore size budget when several servers share one database file."""
+
+import pytest
+
+from metadata_store import MetadataStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "metadata.sqlite3"
+
+
+def test_budget_holds_across_stores_on_one_file(path):
+    stores = [MetadataStore(path=path, max_bytes=100_000) for _ in range(2)]
+    value = "x" * 1000
+    for index in range(200):
+        stores[index % 2].put("track", str(index), value)
+
+    total = stores[0]._total(stores[0]._connect())
+    assert total <= 100_000
+    assert sum(store.evictions for store in stores) > 0
+    for store in stores:
+        store.close()
+
+
+def test_evicts_least_recently_read_first(path):
+    store = MetadataStore(path=path, max_bytes=10_000)
+    for index in range(9):
+        store.put("track", str(index), "x" * 1000)
+    assert store.get("track", "0") is not None  # Now the most recently read entry
+    store.put("track", "9", "x" * 1000)
+    store.put("track", "10", "x" * 1000)
+
+    assert store.get("track", "0") is not None
+    assert store.get("track", "1") is None
+    assert store.stats()["bytes"] <= 10_000
+    store.close()
+
+
+def test_size_is_read_from_the_index(path):
+    store = MetadataStore(path=path)
+    plan = store._connect().execute("EXPLAIN QUERY PLAN SELECT COALESCE(SUM(size), 0) FROM metadata").fetchall()
+    assert "metadata_lru" in str(plan)
+    store.close()
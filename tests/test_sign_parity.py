@@ -0,0 +1,45 @@
+"""Native musics.fcg signer vs the JS bundles, over the recorded corpus."""
+
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+import qqmusic_sign
+
+CORPUS = json.loads(
+    (Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "sign_corpus.json").read_text(encoding="utf-8")
+)
+IDS = [f"{index}:{entry['payload'][:40]!r}" for index, entry in enumerate(CORPUS)]
+
+requires_node = pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+
+
+@pytest.mark.parametrize("entry", CORPUS, ids=IDS)
+def test_native_matches_recorded_corpus(entry):
+    assert qqmusic_sign.sign(entry["payload"]) == entry["sign"]
+    assert qqmusic_sign.legacy_sign(entry["payload"]) == entry["legacy_sign"]
+
+
+@requires_node
+def test_native_matches_live_js_engine():
+    async def sign_all():
+        native = qqmusic_sign.NativeSigner()
+        engine = qqmusic_sign.JsSignEngine()
+        mismatches = []
+        try:
+            for entry in CORPUS:
+                payload = entry["payload"]
+                for method in ("sign", "legacy_sign"):
+                    expected = await getattr(engine, method)(payload)
+                    actual = await getattr(native, method)(payload)
+                    if actual != expected:
+                        mismatches.append((method, payload[:80], actual, expected))
+        finally:
+            await engine.close()
+        assert native.stats()["fallback_calls"] == 0
+        return mismatches
+
+    assert asyncio.run(sign_all()) == []
@@ -0,0 +1,109 @@
+"""QQMusic.iter_category_playlist_songs / iter_toplist_songs against the whole-body path."""
+
+import asyncio
+
+import httpx
+import pytest
+
+import http_transport
+import json_codec
+import json_stream
+import qqmusic_batch
+import qqmusic_service
+import rate_limit
+
+COOKIE = {"uin": "0"}
+
+
+def _track(number):
+    return {
+        "id": number, "mid": f"{number:014d}", "name": f"歌曲{number}", "title": f"歌曲{number}",
+        "singer": [{"mid": "s1", "name": "歌手甲"}, {"mid": "s2", "name": "歌手乙 \\ \"引号\""}][: 1 + number % 2],
+        "album": {"mid": f"A{number}", "name": f"专辑{number // 3}"},
+        "interval": 180 + number, "file": {"size_128mp3": 4_000_000}, "vs": ["[", "]", "{"],
+    }
+
+
+PLAYLIST = {"code": 0, "req_2": {"code": 0, "data": {
+    "dirinfo": {"title": "songlist 不是这里", "desc": '"songlist": ['},
+    "songlist": [_track(number) for number in range(40)],
+}}}
+TOPLIST = {"code": 0, "req_1": {"code": 0, "data": {"data": {"title": "榜单"}, "songInfoList": [_track(number) for number in range(25)]}}}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Serve ``upstream.body`` (in 7-byte chunks) and record limiter reports."""
+    monkeypatch.setenv("QQM_METADATA_DB", "off")
+    monkeypatch.setattr("metadata_store._STORE", None)
+    monkeypatch.setattr(http_transport, "_TRANSPORT", http_transport.HttpTransport())
+    state = type("Upstream", (), {"body": b"", "status": 200, "reports": []})()
+
+    async def chunks(body):
+        for index in range(0, len(body), 7):
+            yield body[index:index + 7]
+
+    def handler(request):
+        return httpx.Response(state.status, content=chunks(state.body))
+
+    def client(base_url, **kwargs):
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url=base_url)
+
+    monkeypatch.setattr(http_transport._TRANSPORT, "client", client)
+    limiter = rate_limit.get_limiter()
+    monkeypatch.setattr(limiter, "success", lambda url, account=None: state.reports.append("success"))
+    monkeypatch.setattr(limiter, "throttled", lambda url, account=None: state.reports.append("throttled"))
+    return state
+
+
+async def _collect(songs):
+    return [song async for song in songs]
+
+
+def test_streamed_playlist_matches_whole_body(upstream):
+    upstream.body = json_codec.dumps(PLAYLIST, ensure_ascii=False).encode()
+    client = qqmusic_service.QQMusic()
+
+    streamed = asyncio.run(_collect(client.iter_category_playlist_songs(7, COOKIE)))
+    whole = asyncio.run(client.get_category_playlist(7, COOKIE))
+
+    assert streamed == [json_stream.project_song(track) for track in whole["data"]["songlist"]]
+    assert len(streamed) == 40
+
+
+def test_streamed_toplist_matches_whole_body(upstream):
+    upstream.body = json_codec.dumps(TOPLIST, ensure_ascii=False).encode()
+    client = qqmusic_service.QQMusic()
+
+    streamed = asyncio.run(_collect(client.iter_toplist_songs(4, COOKIE)))
+    whole = asyncio.run(client.get_toplist_playlist(4, COOKIE))
+
+    assert streamed == [json_stream.project_song(track) for track in whole["data"]["songInfoList"]]
+
+
+def test_real_empty_playlist_yields_nothing(upstream):
+    upstream.body = b'{"code":0,"req_2":{"code":0,"data":{"songlist":[]}}}'
+    assert asyncio.run(_collect(qqmusic_service.QQMusic().iter_category_playlist_songs(7, COOKIE))) == []
+    assert upstream.reports == ["success"]
+
+
+@pytest.mark.parametrize("body, code", [
+    (b'{"code":500001,"ts":1700000000000}', 500001),
+    (b'{"code":0,"req_2":{"code":500001}}', 500001),
+    (b'{"code":1000,"req_2":{"code":1000,"data":{}}}', 1000),
+    (b'{"code":0,"req_2":{"code":1000,"data":{}}}', 1000),
+    (b'{"code":0,"req_2":{"code":0,"data":{}}}', 0),
+])
+def test_missing_song_list_raises_with_code(upstream, body, code):
+    upstream.body = body
+    with pytest.raises(qqmusic_batch.MusicuError) as raised:
+        asyncio.run(_collect(qqmusic_service.QQMusic().iter_category_playlist_songs(7, COOKIE)))
+    assert raised.value.code == code
+    assert upstream.reports == (["throttled"] if code == 500001 else [])
+
+
+def test_http_error_raises(upstream):
+    upstream.status = 502
+    upstream.body = b"Bad Gateway"
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_collect(qqmusic_service.QQMusic().iter_toplist_songs(4, COOKIE)))
@@ -0,0 +1,206 @@
+"""
+Expiry-aware cache for resolved QQ Music playback URLs.
+
+Entries are keyed by ``(songmid, file_type, account)`` and live for as long as
+the vkey behind them: ``CgiGetVkey`` reports the validity in seconds as
+``data.expiration`` (typically 80400). Entries close to expiry are still served
+while a background refresh fetches a new vkey; the cache is an LRU bounded by an
+estimate of its memory use.
+
+Songs that need a VIP account for a quality (``CgiGetVkey`` answers with an empty
+``purl``) are remembered as well, for a shorter time and in a separate bounded
+LRU, so repeated requests are answered without a round trip. Songs the response
+simply left out (transient failures) are never cached.
+
+Configuration (environment):
+
+- ``QQM_URL_CACHE_MAX_BYTES``: approximate memory bound (default 4000000, ``0`` disables)
+- ``QQM_URL_CACHE_REFRESH_MARGIN``: refresh entries with fewer seconds left than this (default 600)
+- ``QQM_URL_CACHE_VIP_TTL``: seconds a VIP-only answer is remembered (default 900, ``0`` disables)
+- ``QQM_URL_CACHE_VIP_SIZE``: maximum number of remembered VIP-only answers (default 4096)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+import deadline
+import rate_limit
+from metrics import ratio
+
+__all__ = ["UrlCache", "get_url_cache"]
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str]
+
+# Used when a response carries no expiration.
+DEFAULT_TTL = 1800.0
+# Rough per-entry cost of the key tuple, the value dict and the bookkeeping.
+_ENTRY_OVERHEAD = 480
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Dict[str, Any], expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class UrlCache:
+    """LRU of playback URLs that expire with their vkey and refresh ahead of time."""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        refresh_margin: Optional[float] = None,
+        vip_ttl: Optional[float] = None,
+        vip_size: Optional[int] = None,
+    ):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("QQM_URL_CACHE_MAX_BYTES", "4000000"))
+        self.refresh_margin = (
+            refresh_margin if refresh_margin is not None else float(os.getenv("QQM_URL_CACHE_REFRESH_MARGIN", "600"))
+        )
+        self.vip_ttl = vip_ttl if vip_ttl is not None else float(os.getenv("QQM_URL_CACHE_VIP_TTL", "900"))
+        self.vip_size = vip_size or int(os.getenv("QQM_URL_CACHE_VIP_SIZE", "4096"))
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._vip: "OrderedDict[Key, float]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing = set()
+        self._tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.vip_hits = 0
+
+    def get(self, key: Key) -> Optional[Dict[str, Any]]:
+        """Return the cached ``{"url", "bitrate"}`` for ``key`` if its vkey is still valid."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._drop(key)
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def peek(self, key: Key) -> Optional[Dict[str, Any]]:
+        """Like :meth:`get`, without touching the LRU order or the hit counters."""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None and entry.expires_at > time.monotonic() else None
+
+    def put(self, key: Key, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self._vip.pop(key, None)
+        if self.max_bytes <= 0:
+            return
+        size = _ENTRY_OVERHEAD + sum(len(part) for part in key) + len(value.get("url") or "") + len(value.get("bitrate") or "")
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = _Entry(value, time.monotonic() + (ttl or DEFAULT_TTL), size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def put_vip(self, key: Key) -> None:
+        """Remember that ``key``'s quality needs a VIP account."""
+        if key in self._entries:
+            self._drop(key)
+        if self.vip_ttl <= 0:
+            return
+        self._vip[key] = time.monotonic() + self.vip_ttl
+        self._vip.move_to_end(key)
+        while len(self._vip) > self.vip_size:
+            self._vip.popitem(last=False)
+
+    def is_vip(self, key: Key, hit: bool = True) -> bool:
+        """True while a VIP-only answer for ``key`` is remembered; ``hit`` counts it as served."""
+        expires_at = self._vip.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._vip[key]
+            return False
+        if hit:
+            self._vip.move_to_end(key)
+            self.vip_hits += 1
+        return True
+
+    def needs_refresh(self, key: Key) -> bool:
+        """True when ``key`` is cached but within ``refresh_margin`` of expiry and not already refreshing."""
+        entry = self._entries.get(key)
+        return (
+            entry is not None
+            and key not in self._refreshing
+            and entry.expires_at - time.monotonic() < self.refresh_margin
+        )
+
+    def refresh(self, keys: Iterable[Key], loader: Callable[[list], Awaitable[Any]]) -> None:
+        """Run ``loader(keys)`` in the background; it is expected to :meth:`put` the new values."""
+        keys = [key for key in keys if key not in self._refreshing]
+        if not keys:
+            return
+        self._refreshing.update(keys)
+
+        async def run():
+            try:
+                with rate_limit.priority(rate_limit.BACKGROUND), deadline.detached():
+                    await loader(keys)
+                self.refreshes += len(keys)
+            except Exception as exc:
+                self.refresh_errors += 1
+                logger.warning("background refresh of %d playback URLs failed: %s", len(keys), exc)
+            finally:
+                self._refreshing.difference_update(keys)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _drop(self, key: Key) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._vip.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": ratio(self.hits, self.hits + self.misses),
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "vip_entries": len(self._vip),
+            "vip_hits": self.vip_hits,
+            "vip_ttl": self.vip_ttl,
+        }
+
+
+_URL_CACHE: Optional[UrlCache] = None
+
+
+def get_url_cache() -> UrlCache:
+    """Return the process-wide :class:`UrlCache`."""
+    global _URL_CACHE
+    if _URL_CACHE is None:
+        _URL_CACHE = UrlCache()
+    return _URL_CACHE